@@ -53,9 +53,11 @@ if  __name__ =='__main__':
     #from word2Vec import tools as util
     if os.path.isfile(config.inputFile):
         try:
-            wv = wvlib.load(config.inputFile).normalize()
             #references = [(r, eva.read_referenceSingleWords(r)) for r in evafilePath]
             references = [(r, eva.read_reference(r)) for r in evafilePath]
+            # only load vectors for the reference words
+            words = set(w for _, ref in references for ws, _ in ref for w in ws)
+            wv = wvlib.load(config.inputFile, vocabulary=words).normalize()
             print '%20s\trho\tmissed\ttotal\tratio' % 'dataset'
             for name, ref in references:
                 #rho, count = eva.evaluateTest(newWordVecs, ref,wordList)
@@ -67,13 +69,14 @@ if  __name__ =='__main__':
             print "skip",config.inputFile
     else:
             folderList=util.get_filepaths(config.inputFile)
+            references = [(r, eva.read_referenceSingleWords(r)) for r in evafilePath]
+            words = set(w for _, ref in references for ws, _ in ref for w in ws)
             for i,item in enumerate(folderList):
                 filename, file_extension = os.path.splitext(item)
                 #print i,item
                 if  ".DS_Store" not in item:
                     try:
-                        wv = wvlib.load(item).normalize()
-                        references = [(r, eva.read_referenceSingleWords(r)) for r in evafilePath]
+                        wv = wvlib.load(item, vocabulary=words).normalize()
                         print '%20s\trho\tmissed\ttotal\tratio' % 'dataset'
                         for name, ref in references:
                             #rho, count = eva.evaluateTest(newWordVecs, ref,wordList)
@@ -3,9 +3,18 @@
 """Convert between word vector formats."""
 
 import sys
+import os
+import json
+import hashlib
 import logging
+import multiprocessing
 import wvlib
 
+from time import time
+
+# file in batch directory recording conversions (see convert_batch())
+BATCH_RECORD = '.convert.json'
+
 def argparser():
     try:
         import argparse
@@ -13,8 +22,10 @@ def argparser():
         import compat.argparse as argparse
 
     ap=argparse.ArgumentParser()
-    ap.add_argument('input', metavar='INFILE', help='input vector file')
-    ap.add_argument('output', metavar='OUTFILE', help='output vector file')
+    ap.add_argument('input', metavar='INFILE', nargs='?',
+                    help='input vector file')
+    ap.add_argument('output', metavar='OUTFILE', nargs='?',
+                    help='output vector file')
     ap.add_argument('-i', '--input-format', default=None, 
                     choices=wvlib.formats, help='input FILE format')
     ap.add_argument('-n', '--normalize', default=False, action='store_true',
@@ -24,27 +35,232 @@ def argparser():
 #                     choices=wvlib.output_formats, help='output FILE format')
     ap.add_argument('-r', '--max-rank', metavar='INT', default=None, 
                     type=int, help='only load r most frequent words')
+    ap.add_argument('-s', '--storage', default=None,
+                    choices=sorted(wvlib.storage_types),
+                    help='vector storage type (kept as such with .wvc output)')
     ap.add_argument('-v', '--vector-format', default=None, 
                     choices=wvlib.vector_formats,
                     help='output vector format (with wvlib output)')
+    ap.add_argument('--stream', default=False, action='store_true',
+                    help='convert a block at a time in constant memory')
+    ap.add_argument('--batch', metavar='DIR', default=None,
+                    help='convert all vector files under DIR')
+    ap.add_argument('-j', '--jobs', metavar='INT', default=0, type=int,
+                    help='parallel conversions with --batch (default '
+                    'one per CPU)')
+    ap.add_argument('-x', '--suffix', default='.wvc',
+                    help='output suffix replacing input extension with '
+                    '--batch (default .wvc)')
     return ap
 
+def convert(options, input, output):
+    """Convert vectors in pathname input to pathname output."""
+
+    if options.stream:
+        return convert_stream(options, input, output)
+
+    # convert while loading unless normalizing first
+    dtype = options.storage if not options.normalize else None
+    wv = wvlib.load(input, options.input_format,
+                    max_rank=options.max_rank, dtype=dtype)
+
+    if options.normalize:
+        logging.info('normalize vectors to unit length')
+        wv.normalize()
+
+    if options.storage is not None and dtype is None:
+        logging.info('store vectors as %s' % options.storage)
+        wv.astype(options.storage)
+
+    wv.save(output, vector_format=options.vector_format)
+
+def convert_stream(options, input, output):
+    """Convert a block of vectors at a time (see wvlib.read_blocks())."""
+
+    config, blocks = wvlib.read_blocks(input, options.input_format,
+                                       max_rank=options.max_rank)
+    if options.vector_format is not None:
+        config.format = options.vector_format
+    if options.storage is not None:
+        storage = wvlib.storage_types[options.storage]
+    else:
+        storage = None
+    def convert(blocks):
+        for words, freqs, vectors in blocks:
+            if options.normalize:
+                vectors.normalize()
+            if storage is not None and type(vectors) is not storage:
+                vectors = storage.from_vectors(vectors)
+            yield words, freqs, vectors
+    wvlib.write_blocks(output, config, convert(blocks))
+
+def checksum(name, block_size=1<<20):
+    """Return MD5 hex digest of the contents of pathname name."""
+
+    md5 = hashlib.md5()
+    with open(name, 'rb') as f:
+        for data in iter(lambda: f.read(block_size), ''):
+            md5.update(data)
+    return md5.hexdigest()
+
+def batch_output(name, suffix):
+    """Return output pathname for input name, replacing its extension
+    (e.g. ".bin.gz") with suffix."""
+
+    for ext in wvlib.compression_extension_map:
+        if name.endswith(ext):
+            name = name[:-len(ext)]
+            break
+    for ext in sorted(wvlib.extension_format_map, key=len, reverse=True):
+        if name.endswith(ext):
+            return name[:-len(ext)] + suffix
+    return os.path.splitext(name)[0] + suffix
+
+def batch_inputs(directory, suffix):
+    """Return sorted pathnames of vector files under directory, except
+    for outputs with the given suffix."""
+
+    inputs = []
+    for root, dirs, files in os.walk(directory):
+        if wvlib.SEGMENT_MANIFEST in files:
+            # segmented model, not individual vector files
+            dirs[:] = []
+            continue
+        for f in files:
+            name = os.path.join(root, f)
+            if f.startswith('.') or f.endswith(suffix):
+                continue
+            try:
+                if wvlib._guess_format(name) is not None:
+                    inputs.append(name)
+            except Exception:
+                pass    # unreadable or not vectors
+    return sorted(inputs)
+
+def conversion_key(options):
+    """Return the options affecting the output of a conversion."""
+
+    return { 'input_format': options.input_format,
+             'normalize': options.normalize,
+             'max_rank': options.max_rank,
+             'storage': options.storage,
+             'vector_format': options.vector_format }
+
+def up_to_date(input, output, key, record):
+    """Return True iff output converted from input with options key is
+    up to date, given the record of its conversion or None.
+
+    Outputs are up to date if they have not changed since they were
+    recorded and the input has the same size and modification time as
+    recorded or, failing that, the same checksum. Outputs without a
+    record are up to date if newer than their input.
+    """
+
+    if not os.path.exists(output):
+        return False
+    if record is None:
+        return os.path.getmtime(output) >= os.path.getmtime(input)
+    if (record['options'] != key or
+        record['output_mtime'] != os.path.getmtime(output)):
+        return False
+    if (record['mtime'] == os.path.getmtime(input) and
+        record['size'] == os.path.getsize(input)):
+        return True
+    return (record['size'] == os.path.getsize(input) and
+            record['checksum'] == checksum(input))
+
+def batch_job(args):
+    """Convert input to output for convert_batch(), return (input,
+    output, record, seconds, error message or None)."""
+
+    options, input, output = args
+    start = time()
+    try:
+        record = { 'options': conversion_key(options),
+                   'mtime': os.path.getmtime(input),
+                   'size': os.path.getsize(input),
+                   'checksum': checksum(input) }
+        convert(options, input, output)
+        record['output_mtime'] = os.path.getmtime(output)
+        return input, output, record, time() - start, None
+    except Exception, e:
+        return input, output, None, time() - start, str(e)
+
+def convert_batch(options):
+    """Convert all vector files under directory options.batch using a
+    pool of options.jobs processes, skipping up-to-date outputs. Print
+    a summary table, return number of failed conversions."""
+
+    directory = options.batch
+    record_name = os.path.join(directory, BATCH_RECORD)
+    try:
+        with open(record_name) as f:
+            records = json.load(f)
+    except IOError:
+        records = {}
+    key = conversion_key(options)
+
+    jobs, results = [], []
+    for input in batch_inputs(directory, options.suffix):
+        output = batch_output(input, options.suffix)
+        rel = os.path.relpath(input, directory)
+        if up_to_date(input, output, key, records.get(rel)):
+            results.append((input, output, 'skipped', 0.0))
+        else:
+            jobs.append((options, input, output))
+
+    failed = 0
+    if jobs:
+        pool = multiprocessing.Pool(options.jobs or None)
+        try:
+            for input, output, record, seconds, error in \
+                    pool.imap_unordered(batch_job, jobs):
+                if error is not None:
+                    print >> sys.stderr, 'Error: %s: %s' % (input, error)
+                    results.append((input, output, 'failed', seconds))
+                    failed += 1
+                else:
+                    records[os.path.relpath(input, directory)] = record
+                    results.append((input, output, 'converted', seconds))
+        finally:
+            pool.close()
+            pool.join()
+        with open(record_name, 'w') as f:
+            json.dump(records, f, sort_keys=True, indent=4,
+                      separators=(',', ': '))
+
+    def mb(name):
+        if not os.path.isfile(name):
+            return 0.0
+        return os.path.getsize(name) / 2.**20
+    print '%10s\t%10s\t%10s\t%8s\t%s' % ('status', 'input MB', 'output MB',
+                                           'seconds', 'input')
+    for input, output, status, seconds in sorted(results):
+        print '%10s\t%10.1f\t%10.1f\t%8.1f\t%s' % \
+            (status, mb(input), mb(output), seconds, input)
+    print '%10s\t%10.1f\t%10.1f\t%8.1f\t%d files' % \
+        ('total', sum(mb(r[0]) for r in results),
+         sum(mb(r[1]) for r in results), sum(r[3] for r in results),
+         len(results))
+    return failed
+
 def main(argv=None):
     if argv is None:
         argv = sys.argv
 
-    options = argparser().parse_args(argv[1:])
+    ap = argparser()
+    options = ap.parse_args(argv[1:])
     if options.max_rank is not None and options.max_rank < 1:
         raise ValueError('max-rank must be >= 1')
 
-    wv = wvlib.load(options.input, options.input_format,
-                    max_rank=options.max_rank)
-
-    if options.normalize:
-        logging.info('normalize vectors to unit length')
-        wv.normalize()
+    if options.batch is not None:
+        if options.input is not None:
+            ap.error('no INFILE or OUTFILE with --batch')
+        return 1 if convert_batch(options) else 0
+    elif options.input is None or options.output is None:
+        ap.error('INFILE and OUTFILE required without --batch')
 
-    wv.save(options.output, vector_format=options.vector_format)
+    convert(options, options.input, options.output)
 
     return 0
 
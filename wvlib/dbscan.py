@@ -94,7 +94,7 @@ def main(argv=None):
             raise
 
     dbscan = sklearn.cluster.DBSCAN(eps=options.eps, metric=options.metric)
-    dbscan.fit(numpy.array(vectors))
+    dbscan.fit(numpy.asarray(vectors))
     noisy = sum(1 for l in dbscan.labels_ if l == -1)
     unique = len(set(dbscan.labels_))
     logging.info('%d clusters, %d noisy, %d vectors' % (unique, noisy,
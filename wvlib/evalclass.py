@@ -25,7 +25,7 @@ import numpy
 import codecs
 import logging
 
-from itertools import combinations
+from itertools import combinations, izip
 
 import wvlib
 
@@ -135,14 +135,13 @@ def main(argv=None):
     if options.max_rank is not None and options.max_rank < 1:
         raise ValueError('max-rank must be >= 1')
     wv = wvlib.load(options.vectors[0], max_rank=options.max_rank).normalize()
-    w2v = wv.word_to_vector_mapping()
 
     word_count, oov_count = 0, 0
     filtered_wordsets = {}
     for k, wordset in wordsets.items():
         filtered = []
         for w in wordset:
-            if w in w2v:
+            if w in wv:
                 filtered.append(w)
             else:
                 logging.warn('ignoring out-of-vocabulary word "%s"' % w)
@@ -157,6 +156,10 @@ def main(argv=None):
     if not enough_data(wordsets):
         return 1
 
+    # vectors of the evaluated words only, gathered in one lookup
+    words = sorted(set(w for ws in wordsets.values() for w in ws))
+    w2v = dict(izip(words, wv.lookup_many(words)))
+
     results = []
     for n1, n2 in combinations(wordsets.keys(), 2):
         result = compare_sets(wordsets[n1], n1, wordsets[n2], n2, w2v, options)
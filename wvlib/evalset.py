@@ -282,18 +282,27 @@ def query_vector(wv, words):
 def get_nearest(vectors, queries, nncount=100, options=None):
     nearest = {}
     wv = wvlib.load(vectors).normalize()
+    approximate = options is not None and options.approximate
+    found, query_vectors, excluded = [], [], []
     for query in queries:
         words = query.split()
         v = query_vector(wv, words)
-        if v is not None:
-            if options is None or not options.approximate:
-                word_sim = wv.nearest(v, n=nncount, exclude=words)
-            else:
-                word_sim = wv.approximate_nearest(v, n=nncount, exclude=words,
-                                                  evalnum=10*nncount)
+        if v is None:
+            nearest[query] = [] # out of vocabulary
+        elif approximate:
+            word_sim = wv.approximate_nearest(v, n=nncount, exclude=words,
+                                              evalnum=10*nncount)
             nearest[query] = [ws[0] for ws in word_sim]
         else:
-            nearest[query] = [] # out of vocabulary
+            found.append(query)
+            query_vectors.append(v)
+            excluded.append(words)
+    if found:
+        # all exact queries at once
+        ranks, _ = wv.nearest_many(query_vectors, nncount, exclude=excluded)
+        words = wv.words()
+        for query, r in zip(found, ranks):
+            nearest[query] = [words[i] for i in r if i >= 0]
     return nearest
 
 def evaluate_sets(infn, word_sets, options):
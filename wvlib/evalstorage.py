@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""Report memory use and similarity ranking performance of word
+vectors for each vector storage type (see wvlib.storage_types)."""
+
+import sys
+import logging
+
+from os.path import dirname, join
+
+import wvlib
+from evalrank import read_reference, evaluate, baseroot
+
+# references used by evaluate.py
+DEFAULT_REFERENCES = [
+    join(dirname(__file__), 'word-similarities', 'MayoSRS', 'MayoSRS.txt'),
+    join(dirname(__file__), 'word-similarities', 'UMNSRS', 'UMNSRS-sim.txt'),
+    join(dirname(__file__), 'word-similarities', 'UMNSRS', 'UMNSRS-rel.txt'),
+]
+
+def argparser():
+    try:
+        import argparse
+    except ImportError:
+        import compat.argparse as argparse
+
+    ap=argparse.ArgumentParser()
+    ap.add_argument('-r', '--max-rank', metavar='INT', default=None,
+                    type=int, help='only consider r most frequent words')
+    ap.add_argument('-s', '--storage', metavar='TYPE', default=None,
+                    action='append', choices=sorted(wvlib.storage_types),
+                    help='storage type to evaluate (default all)')
+    ap.add_argument('-q', '--quiet', default=False, action='store_true')
+    ap.add_argument('vectors', help='word vectors')
+    ap.add_argument('references', metavar='FILE', nargs='*',
+                    default=DEFAULT_REFERENCES,
+                    help='reference similarities (default MayoSRS, UMNSRS)')
+    return ap
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    options = argparser().parse_args(argv[1:])
+
+    if options.quiet:
+        logging.getLogger().setLevel(logging.ERROR)
+    storages = options.storage
+    if storages is None:
+        storages = sorted(wvlib.storage_types, reverse=True)
+    # float32 first as the baseline
+    storages = ['float32'] + [s for s in storages if s != 'float32']
+    references = [(r, read_reference(r)) for r in options.references]
+
+    print '%8s\t%8s\t%6s\t%20s\trho\tdelta' % ('storage', 'MB', 'saved',
+                                               'dataset')
+    baseline = {}
+    for storage in storages:
+        try:
+            wv = wvlib.load(options.vectors, max_rank=options.max_rank)
+            wv = wv.normalize().astype(storage)
+        except Exception, e:
+            print >> sys.stderr, 'Error: %s' % str(e)
+            return 1
+        nbytes = wv.nbytes()
+        saved = 1 - 1. * nbytes / baseline.setdefault('nbytes', nbytes)
+        for name, ref in references:
+            rho, count = evaluate(wv, ref)
+            delta = rho - baseline.setdefault(name, rho)
+            print '%8s\t%8.1f\t%5.1f%%\t%20s\t%.4f\t%+.4f' % \
+                (storage, nbytes / 2.**20, 100*saved, baseroot(name), rho,
+                 delta)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -97,7 +97,7 @@ def minibatch_kmeans(vectors, k):
     return kmeans.labels_
 
 def kmeans(vectors, k, jobs=1):
-    vectors = numpy.array(vectors)
+    vectors = numpy.asarray(vectors)
     if with_sklearn:
         if jobs == 1:
             kmeans = sklearn.cluster.KMeans(k)
@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+
+"""Registry of word vector models indexed by content hash.
+
+Records the path, format, word count, dimension and training
+parameters of models in an SQLite database, so that they can be found
+by hash or query without reading the files again. Training parameters
+are taken from the name of the file a model is first registered from,
+following the conventions of createModel.sh (e.g. "corpus-win8.bin"),
+or given explicitly.
+
+Models in the registry can be loaded by any wvlib tool by giving "@"
+followed by a hash (prefix) or a query in place of the filename, e.g.
+
+    python nearest.py @3fa2b1c0
+    python nearest.py '@dim=200 and window>=8'
+
+A query is a conjunction of comparisons of the fields hash, path,
+format, words, dim, size and loads, or of training parameters, with
+values. Queries naming a single model can be used to load it.
+
+Examples:
+
+    python registry.py add ../result_vector
+    python registry.py find 'dim=200 and window>=8'
+"""
+
+import sys
+import os
+import re
+import hashlib
+import logging
+import sqlite3
+import wvlib
+
+from time import time
+
+# registry used by default, see Registry
+DEFAULT_REGISTRY = os.environ.get('WVLIB_REGISTRY',
+                                  os.path.join(os.path.expanduser('~'),
+                                               '.wvlib', 'registry.sqlite'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    hash TEXT PRIMARY KEY,
+    format TEXT,
+    word_count INTEGER,
+    vector_dim INTEGER,
+    size INTEGER,
+    added REAL,
+    loads INTEGER NOT NULL DEFAULT 0,
+    load_seconds REAL NOT NULL DEFAULT 0,
+    last_loaded REAL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    hash TEXT NOT NULL REFERENCES models(hash),
+    size INTEGER,
+    mtime REAL
+);
+CREATE TABLE IF NOT EXISTS params (
+    hash TEXT NOT NULL REFERENCES models(hash),
+    name TEXT NOT NULL,
+    value,
+    PRIMARY KEY (hash, name)
+);
+CREATE INDEX IF NOT EXISTS files_hash ON files (hash);
+CREATE INDEX IF NOT EXISTS params_name_value ON params (name, value);
+"""
+
+# query fields stored with models and files, others are parameters
+FIELD_COLUMNS = {
+    'hash': 'm.hash',
+    'path': 'f.path',
+    'format': 'm.format',
+    'words': 'm.word_count',
+    'dim': 'm.vector_dim',
+    'size': 'm.size',
+    'loads': 'm.loads',
+}
+
+# filename suffixes used by createModel.sh and the word2vec training
+# parameters they give, e.g. "-win8" for window 8
+NAME_PARAMETERS = {
+    'win': 'window',
+    'dim': 'size',
+    'neg': 'negative',
+    'samp': 'sample',
+    'min': 'min_count',
+    'alpha': 'alpha',
+}
+
+# word2vec parameters used by createModel.sh unless varied
+DEFAULT_PARAMETERS = {
+    'window': 5,
+    'size': 100,
+    'sample': 1e-3,
+    'negative': 5,
+    'hs': 0,
+    'cbow': 0,
+    'iter': 1,
+    'min_count': 5,
+    'alpha': 0.025,
+}
+
+NAME_PARAMETER_RE = re.compile(r'-(%s)([0-9][0-9.e+-]*)(?=-|$)' %
+                               '|'.join(NAME_PARAMETERS))
+DEFAULT_NAME_RE = re.compile(r'-default-(cbow|skipGram)$')
+COMPARISON_RE = re.compile(r'^\s*([A-Za-z_][A-Za-z0-9_]*)\s*'
+                           r'(<=|>=|!=|==|=|<|>)\s*(.*?)\s*$')
+HASH_RE = re.compile(r'^[0-9a-f]{6,40}$')
+
+def parse_value(s):
+    """Return s as int or float if numeric, otherwise as string."""
+
+    for convert in (int, float):
+        try:
+            return convert(s)
+        except ValueError:
+            pass
+    return s
+
+def name_parameters(name):
+    """Return training parameters given by the name of a model file
+    following the conventions of createModel.sh, or an empty dict."""
+
+    base = os.path.basename(name.rstrip(os.sep))
+    # strip only known extensions, as parameters may contain dots
+    # (e.g. "-alpha0.025") and follow dotted corpus names
+    for ext in wvlib.compression_extension_map:
+        if base.endswith(ext):
+            base = base[:-len(ext)]
+            break
+    for ext in sorted(wvlib.extension_format_map, key=len, reverse=True):
+        if base.endswith(ext):
+            base = base[:-len(ext)]
+            break
+    params = {}
+    for key, value in NAME_PARAMETER_RE.findall(base):
+        params[NAME_PARAMETERS[key]] = parse_value(value)
+    m = DEFAULT_NAME_RE.search(base)
+    if m:
+        params['cbow'] = 1 if m.group(1) == 'cbow' else 0
+    if not params:
+        return params
+    defaults = dict(DEFAULT_PARAMETERS)
+    defaults.update(params)
+    return defaults
+
+def content_hash(name, block_size=1<<20):
+    """Return SHA-1 hex digest of the contents of file name or, for
+    directories, of the names and contents of the files in them."""
+
+    sha1 = hashlib.sha1()
+    if os.path.isdir(name):
+        files = []
+        for root, dirs, fs in os.walk(name):
+            dirs.sort()
+            files.extend(os.path.join(root, f) for f in sorted(fs))
+    else:
+        files = [name]
+    for fn in files:
+        if fn != name:
+            sha1.update(os.path.relpath(fn, name) + '\0')
+        with open(fn, 'rb') as f:
+            for data in iter(lambda: f.read(block_size), ''):
+                sha1.update(data)
+    return sha1.hexdigest()
+
+def file_stat(name):
+    """Return (size, modification time) of file or directory name,
+    summed and maximized over the files in directories."""
+
+    if not os.path.isdir(name):
+        return os.path.getsize(name), os.path.getmtime(name)
+    size, mtime = 0, os.path.getmtime(name)
+    for root, dirs, files in os.walk(name):
+        for f in files:
+            fn = os.path.join(root, f)
+            size += os.path.getsize(fn)
+            mtime = max(mtime, os.path.getmtime(fn))
+    return size, mtime
+
+def parse_query(query):
+    """Return (SQL condition, arguments) for query, a conjunction of
+    comparisons such as "dim=200 and window>=8"."""
+
+    conditions, args = [], []
+    for term in re.split(r'\s+and\s+', query.strip(), flags=re.I):
+        m = COMPARISON_RE.match(term)
+        if not m:
+            raise ValueError('invalid query term: "%s"' % term)
+        field, op, value = m.groups()
+        op = '=' if op == '==' else op
+        value = parse_value(value.strip('\'"'))
+        if field in FIELD_COLUMNS:
+            conditions.append('%s %s ?' % (FIELD_COLUMNS[field], op))
+            args.append(value)
+        else:
+            conditions.append('EXISTS (SELECT 1 FROM params p WHERE '
+                              'p.hash = m.hash AND p.name = ? AND '
+                              'p.value %s ?)' % op)
+            args.extend([field, value])
+    return ' AND '.join(conditions), args
+
+class Registry(object):
+    """SQLite index of word vector models keyed by content hash."""
+
+    def __init__(self, name=None):
+        """Open registry database name, creating it if it does not
+        exist. If name is None, use DEFAULT_REGISTRY."""
+
+        if name is None:
+            name = DEFAULT_REGISTRY
+        directory = os.path.dirname(os.path.abspath(name))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.name = name
+        self.db = sqlite3.connect(name)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def add(self, name, params=None):
+        """Register the model in file or directory name and return its
+        hash. Files already registered with the same size and
+        modification time are not read again, and of new files only
+        the headers are read in addition to hashing (see
+        wvlib.read_config()), leaving the word count of SDV files and
+        the counts of cid files unknown (NULL).
+
+        Training parameters are taken from the name (see
+        name_parameters()) when the model is first registered, so that
+        copies under other names do not replace them, and updated with
+        params if not None.
+        """
+
+        path = os.path.abspath(name)
+        size, mtime = file_stat(path)
+        row = self.db.execute('SELECT hash, size, mtime FROM files '
+                              'WHERE path = ?', (path,)).fetchone()
+        if row is not None and (row['size'], row['mtime']) == (size, mtime):
+            digest = row['hash']
+        else:
+            digest = content_hash(path)
+        parameters = {}
+        with self.db:
+            if not self.db.execute('SELECT 1 FROM models WHERE hash = ?',
+                                   (digest,)).fetchone():
+                parameters = name_parameters(path)
+                format_ = wvlib._guess_format(path)
+                # header only, counts unknown for some formats (NULL)
+                config = wvlib.read_config(path, format_)
+                self.db.execute('INSERT INTO models (hash, format, '
+                                'word_count, vector_dim, size, added) '
+                                'VALUES (?, ?, ?, ?, ?, ?)',
+                                (digest, format_, config.word_count,
+                                 config.vector_dim, size, time()))
+                logging.info('registered %s as %s' % (name, digest))
+            self.db.execute('INSERT OR REPLACE INTO files (path, hash, size, '
+                            'mtime) VALUES (?, ?, ?, ?)',
+                            (path, digest, size, mtime))
+            parameters.update(params or {})
+            for key, value in parameters.items():
+                self.db.execute('INSERT OR REPLACE INTO params (hash, name, '
+                                'value) VALUES (?, ?, ?)',
+                                (digest, key, value))
+        return digest
+
+    def scan(self, directory, params=None):
+        """Register the models in files under directory (see add()),
+        and forget files under it that no longer exist. Return list of
+        (path, hash or None if it could not be registered)."""
+
+        directory = os.path.abspath(directory)
+        results = []
+        for root, dirs, files in os.walk(directory):
+            if wvlib.SEGMENT_MANIFEST in files:
+                # segmented model, registered as a whole
+                dirs[:] = []
+                files = []
+                names = [root]
+            else:
+                dirs.sort()
+                names = [os.path.join(root, f) for f in sorted(files)
+                         if not f.startswith('.')]
+            for name in names:
+                try:
+                    if wvlib._guess_format(name) is None:
+                        continue
+                    results.append((name, self.add(name, params)))
+                except Exception, e:
+                    logging.warning('failed to register %s: %s' % (name, e))
+                    results.append((name, None))
+        prefix = os.path.join(directory, '')
+        with self.db:
+            for row in self.db.execute('SELECT path FROM files WHERE '
+                                       'substr(path, 1, ?) = ?',
+                                       (len(prefix), prefix)).fetchall():
+                if not os.path.exists(row['path']):
+                    self.db.execute('DELETE FROM files WHERE path = ?',
+                                    (row['path'],))
+        return results
+
+    def find(self, query=None):
+        """Return list of dicts describing the registered files whose
+        models match query, or all if query is None (see
+        parse_query())."""
+
+        sql = ('SELECT m.*, f.path FROM models m JOIN files f '
+               'ON f.hash = m.hash')
+        args = []
+        if query is not None and query.strip():
+            condition, args = parse_query(query)
+            sql += ' WHERE ' + condition
+        sql += ' ORDER BY f.path'
+        found = []
+        for row in self.db.execute(sql, args).fetchall():
+            model = dict(zip(row.keys(), row))
+            model['params'] = self.params(row['hash'])
+            found.append(model)
+        return found
+
+    def params(self, digest):
+        """Return dict of the training parameters of model digest."""
+
+        return dict(self.db.execute('SELECT name, value FROM params '
+                                    'WHERE hash = ?', (digest,)).fetchall())
+
+    def resolve(self, spec):
+        """Return the dict (see find()) of the model given by spec, a
+        hash or hash prefix or a query matching a single model, for an
+        existing file. Raise KeyError if there is no such model."""
+
+        if HASH_RE.match(spec):
+            found = [m for m in self.find()
+                     if m['hash'].startswith(spec)]
+        else:
+            found = self.find(spec)
+        found = [m for m in found if os.path.exists(m['path'])]
+        hashes = sorted(set(m['hash'] for m in found))
+        if not hashes:
+            raise KeyError('no registered model matches "%s"' % spec)
+        if len(hashes) > 1:
+            raise KeyError('%d registered models match "%s": %s' %
+                           (len(hashes), spec,
+                            ' '.join(h[:12] for h in hashes)))
+        return found[0]
+
+    def record_load(self, digest, seconds):
+        """Record that model digest was loaded in seconds."""
+
+        with self.db:
+            self.db.execute('UPDATE models SET loads = loads + 1, '
+                            'load_seconds = load_seconds + ?, '
+                            'last_loaded = ? WHERE hash = ?',
+                            (seconds, time(), digest))
+
+    def close(self):
+        self.db.close()
+
+def load(spec, registry=None, **kwargs):
+    """Load the model given by spec (see Registry.resolve()) from
+    registry (default DEFAULT_REGISTRY) with wvlib.load(), passing on
+    keyword arguments, and record the load time."""
+
+    r = Registry(registry)
+    try:
+        model = r.resolve(spec)
+        logging.info('resolved %s to %s' % (spec, model['path']))
+        start = time()
+        wv = wvlib.load(model['path'], **kwargs)
+        r.record_load(model['hash'], time() - start)
+        return wv
+    finally:
+        r.close()
+
+def argparser():
+    try:
+        import argparse
+    except ImportError:
+        import compat.argparse as argparse
+
+    ap=argparse.ArgumentParser()
+    ap.add_argument('-r', '--registry', metavar='FILE', default=None,
+                    help='registry database (default %s)' % DEFAULT_REGISTRY)
+    sp = ap.add_subparsers(dest='command')
+    add = sp.add_parser('add', help='register models in files and '
+                        'directories')
+    add.add_argument('-p', '--param', metavar='NAME=VALUE', default=[],
+                     action='append', help='training parameter')
+    add.add_argument('paths', metavar='PATH', nargs='+',
+                     help='model file or directory to scan')
+    find = sp.add_parser('find', help='list models matching query')
+    find.add_argument('query', metavar='QUERY', nargs='?', default=None,
+                      help='e.g. "dim=200 and window>=8" (default all)')
+    show = sp.add_parser('resolve', help='print path of a single model')
+    show.add_argument('spec', metavar='HASH|QUERY', help='model hash '
+                      '(prefix) or query')
+    return ap
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    options = argparser().parse_args(argv[1:])
+    try:
+        r = Registry(options.registry)
+        if options.command == 'add':
+            params = dict((k, parse_value(v)) for k, v in
+                          (p.split('=', 1) for p in options.param))
+            for path in options.paths:
+                if (os.path.isdir(path) and not os.path.exists(
+                        os.path.join(path, wvlib.SEGMENT_MANIFEST))):
+                    results = r.scan(path, params)
+                else:
+                    results = [(path, r.add(path, params))]
+                for name, digest in results:
+                    print '%s\t%s' % (digest[:12] if digest else 'failed',
+                                      name)
+        elif options.command == 'find':
+            print '%12s\t%8s\t%10s\t%5s\t%s\t%s' % ('hash', 'format', 'words',
+                                                  'dim', 'path', 'params')
+            for m in r.find(options.query):
+                params = ' '.join('%s=%s' % i
+                                  for i in sorted(m['params'].items()))
+                unknown = lambda v: '-' if v is None else v
+                print '%12s\t%8s\t%10s\t%5s\t%s\t%s' % \
+                    (m['hash'][:12], m['format'], unknown(m['word_count']),
+                     unknown(m['vector_dim']), m['path'], params)
+        elif options.command == 'resolve':
+            print r.resolve(options.spec)['path']
+    except Exception, e:
+        print >> sys.stderr, 'Error: %s' % str(e)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
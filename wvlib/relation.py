@@ -21,7 +21,11 @@ def process_query(wv, query, options=None):
     vectors = [wv.words_to_vector(q) for q in query]
     words = [w for q in query for w in q]
     nncount = 100 # TODO: add CLI parameter
-    nearest = [wv.nearest(v, n=nncount, exclude=words) for v in vectors]
+    ranks, sims = wv.nearest_many(vectors, nncount,
+                                  exclude=[words] * len(vectors))
+    vocab = wv.words()
+    nearest = [[(vocab[i], s) for i, s in zip(r, ss) if i >= 0]
+               for r, ss in zip(ranks, sims)]
     nearest = [[(n[0], n[1], wv[n[0]]) for n in l] for l in nearest]
     assert len(nearest) == 2, 'internal error'
     pairs = [(n1, n2, 
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""Append to, compact and list segmented format (.wvs) word vectors."""
+
+import sys
+import os
+import logging
+import wvlib
+
+from time import time
+
+def argparser():
+    try:
+        import argparse
+    except ImportError:
+        import compat.argparse as argparse
+
+    ap=argparse.ArgumentParser()
+    sp = ap.add_subparsers(dest='command')
+    append = sp.add_parser('append', help='append vectors as new segments')
+    append.add_argument('-i', '--input-format', default=None,
+                        choices=wvlib.formats, help='input FILE format')
+    append.add_argument('model', metavar='MODEL',
+                        help='segmented model directory')
+    append.add_argument('inputs', metavar='FILE', nargs='+',
+                        help='vectors to append, one segment per FILE')
+    compact = sp.add_parser('compact', help='merge segments into one')
+    compact.add_argument('model', metavar='MODEL',
+                         help='segmented model directory')
+    list_ = sp.add_parser('list', help='list segments')
+    list_.add_argument('model', metavar='MODEL',
+                       help='segmented model directory')
+    return ap
+
+def append(options):
+    for input in options.inputs:
+        start = time()
+        config, blocks = wvlib.read_blocks(input, options.input_format)
+        wvlib.append_segment_blocks(options.model, config, blocks)
+        logging.info('appended %d words from %s in %.1f seconds' %
+                     (config.word_count, input, time() - start))
+
+def compact(options):
+    start = time()
+    wvlib.compact_segments(options.model)
+    logging.info('compacted %s in %.1f seconds' % (options.model,
+                                                   time() - start))
+
+def list_segments(options):
+    manifest = wvlib._read_manifest(options.model)
+    print '%20s\t%10s\t%10s\t%8s' % ('segment', 'first rank', 'words', 'MB')
+    rank = 0
+    for segment in manifest['segments']:
+        name = os.path.join(options.model, segment['name'])
+        print '%20s\t%10d\t%10d\t%8.1f' % \
+            (segment['name'], rank, segment['word_count'],
+             os.path.getsize(name) / 2.**20)
+        rank += segment['word_count']
+    print '%20s\t%10s\t%10d\t%8s' % ('total', '', manifest['word_count'], '')
+
+commands = {
+    'append': append,
+    'compact': compact,
+    'list': list_segments,
+}
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    options = argparser().parse_args(argv[1:])
+    try:
+        commands[options.command](options)
+    except Exception, e:
+        print >> sys.stderr, 'Error: %s' % str(e)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
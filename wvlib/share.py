@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+"""Share word vectors in memory with other processes on this host
+until interrupted (see wvlib.attach())."""
+
+import sys
+import signal
+import logging
+import wvlib
+
+def argparser():
+    try:
+        import argparse
+    except ImportError:
+        import compat.argparse as argparse
+
+    ap=argparse.ArgumentParser()
+    ap.add_argument('-n', '--normalize', default=False, action='store_true',
+                    help='normalize vectors to unit length')
+    ap.add_argument('-r', '--max-rank', metavar='INT', default=None,
+                    type=int, help='only share r most frequent words')
+    ap.add_argument('vectors', metavar='FILE', help='word vectors')
+    ap.add_argument('name', metavar='NAME', help='name to share vectors as')
+    return ap
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    options = argparser().parse_args(argv[1:])
+    try:
+        wv = wvlib.load(options.vectors, max_rank=options.max_rank)
+        if options.normalize:
+            wv.normalize()
+        path = wv.share(options.name)
+    except Exception, e:
+        print >> sys.stderr, 'Error: %s' % str(e)
+        return 1
+    del wv
+    # release on SIGTERM as well as on interrupt (via atexit)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logging.info('sharing %s as %s in %s, interrupt to stop' %
+                 (options.vectors, options.name, path))
+    try:
+        while True:
+            signal.pause()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
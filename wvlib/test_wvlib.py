@@ -0,0 +1,416 @@
+#!/usr/bin/env python
+
+"""Tests for wvlib.
+
+Run with "python -m unittest discover" in this directory.
+"""
+
+import os
+import bz2
+import gzip
+import shutil
+import tempfile
+import unittest
+import logging
+import numpy
+import wvlib
+import registry
+
+logging.getLogger().setLevel(logging.ERROR)
+
+def encoded(w):
+    return w.encode('utf-8') if isinstance(w, unicode) else w
+
+def make_model(count=300, dim=16, seed=0, vocabulary=wvlib.Vocabulary):
+    """Return WVData with count random vectors of dim dimensions."""
+
+    rng = numpy.random.RandomState(seed)
+    words = ['w%d' % i for i in range(count)]
+    words[5] = 'caf\xc3\xa9'
+    vectors = rng.randn(count, dim).astype(numpy.float32)
+    if vocabulary is wvlib.CompactVocabulary:
+        vocab = wvlib.CompactVocabulary.from_words(words)
+    else:
+        vocab = wvlib.Vocabulary([(w, count-i) for i, w in enumerate(words)])
+    return wvlib.WVData(wvlib.Config.default(count, dim), vocab,
+                        wvlib.Vectors(vectors))
+
+def brute_force_nearest(vectors, v, n, exclude=()):
+    """Return (ranks, similarities) of the n vectors most similar to v
+    by sorting all of them, ties in rank order."""
+
+    unit = vectors / numpy.linalg.norm(vectors, axis=1)[:,numpy.newaxis]
+    sims = unit.dot(v / numpy.linalg.norm(v))
+    order = [i for i in numpy.argsort(-sims, kind='mergesort')
+             if i not in exclude][:n]
+    return order, sims[order]
+
+class TempDirTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='wvlib-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def assertSameModel(self, wv, expected, max_rank=None, atol=0):
+        words = [encoded(w) for w in expected.words()[:max_rank]]
+        self.assertEqual([encoded(w) for w in wv.words()], words)
+        vectors = expected.vectors()[:max_rank]
+        if atol:
+            self.assertTrue(numpy.allclose(wv.vectors(), vectors, atol=atol))
+        else:
+            self.assertTrue(numpy.array_equal(wv.vectors(), vectors))
+
+class RoundTripTest(TempDirTestCase):
+    formats = ['.bin', '.sdv', '.tar.gz', '.tar', '.wvc', '.wvs']
+
+    def setUp(self):
+        super(RoundTripTest, self).setUp()
+        self.wv = make_model()
+
+    def saved(self, ext):
+        name = self.path('model' + ext)
+        self.wv.save(name)
+        return name
+
+    def test_save_load(self):
+        for ext in self.formats:
+            self.assertSameModel(wvlib.load(self.saved(ext)), self.wv)
+
+    def test_convert_to_containers(self):
+        for ext in self.formats:
+            wv = wvlib.load(self.saved(ext))
+            for out in ('.wvc', '.wvs'):
+                name = self.path('converted%s%s' % (ext, out))
+                wv.save(name)
+                self.assertSameModel(wvlib.load(name), self.wv)
+
+    def test_stream_convert(self):
+        for ext in self.formats:
+            config, blocks = wvlib.read_blocks(self.saved(ext))
+            name = self.path('streamed%s.wvc' % ext)
+            wvlib.write_blocks(name, config, blocks)
+            self.assertSameModel(wvlib.load(name), self.wv)
+
+    def test_word2vec_text(self):
+        name = self.path('model.txt')
+        with open(name, 'w') as f:
+            f.write('%d %d\n' % self.wv.vectors().shape)
+            for w, v in zip(self.wv.words(), self.wv.vectors()):
+                f.write('%s %s\n' % (w, ' '.join('%.9g' % x for x in v)))
+        self.assertSameModel(wvlib.load(name), self.wv)
+
+    def test_compressed_input(self):
+        for ext in ('.bin', '.sdv'):
+            name = self.saved(ext)
+            data = open(name, 'rb').read()
+            with gzip.open(name + '.gz', 'wb') as f:
+                f.write(data)
+            with open(name + '.bz2', 'wb') as f:
+                f.write(bz2.compress(data))
+            for compressed in (name + '.gz', name + '.bz2'):
+                self.assertSameModel(wvlib.load(compressed), self.wv)
+                self.assertSameModel(wvlib.load(compressed, max_rank=10),
+                                     self.wv, max_rank=10)
+
+    def test_max_rank(self):
+        for ext in self.formats:
+            name = self.saved(ext)
+            self.assertSameModel(wvlib.load(name, max_rank=50), self.wv,
+                                 max_rank=50)
+            config, blocks = wvlib.read_blocks(name, max_rank=50)
+            self.assertEqual(config.word_count, 50)
+            self.assertEqual(sum(len(b[0]) for b in blocks), 50)
+
+    def test_vocabulary(self):
+        selected = self.wv.words()[::7]
+        for ext in ('.bin', '.sdv'):
+            wv = wvlib.load(self.saved(ext), vocabulary=selected)
+            self.assertEqual([encoded(w) for w in wv.words()], selected)
+            self.assertTrue(numpy.array_equal(wv.vectors(),
+                                              self.wv.vectors()[::7]))
+            self.assertEqual(list(wv.ranks(selected)),
+                             range(0, len(self.wv.words()), 7))
+
+    def test_dtype(self):
+        for ext in self.formats:
+            name = self.saved(ext)
+            for dtype, storage in (('float16', wvlib.Float16Vectors),
+                                   ('int8', wvlib.Int8Vectors)):
+                wv = wvlib.load(name, dtype=dtype)
+                self.assertTrue(isinstance(wv._vectors, storage))
+                self.assertSameModel(wv, self.wv, atol=0.05)
+
+    def test_container_keeps_storage(self):
+        self.wv.astype('int8')
+        name = self.saved('.wvc')
+        wv = wvlib.load(name)
+        self.assertTrue(isinstance(wv._vectors, wvlib.Int8Vectors))
+        self.assertTrue(numpy.array_equal(wv.vectors(), self.wv.vectors()))
+
+    def test_append_segments(self):
+        name = self.path('model.wvs')
+        first, rest = make_model(), make_model()
+        first.filter_by_rank(100)
+        first.save(name)
+        rest.vocab = rest.vocab.take(range(100, 300))
+        rest._vectors = rest._vectors.take(range(100, 300))
+        rest.config.word_count = 200
+        rest.append_segment(name)
+        self.assertSameModel(wvlib.load(name), self.wv)
+        wvlib.compact_segments(name)
+        self.assertSameModel(wvlib.load(name), self.wv)
+        self.assertRaises(ValueError, first.append_segment, name)
+
+class VocabularyTest(TempDirTestCase):
+    def setUp(self):
+        super(VocabularyTest, self).setUp()
+        self.words = ['w%d' % i for i in range(5000)] + ['', 'caf\xc3\xa9']
+        self.vocab = wvlib.CompactVocabulary.from_words(self.words)
+
+    def test_rank(self):
+        for i, w in enumerate(self.words):
+            self.assertEqual(self.vocab.rank(w), i)
+            self.assertEqual(self.vocab.word(i), w)
+        self.assertRaises(KeyError, self.vocab.rank, 'missing')
+
+    def test_ranks(self):
+        self.assertEqual(list(self.vocab.ranks(self.words)),
+                         range(len(self.words)))
+        self.assertEqual(list(self.vocab.ranks(['w7', 'x', 'w3'], -1)),
+                         [7, -1, 3])
+        self.assertRaises(KeyError, self.vocab.ranks, ['w1', 'x'])
+
+    def test_hashes(self):
+        hashes = self.vocab._hash_all()
+        for w, h in zip(self.words, hashes):
+            self.assertEqual(self.vocab._hash(w), h)
+
+    def test_index(self):
+        index = self.vocab._index_table(self.vocab._hash_all())
+        self.assertEqual(sorted(index[index >= 0]), range(len(self.words)))
+        # colliding and wrapping slots
+        hashes = numpy.array([7, 7, 7, 6, 0, 0, 1], dtype=numpy.uint64)
+        index = self.vocab._index_table(hashes)
+        mask = len(index) - 1
+        for i, h in enumerate(hashes):
+            slot = int(h) & mask
+            while index[slot] != i:
+                self.assertTrue(index[slot] >= 0)
+                slot = (slot + 1) & mask
+
+    def test_duplicates(self):
+        self.assertRaises(AssertionError, wvlib.CompactVocabulary.from_words(
+                ['a', 'b', 'a']).rank, 'a')
+
+    def test_persisted_index(self):
+        wv = make_model(vocabulary=wvlib.CompactVocabulary)
+        name = self.path('model.wvc')
+        wv.save(name)
+        for mmap in (True, False):
+            loaded = wvlib.load(name, mmap=mmap)
+            self.assertTrue(loaded.vocab._index is not None)
+            self.assertEqual(list(loaded.vocab.ranks(wv.words())),
+                             range(len(wv.words())))
+            loaded = wvlib.load(name, max_rank=10, mmap=mmap)
+            self.assertEqual(loaded.vocab.ranks(['w3', 'w20'], -1).tolist(),
+                             [3, -1])
+
+    def test_vocabulary_word(self):
+        vocab = wvlib.Vocabulary([(w, 0) for w in self.words])
+        self.assertEqual([vocab.word(i) for i in range(len(self.words))],
+                         self.words)
+        vocab.shrink(10)
+        self.assertRaises(IndexError, vocab.word, 10)
+        del vocab['w0']
+        self.assertEqual(vocab.word(0), 'w1')
+        self.assertEqual(vocab.rank('w9'), 8)
+
+    def test_align(self):
+        other = ['x%d' % i for i in range(100)] + self.words[::-3]
+        ranks = wvlib.align_vocabularies(
+            [self.vocab, wvlib.CompactVocabulary.from_words(other),
+             wvlib.Vocabulary([(w, 0) for w in self.words[:1000]])])
+        shared = [w for w in self.words[:1000] if w in set(other)]
+        self.assertEqual([self.words[i] for i in ranks[0]], shared)
+        self.assertEqual([other[i] for i in ranks[1]], shared)
+        self.assertEqual([self.words[i] for i in ranks[2]], shared)
+
+class NearestTest(unittest.TestCase):
+    def setUp(self):
+        self.wv = make_model(500, 12, vocabulary=wvlib.CompactVocabulary)
+        self.vectors = self.wv.vectors().copy()
+        # ties
+        self.vectors[20:30] = self.vectors[10]
+        self.wv._vectors = wvlib.Vectors(self.vectors.copy())
+        self.queries = ['w1', 'w10', 'w25', 'caf\xc3\xa9']
+
+    def check_nearest(self, wv, vectors, atol=None):
+        """Compare wv.nearest() to brute force. With atol, allow near
+        ties to come in any order."""
+
+        for q in self.queries:
+            r = wv.vocab.rank(q)
+            for n in (1, 10, 600):
+                ranks, sims = brute_force_nearest(vectors, vectors[r], n,
+                                                  exclude=(r,))
+                result = wv.nearest(q, n)
+                words = [w for w, _ in result]
+                if atol is None:
+                    self.assertEqual(words, [wv.vocab.word(i) for i in ranks])
+                all_ranks, all_sims = brute_force_nearest(vectors, vectors[r],
+                                                          len(vectors))
+                true_sims = dict(zip(all_ranks, all_sims))
+                found = [true_sims[i] for i in wv.vocab.ranks(words)]
+                for s in ([s for _, s in result], found):
+                    self.assertTrue(numpy.allclose(s, sims, atol=atol or 1e-5))
+        ranks, sims = brute_force_nearest(vectors, vectors[3], 5,
+                                          exclude=(1, 2))
+        result = wv.nearest(vectors[3], 5, exclude=['w1', 'w2', 'missing'])
+        self.assertEqual([w for w, _ in result],
+                         [wv.vocab.word(i) for i in ranks])
+
+    def check_nearest_many(self, wv, vectors, max_memory):
+        ranks, sims = wv.nearest_many(self.queries, 10, max_memory=max_memory)
+        self.assertEqual(ranks.shape, (len(self.queries), 10))
+        for q, rr, ss in zip(self.queries, ranks, sims):
+            r = wv.vocab.rank(q)
+            expected, esims = brute_force_nearest(vectors, vectors[r], 10,
+                                                  exclude=(r,))
+            self.assertEqual(list(rr), expected)
+            self.assertTrue(numpy.allclose(ss, esims, atol=1e-5))
+        ranks, sims = wv.nearest_many(vectors[:3], 600,
+                                      exclude=[['w0'], [], ['w2', 'w7']],
+                                      max_memory=max_memory)
+        self.assertEqual(ranks.shape, (3, 500))
+        self.assertEqual((ranks[0] < 0).sum(), 1)
+        self.assertEqual((ranks[2] < 0).sum(), 2)
+        self.assertFalse(0 in ranks[0] or 2 in ranks[2] or 7 in ranks[2])
+
+    def test_nearest(self):
+        self.check_nearest(self.wv, self.vectors)
+        self.wv.normalize()
+        self.check_nearest(self.wv, self.vectors)
+
+    def test_nearest_unit_view(self):
+        self.check_nearest(self.wv.unit(), self.vectors)
+
+    def test_nearest_quantized(self):
+        self.wv.astype('float16')
+        self.check_nearest(self.wv, self.wv.vectors(), atol=1e-3)
+
+    def test_nearest_many(self):
+        for max_memory in (1 << 10, 1 << 26):
+            self.check_nearest_many(self.wv, self.vectors, max_memory)
+        self.wv.normalize()
+        self.check_nearest_many(self.wv, self.vectors, 1 << 26)
+
+    def test_nearest_many_shapes(self):
+        ranks, sims = self.wv.nearest_many([], 5)
+        self.assertEqual((ranks.shape, sims.shape), ((0, 5), (0, 5)))
+        ranks, sims = self.wv.nearest_many(self.vectors[4], 5)
+        self.assertEqual(ranks.shape, (1, 5))
+        self.assertEqual(ranks[0, 0], 4)
+
+class TarNearestTest(TempDirTestCase):
+    """nearest() on a model loaded from tar, which has a plain
+    Vocabulary (dict of word to count)."""
+
+    def setUp(self):
+        super(TarNearestTest, self).setUp()
+        self.vectors = make_model().vectors()
+        name = self.path('model.tar.gz')
+        make_model().save(name)
+        self.wv = wvlib.load(name)
+
+    def test_vocabulary_type(self):
+        self.assertTrue(type(self.wv.vocab) is wvlib.Vocabulary)
+
+    def test_nearest(self):
+        ranks, sims = brute_force_nearest(self.vectors, self.vectors[5], 50,
+                                          exclude=(5,))
+        result = self.wv.nearest(u'caf\xe9', 50)
+        self.assertEqual([w for w, _ in result],
+                         [self.wv.vocab.word(i) for i in ranks])
+        self.assertTrue(numpy.allclose([s for _, s in result], sims,
+                                       atol=1e-5))
+
+    def test_nearest_words_once(self):
+        # mapping results to words must not rebuild the word list per
+        # result, which makes nearest() quadratic in the vocabulary size
+        vocab = self.wv.vocab
+        calls = []
+        words = vocab.words
+        def counted():
+            calls.append(1)
+            return words()
+        vocab.words = counted
+        vocab._invalidate()
+        self.wv.nearest('w1', 100)
+        self.assertTrue(len(calls) <= 2)
+        del calls[:]
+        self.wv.nearest('w2', 100)
+        self.assertEqual(calls, [])
+
+class SharedTest(unittest.TestCase):
+    def setUp(self):
+        self.name = 'test-%d' % os.getpid()
+
+    def files(self):
+        prefix = wvlib.SHARED_PREFIX + self.name + '.'
+        return sorted(f for f in os.listdir(wvlib.SHARED_DIR)
+                      if f.startswith(prefix))
+
+    def test_share_attach_release(self):
+        wv = make_model()
+        wv.share(self.name)
+        attached = wvlib.attach(self.name)
+        self.assertTrue(numpy.array_equal(attached.vectors(), wv.vectors()))
+        self.assertEqual(wvlib.release(self.name), 1)
+        self.assertEqual(wvlib.release(self.name), 0)
+        self.assertEqual(self.files(), [])
+        self.assertRaises(IOError, wvlib.attach, self.name)
+        self.assertEqual(self.files(), [])
+
+class RegistryTest(TempDirTestCase):
+    def test_name_parameters(self):
+        params = registry.name_parameters('/x/PM.w2v-win8-alpha0.05.bin.gz')
+        self.assertEqual((params['window'], params['alpha'], params['size']),
+                         (8, 0.05, 100))
+        self.assertEqual(registry.name_parameters('PubMed.bin'), {})
+        params = registry.name_parameters('m-default-cbow.tar')
+        self.assertEqual(params['cbow'], 1)
+
+    def test_add_find(self):
+        wv = make_model()
+        names = [self.path(n) for n in ('m-win8.wvc', 'm-dim16.sdv',
+                                        'copy-win2.wvc')]
+        for name in names[:2]:
+            wv.save(name)
+        shutil.copy(names[0], names[2])
+        r = registry.Registry(self.path('registry.db'))
+        try:
+            digests = [r.add(n) for n in names]
+            self.assertEqual(digests[0], digests[2])
+            self.assertNotEqual(digests[0], digests[1])
+            # parameters come from the name of the first copy
+            self.assertEqual(r.params(digests[0])['window'], 8)
+            sdv = r.find('format=sdv')
+            self.assertEqual([m['path'] for m in sdv], [names[1]])
+            self.assertEqual((sdv[0]['word_count'], sdv[0]['vector_dim']),
+                             (None, 16))
+            self.assertEqual(len(r.find('words=300 and window=8')), 2)
+            self.assertEqual(r.resolve(digests[1][:8])['path'], names[1])
+            self.assertRaises(KeyError, r.resolve, 'dim=16')
+            os.remove(names[2])
+            r.scan(self.dir)
+            self.assertEqual([m['path'] for m in r.find('window=8')],
+                             [names[0]])
+        finally:
+            r.close()
+
+if __name__ == '__main__':
+    unittest.main()
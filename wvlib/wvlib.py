@@ -8,7 +8,16 @@ cosine similarity.
 
 The word2vec binary and text formats are supported for input, and tar,
 tar.gz and directory-based variants of the wvlib format are supported
-for input and output.
+for input and output. Word2vec and space-delimited values input may
+be gzip or bzip2 compressed (e.g. "vectors.bin.gz"), in which case it
+is decompressed in a background thread while being parsed.
+Uncompressed word2vec binary data can be loaded using multiple threads
+(load(..., threads=N)). The single-file wvlib container format (.wvc)
+is memory-mapped on input, so that loading only the most frequent
+words reads only the data for those words. The segmented format (.wvs)
+is a directory of containers, to which new words can be appended
+without rewriting the existing ones. Loaded word vectors can be
+shared in memory with other processes (WVData.share(), attach()).
 
 Variables:
 
@@ -19,6 +28,14 @@ vector_formats -- list of vector formats recognized by WVData.save()
 Functions:
 
 load() -- load word vectors from a file in a supported input format.
+read_blocks() -- read word vectors a block at a time.
+read_config() -- read word vector counts and dimensionality only.
+write_blocks() -- write word vectors a block at a time.
+align() -- align word vectors of models on their shared vocabulary.
+append_segment_blocks() -- append word vectors to a segmented model.
+compact_segments() -- merge the segments of a segmented model.
+attach() -- attach to word vectors shared by another process.
+release() -- release word vectors shared or attached to.
 
 Classes:
 
@@ -48,7 +65,9 @@ Load word vectors, normalize, and find words nearest to given word:
 >>> wv.nearest("dog")
 
 (normalize() irreversibly alters the word vectors, but considerably
-speeds up calculations using word vector similarity.)
+speeds up calculations using word vector similarity. unit() instead
+returns a view dividing the vectors by their cached lengths, keeping
+the original vectors available without a second copy.)
 
 Load word vectors, normalize, and find word that has the same
 relationship to "japan" as "paris" has to "france" (see https://code.google.com/p/word2vec/#Interesting_properties_of_the_word_vectors).
@@ -58,6 +77,36 @@ relationship to "japan" as "paris" has to "france" (see https://code.google.com/
 >>> v = wv["paris"] - wv["france"] + wv["japan"]
 >>> wv.nearest(v)[0]
 
+Load only the 10000 most frequent words from a wvlib container:
+
+>>> import wvlib
+>>> wvlib.load("vectors.bin").save("vectors.wvc")
+>>> wv = wvlib.load("vectors.wvc", max_rank=10000)
+
+Convert word2vec vectors to the wvlib container format without
+holding more than a block of vectors in memory:
+
+>>> import wvlib
+>>> config, blocks = wvlib.read_blocks("vectors.bin")
+>>> wvlib.write_blocks("vectors.wvc", config, blocks)
+
+Add vectors for new words to a segmented model, load it as one model
+and later merge its segments into one:
+
+>>> import wvlib
+>>> wvlib.load("vectors.bin").save("vectors.wvs")
+>>> wvlib.load("new-words.bin").append_segment("vectors.wvs")
+>>> wv = wvlib.load("vectors.wvs")
+>>> wvlib.compact_segments("vectors.wvs")
+
+Share normalized word vectors with other processes on the same host,
+which attach to them without loading a copy of their own:
+
+>>> import wvlib
+>>> wvlib.load("vectors.bin").normalize().share("vectors")
+>>> wv = wvlib.attach("vectors")    # in another process
+>>> wv.nearest("dog")
+
 Load word vectors and save with vectors in TSV format:
 
 >>> import wvlib
@@ -91,25 +140,35 @@ import json
 import codecs
 import tarfile
 import logging
+import zlib
+import bz2
+import threading
+import Queue
 
 import traceback
 import numpy
 import heapq
+import mmap
+import multiprocessing
 
-try:
-    import numpy.numarray
-    with_numarray = True
-except ImportError:
-    with_numarray = False
+import numpy.lib.format
 
 from functools import partial
-from itertools import tee, izip, islice
+from itertools import tee, izip, islice, chain
 from StringIO import StringIO
 from types import StringTypes
 from time import time
-from collections import defaultdict
+from collections import defaultdict, Mapping
+from multiprocessing.pool import ThreadPool
 import struct
-import ast #for ast.literal_eval
+import tempfile
+import errno
+import atexit
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None    # no shared models (see share())
 
 try:
     from collections import OrderedDict
@@ -134,17 +193,77 @@ logging.getLogger().setLevel(logging.DEBUG)
 
 DEFAULT_ENCODING = "UTF-8"
 
+# size of blocks read by the bulk text parser (see read_text_blocks())
+TEXT_BLOCK_SIZE = 1 << 22
+
+# number of vectors formatted or packed per write (see write_text_blocks())
+WRITE_BLOCK_ROWS = 10000
+
+# in-memory size of tar members of unknown size, spooled to a
+# temporary file beyond this (see WVData.save_tar())
+TAR_SPOOL_SIZE = 1 << 24
+
+# format of values in text output, enough digits to round-trip float32
+TEXT_FLOAT_FORMAT = '%.9g'
+
+# number of initial bytes examined to detect file formats
+SNIFF_SIZE = 1 << 16
+
+# bytes of similarities and temporaries per tile of queries and
+# vectors scored at once (see WVData.nearest_many())
+NEAREST_MEMORY = 1 << 26
+
+# most queries scored per tile (see WVData.nearest_many())
+NEAREST_QUERY_ROWS = 1024
+
+# compressed input: filename extensions and magic strings, and
+# (compressed) extensions handled directly by tarfile
+compression_extension_map = {
+    '.gz' : 'gzip',
+    '.bz2' : 'bzip2',
+}
+compression_magic_map = {
+    '\x1f\x8b' : 'gzip',
+    'BZh' : 'bzip2',
+}
+TAR_EXTENSIONS = ('.tar', '.tgz', '.tar.gz', '.tar.bz2')
+
 WV_FORMAT_VERSION = 1
 
 CONFIG_NAME = 'config.json'
 VOCAB_NAME = 'vocab.tsv'
 VECTOR_BASE = 'vectors'
 
+# wvlib container format: magic, version and header length, followed
+# by a JSON header and data sections aligned to CONTAINER_ALIGN bytes
+CONTAINER_MAGIC = '\x93WVLIB'
+CONTAINER_VERSION = 1
+CONTAINER_ALIGN = 64
+
+# segmented format: a directory holding a JSON manifest listing wvlib
+# container segments in rank order
+SEGMENT_MANIFEST = 'manifest.json'
+SEGMENT_VERSION = 1
+SEGMENT_NAME = 'segment-%05d.wvc'
+
+# prefix of model registry references accepted by load()
+REGISTRY_PREFIX = '@'
+
+# shared models (see WVData.share()): directory for their files, on a
+# memory-backed filesystem where available, and prefix of file names
+if os.path.isdir('/dev/shm'):
+    SHARED_DIR = '/dev/shm'
+else:
+    SHARED_DIR = tempfile.gettempdir()
+SHARED_PREFIX = 'wvlib-'
+
 # supported formats and likely filename extensions for each
 WORD2VEC_FORMAT = 'w2v'
 WORD2VEC_TEXT = 'w2vtxt'
 WORD2VEC_BIN = 'w2vbin'
 WVLIB_FORMAT = 'wvlib'
+WVLIB_CONTAINER = 'wvc'
+WVLIB_SEGMENTED = 'wvs'
 CID_FORMAT = 'cid'
 SDV_FORMAT = 'sdv'
 
@@ -157,6 +276,8 @@ extension_format_map = {
     '.tar.bz2' : WVLIB_FORMAT,
     '.classes' : CID_FORMAT,
     '.sdv' : SDV_FORMAT,
+    '.wvc' : WVLIB_CONTAINER,
+    '.wvs' : WVLIB_SEGMENTED,
 }
 
 # supported vector formats and filename extensions
@@ -164,7 +285,8 @@ NUMPY_FORMAT = 'npy'
 TSV_FORMAT = 'tsv'
 
 formats = sorted(list(set(extension_format_map.values())))
-output_formats = sorted([WVLIB_FORMAT, WORD2VEC_BIN, SDV_FORMAT])
+output_formats = sorted([WVLIB_FORMAT, WVLIB_CONTAINER, WVLIB_SEGMENTED,
+                         WORD2VEC_BIN, SDV_FORMAT])
 vector_formats = sorted([NUMPY_FORMAT, TSV_FORMAT])
 
 class FormatError(Exception):
@@ -184,6 +306,8 @@ class WVData(object):
         self._lsh = None
         self._w2h_lsh = None
         self._w2h_map = None
+        self._ranks = None
+        self._norms = None
 
     def words(self):
         """Return list of words in the vocabulary."""
@@ -196,46 +320,111 @@ class WVData(object):
         return self._vectors.vectors
 
     def rank(self, w):
-        """Return rank (ordinal, 0-based) of word w in the vocabulary."""
+        """Return rank (ordinal, 0-based) of word w in the vocabulary.
+
+        After select(), ranks are those in the full vocabulary.
+        """
+
+        if self._ranks is None:
+            return self.vocab.rank(w)
+        return int(self._ranks[self.vocab.rank(w)])
 
-        return self.vocab.rank(w)
+    def ranks(self, words, missing=None):
+        """Return int64 array of the ranks of given words (see rank()).
+
+        If missing is None, raise KeyError for words not in the
+        vocabulary, otherwise give them rank missing (e.g. -1).
+        """
+
+        ranks = self.vocab.ranks(words, missing)
+        if self._ranks is None:
+            return ranks
+        found = ranks != missing if missing is not None else slice(None)
+        ranks[found] = self._ranks[ranks[found]]
+        return ranks
 
     def word_to_vector(self, w):
-        """Return vector for given word.
+        """Return vector for given word, looked up by rank.
 
-        For large numbers of queries, consider word_to_vector_mapping().
+        For large numbers of queries, consider lookup_many().
         """
         
-        return self.word_to_vector_mapping()[w]
+        return self._vectors.row(self.vocab.rank(w))
 
     def words_to_vector(self, words):
         """Return average vector for given words."""
 
-        w2v = self.word_to_vector_mapping()
-        return sum(w2v[w] for w in words)/len(words)
+        return self.lookup_many(words).sum(axis=0)/len(words)
+
+    def lookup_many(self, words):
+        """Return float32 matrix holding the vectors of given words as
+        rows, gathered by rank from the vectors.
+
+        Raise KeyError for words not in the vocabulary.
+        """
+
+        indices = self.vocab.ranks(words)
+        return self._vectors.take(indices).block(0, len(indices))
 
     def word_to_unit_vector(self, w):
-        """Return unit (normalized) vector for given word.
+        """Return unit (normalized) vector for given word, dividing
+        by its cached norm (see norms()).
 
-        For large numbers of queries, consider normalize() and
-        word_to_vector_mapping().
+        For large numbers of queries, consider normalize() or unit()
+        and lookup_many().
         """
 
-        v = self.word_to_vector_mapping()[w]
+        i = self.vocab.rank(w)
         if self._normalized:
-            return v
-        else:
-            return v/numpy.linalg.norm(v)
+            return self._vectors.row(i)
+        return self._vectors.row(i) / self.norms()[i]
+
+    def norms(self):
+        """Return float32 array of the lengths of the vectors.
+
+        Computed a block of vectors at a time on the first call and
+        cached until the vectors change.
+        """
+
+        if self._norms is None:
+            if self._normalized:
+                self._norms = numpy.ones(len(self._vectors), numpy.float32)
+            else:
+                self._norms = self._vectors.norms()
+        return self._norms
+
+    def unit(self):
+        """Return view of this WVData with vectors of unit length.
+
+        Unlike normalize(), leaves the vectors as they are: the view
+        divides them by their cached norms (see norms()) when they are
+        accessed, a block at a time in computations over all vectors,
+        so that both raw and unit vectors are available without a
+        second copy. The view shares the vocabulary and vectors, which
+        should not be modified (e.g. with filter_by_rank()) while it is
+        in use.
+        """
+
+        if self._normalized:
+            return self
+        config = Config(self.config.version, self.config.word_count,
+                        self.config.vector_dim, self.config.format)
+        wv = WVData(config, self.vocab,
+                    UnitVectors(self._vectors, self.norms()))
+        wv._normalized = True
+        wv._ranks = self._ranks
+        return wv
 
     def word_to_vector_mapping(self):
-        """Return dict mapping from words to vectors.
+        """Return read-only mapping from words to vectors.
 
-        The returned data is shared and should not be modified by the
-        caller.
+        Vectors are looked up by rank on access (see word_to_vector())
+        instead of being stored per word. The returned data is shared
+        and should not be modified by the caller.
         """
 
         if self._w2v_map is None:
-            self._w2v_map = dict(iter(self))
+            self._w2v_map = _VectorMapping(self.vocab, self._vectors)
         return self._w2v_map
 
     def similarity(self, v1, v2):
@@ -258,16 +447,16 @@ class WVData(object):
     def word_similarity(self, w1, w2):
         """Return cosine similarity of vectors for given words.
 
-        For many invocations of this function, consider calling
-        normalize() first to avoid repeatedly normalizing the same
-        vectors.
+        Unless normalized, the vectors are divided by their cached
+        norms (see norms()).
         """
 
-        w2v = self.word_to_vector_mapping()
-        v1, v2 = w2v[w1], w2v[w2]
-        if not self._normalized:
-            v1, v2 = v1/numpy.linalg.norm(v1), v2/numpy.linalg.norm(v2)
-        return numpy.dot(v1, v2)
+        i1, i2 = self.vocab.rank(w1), self.vocab.rank(w2)
+        sim = numpy.dot(self._vectors.row(i1), self._vectors.row(i2))
+        if self._normalized:
+            return sim
+        norms = self.norms()
+        return sim / (norms[i1] * norms[i2])
 
     def approximate_similarity(self, v1, v2, bits=None):
         """Return approximate cosine similarity of given words or vectors.
@@ -309,7 +498,8 @@ class WVData(object):
         If v is a string, look up the corresponding word vector.
         If exclude is None and v is a string, exclude v.
         If candidates is not None, only consider (word, vector)
-        values from iterable candidates.
+        values from iterable candidates, otherwise score all words
+        with one matrix-vector product (see _nearest_ranks()).
         Return value is a list of (word, similarity) pairs.
         """
 
@@ -319,16 +509,124 @@ class WVData(object):
             v, w = v/numpy.linalg.norm(v), None
         if exclude is None:
             exclude = [] if w is None else set([w])
+        if candidates is None:
+            sim = self._vectors.dot(v)
+            if not self._normalized:
+                sim /= self.norms()
+            ranks = self._nearest_ranks(sim, n, exclude)
+            return [(self.vocab.word(i), float(sim[i])) for i in ranks]
         if not self._normalized:
             sim = partial(self._item_similarity, v=v)
         else:
             sim = partial(self._item_similarity_normalized, v=v)
-        if candidates is None:
-            candidates = self.word_to_vector_mapping().iteritems()
         nearest = heapq.nlargest(n+len(exclude), candidates, sim)
         wordsim = [(p[0], sim(p)) for p in nearest if p[0] not in exclude]
         return wordsim[:n]
 
+    def _nearest_ranks(self, sim, n, exclude):
+        """Return int64 array of the ranks of the n words with the
+        highest similarities sim, excluding given words.
+
+        Ties are ranked by word rank, as in a stable sort of all
+        similarities, but only the words scoring at least the n-th
+        highest similarity (found with argpartition) are sorted.
+        """
+
+        keep = numpy.ones(len(sim), dtype=bool)
+        excluded = self.vocab.ranks(exclude, missing=-1)
+        keep[excluded[excluded >= 0]] = False
+        n = min(n, int(keep.sum()))
+        if n <= 0:
+            return numpy.zeros(0, dtype=numpy.int64)
+        masked = numpy.where(keep, sim, -numpy.inf)
+        top = numpy.argpartition(-masked, n-1)[:n]
+        ranks = numpy.flatnonzero(keep & (sim >= masked[top].min()))
+        order = numpy.argsort(-sim[ranks], kind='mergesort')
+        return ranks[order[:n]]
+
+    def nearest_many(self, queries, n=10, exclude=None,
+                     max_memory=NEAREST_MEMORY):
+        """Return nearest n words for each of given words or vectors,
+        excluding given words.
+
+        Queries are given as a sequence of words, a matrix with a
+        vector in each row or a single vector. If exclude is None and
+        queries are words, exclude each query word from its own
+        results, otherwise exclude is None or a sequence of sequences
+        of words, one per query.
+        Similarities are computed as matrix products of tiles of
+        queries and vectors taking up to about max_memory bytes with
+        their temporaries, keeping the n best of each tile.
+
+        Return value is (ranks, similarities), where ranks is an int64
+        array with the ranks of the nearest words (see vocab.word()) of
+        each query in a row, as ordered by nearest(), and similarities
+        a float32 array of their similarities. Where there are fewer
+        than n words to return, rows are padded with rank -1.
+        """
+
+        count = len(self._vectors)
+        n = min(n, count)
+        if len(queries) == 0:
+            return (numpy.zeros((0, n), dtype=numpy.int64),
+                    numpy.zeros((0, n), dtype=numpy.float32))
+        if isinstance(queries[0], StringTypes):
+            if exclude is None:
+                exclude = [[w] for w in queries]
+            ranks = self.vocab.ranks(queries)
+            queries = self._vectors.take(ranks).block(0, len(ranks))
+            if not self._normalized:
+                queries = queries / self.norms()[ranks][:,numpy.newaxis]
+        else:
+            queries = numpy.atleast_2d(numpy.asarray(queries,
+                                                     dtype=numpy.float32))
+            norms = numpy.linalg.norm(queries, axis=1)
+            queries = queries / norms[:,numpy.newaxis]
+        # excluded (query, rank) pairs
+        none = numpy.zeros(0, dtype=numpy.int64)
+        excluded_queries, excluded_ranks = [none], [none]
+        for i, words in enumerate(exclude or []):
+            ranks = self.vocab.ranks(words, missing=-1)
+            ranks = ranks[ranks >= 0]
+            excluded_queries.append(numpy.repeat(i, len(ranks)))
+            excluded_ranks.append(ranks)
+        excluded_queries = numpy.concatenate(excluded_queries)
+        excluded_ranks = numpy.concatenate(excluded_ranks)
+
+        # up to four tile-sized float32 arrays at once when merging
+        query_rows = max(1, min(len(queries), NEAREST_QUERY_ROWS,
+                                max_memory // (16 * max(n, 1024))))
+        vector_rows = max(n, max_memory // (16 * query_rows))
+        norms = None if self._normalized else self.norms()
+        best_ranks = numpy.empty((len(queries), n), dtype=numpy.int64)
+        best_sims = numpy.empty((len(queries), n), dtype=numpy.float32)
+        for q in xrange(0, len(queries), query_rows):
+            tile = queries[q:q+query_rows]
+            in_tile = ((excluded_queries >= q) &
+                       (excluded_queries < q + len(tile)))
+            ranks = numpy.zeros((len(tile), 0), dtype=numpy.int64)
+            sims = numpy.zeros((len(tile), 0), dtype=numpy.float32)
+            for start, block in izip(xrange(0, count, vector_rows),
+                                     self._vectors.blocks(vector_rows)):
+                end = start + len(block)
+                s = numpy.dot(tile, block.T)
+                if norms is not None:
+                    s /= norms[start:end]
+                e = (in_tile & (excluded_ranks >= start) &
+                     (excluded_ranks < end))
+                s[excluded_queries[e] - q, excluded_ranks[e] - start] = \
+                    -numpy.inf
+                r = numpy.broadcast_to(numpy.arange(start, end), s.shape)
+                ranks, sims = _top_n(numpy.hstack([ranks, r]),
+                                     numpy.hstack([sims, s]), n)
+            order = numpy.lexsort((ranks, -sims))
+            ranks = numpy.take_along_axis(ranks, order, axis=1)
+            sims = numpy.take_along_axis(sims, order, axis=1)
+            ranks[sims == -numpy.inf] = -1
+            best_ranks[q:q+len(tile)] = ranks
+            best_sims[q:q+len(tile)] = sims
+        return best_ranks, best_sims
+
     def approximate_nearest(self, v, n=10, exclude=None, 
                             exact_eval=0.1, bits=None,
                             search_hash_neighborhood=True):
@@ -407,7 +705,8 @@ class WVData(object):
 
         Irreversible. Has potentially high invocation cost, but should
         reduce overall time when there are many invocations of
-        word_similarity()."""
+        word_similarity(). See unit() for a view with normalized
+        vectors that keeps these as they are."""
 
         if self._normalized:
             return self
@@ -416,9 +715,60 @@ class WVData(object):
         self._normalized = True
         return self
 
+    def select(self, words):
+        """Discard vectors for words other than the given ones.
+
+        Words not in the vocabulary are ignored. The remaining words
+        keep their order, and rank() returns their ranks in the full
+        vocabulary.
+        """
+
+        ranks = set()
+        for w in words:
+            try:
+                ranks.add(self.vocab.rank(w))
+            except KeyError:
+                pass
+        ranks = numpy.array(sorted(ranks), dtype=numpy.int64)
+        self._invalidate()
+        self.vocab = self.vocab.take(ranks)
+        self._vectors = self._vectors.take(ranks)
+        self.config.word_count = len(ranks)
+        return self._with_ranks(ranks)
+
+    def _with_ranks(self, ranks):
+        # set ranks of the words in the full vocabulary, see select()
+        if self._ranks is not None:
+            ranks = self._ranks[ranks]
+        self._ranks = numpy.asarray(ranks, dtype=numpy.int64)
+        return self
+
+    def astype(self, dtype):
+        """Store vectors as dtype, one of storage_types.
+
+        'float16' and 'int8' (quantized with a scale per vector) reduce
+        memory use to about a half and a quarter of that of 'float32'.
+        Lookups return float32 vectors in all cases.
+        """
+
+        cls = _storage_type(dtype)
+        if type(self._vectors) is not cls:
+            self._invalidate()
+            self._vectors = cls.from_vectors(self._vectors)
+        return self
+
+    def nbytes(self):
+        """Return number of bytes used to store the vectors."""
+
+        return self._vectors.nbytes
+
     def filter_by_rank(self, r):
         """Discard vectors for words other than the r most frequent."""
         
+        if self._ranks is not None:
+            # r in the full vocabulary, see select()
+            r = int(numpy.searchsorted(self._ranks, r))
+            self._ranks = self._ranks[:r]
         if r < self.config.word_count:
             self._invalidate()
             self.config.word_count = r
@@ -450,6 +800,10 @@ class WVData(object):
                 return self.save_tar(name)
             elif format == self.DIR:
                 return self.save_dir(name)
+            elif format == WVLIB_CONTAINER:
+                return self.save_container(name)
+            elif format == WVLIB_SEGMENTED:
+                return self.save_segmented(name)
             elif format == WORD2VEC_BIN:
                 return self.save_bin(name)
             elif format == SDV_FORMAT:
@@ -463,77 +817,127 @@ class WVData(object):
         """Save in tar format to pathname name using mode.
 
         If mode is None, determine mode from filename extension.
+        See write_tar_blocks().
         """
 
-        if mode is None:
-            if name.endswith('.tgz') or name.endswith('.gz'):
-                mode = 'w:gz'
-            elif name.endswith('.bz2'):
-                mode = 'w:bz2'
-            else:
-                mode = 'w'
-
-        f = tarfile.open(name, mode)
-        try:
-            vecformat = self.config.format
-            vecfile_name = VECTOR_BASE + '.' + vecformat
-            self._save_in_tar(f, CONFIG_NAME, self.config.savef)
-            self._save_in_tar(f, VOCAB_NAME, self.vocab.savef)            
-            self._save_in_tar(f, vecfile_name, partial(self._vectors.savef,
-                                                       format = vecformat))
-        finally:
-            f.close()
+        write_tar_blocks(name, self._block_config(), self.iterblocks(), mode)
 
     def save_dir(self, name):
         """Save to directory name."""
 
-        vecformat = self.config.format
-        vecfile_name = VECTOR_BASE + '.' + vecformat
-        self.config.save(os.path.join(name, CONFIG_NAME))
-        self.vocab.save(os.path.join(name, VOCAB_NAME))
-        self._vectors.save(os.path.join(name, vecfile_name))
-
-    def save_bin(self, name, max_rank=-1):
-        """Save in word2vec binary format without newlines."""
-        vector_matrix=self.vectors() #list of ndarrays... whoa!
-        if max_rank:
-            to_save=max(max_rank, len(vector_matrix))
-        else:
-            to_save=len(vector_matrix)
-        words=self.words()
-        with open(name,"wb") as f:
-            f.write("%d %d\n"%(to_save,len(vector_matrix[0])))
-            for i in range(to_save):
-                if isinstance(words[i],unicode):
-                    f.write(words[i].encode("utf8"))
-                else:
-                    f.write(words[i])
-                f.write(" ")
-                vector_matrix[i].astype(numpy.float32).tofile(f)
-            f.flush()
-
-    def save_sdv(self, name):
-        """Save in space-delimited values format."""
-        words, vectors = self.words(), self.vectors()
-        with open(name, 'wt') as f:
-            for w, v in self:
-                print >> f, w, ' '.join(str(i) for i in v)
+        write_dir_blocks(name, self._block_config(), self.iterblocks())
+
+    def save_container(self, name):
+        """Save in wvlib container format to pathname name.
+
+        See write_container_blocks().
+        """
+
+        write_container_blocks(name, self._block_config(), self.iterblocks())
+
+    def share(self, name):
+        """Publish in shared memory under name for other processes to
+        attach to (see attach()), holding a reference to it for this
+        process until release(name) or exit. Return the pathname of the
+        shared file.
+
+        The model is saved in the wvlib container format in SHARED_DIR
+        (by default on the memory-backed /dev/shm), and attached
+        processes memory-map its vectors, so that they are held in
+        memory once for all of them. A model previously shared under
+        name is replaced for processes attaching later.
+        """
+
+        path = _shared_path(name, '.wvc')
+        tmpname = '%s.%d.tmp' % (path, os.getpid())
+        write_container_blocks(tmpname, self._block_config(),
+                               self.iterblocks())
+        with _SharedLock(name):
+            os.rename(tmpname, path)
+            _add_shared_reference(name, 1)
+        return path
+
+    def save_segmented(self, name):
+        """Save in segmented format to directory name as a single
+        segment, replacing any existing segments.
+
+        See write_segmented_blocks().
+        """
+
+        write_segmented_blocks(name, self._block_config(), self.iterblocks())
+
+    def append_segment(self, name):
+        """Append to the model in segmented format in directory name
+        as a new segment, creating the model if it does not exist.
+
+        See append_segment_blocks().
+        """
+
+        append_segment_blocks(name, self._block_config(), self.iterblocks())
+
+    def save_bin(self, name, max_rank=None, block_size=WRITE_BLOCK_ROWS):
+        """Save in word2vec binary format without newlines.
+
+        If max_rank is not None, only save max_rank most frequent words.
+        Words and vectors are packed into one buffer and written
+        block_size vectors at a time.
+        """
+
+        count = len(self._vectors)
+        if max_rank is not None and max_rank >= 0:
+            count = min(max_rank, count)
+        write_word2vec_binary_blocks(name, self._block_config(count),
+                                     self.iterblocks(block_size, count))
+
+    def save_sdv(self, name, block_size=WRITE_BLOCK_ROWS):
+        """Save in space-delimited values format, block_size vectors
+        at a time."""
+
+        write_sdv_blocks(name, self._block_config(),
+                         self.iterblocks(block_size))
+
+    def iterblocks(self, block_size=WRITE_BLOCK_ROWS, max_rank=None):
+        """Iterate over (words, frequencies, vectors) for consecutive
+        blocks of up to block_size words, where vectors are Vectors in
+        the storage type of this WVData (see write_blocks()).
+
+        If max_rank is not None, only include max_rank most frequent
+        words.
+        """
+
+        count = len(self._vectors)
+        if max_rank is not None:
+            count = min(max_rank, count)
+        rows = self.vocab.to_rows()
+        for i in xrange(0, count, block_size):
+            end = min(i+block_size, count)
+            words, freqs = zip(*islice(rows, end-i))
+            yield (list(words), list(freqs),
+                   self._vectors.take(numpy.arange(i, end)))
+
+    def _block_config(self, count=None):
+        # config for writing count (default all) vectors from iterblocks()
+        if count is None:
+            count = len(self._vectors)
+        return Config(self.config.version, count, self._vectors.shape[1],
+                      self.config.format)
 
     def _invalidate(self):
         """Invalidate cached values."""
 
         self._w2v_map = None
         self._lsh = None
+        self._norms = None
 
     def __getitem__(self, word):
         """Return vector for given word."""
 
-        return self.word_to_vector_mapping()[word]
+        return self.word_to_vector(word)
 
     def __contains__(self, word):
         """Return True iff given word is in vocabulary (has vector)."""
 
-        return word in self.word_to_vector_mapping()
+        return word in self.vocab
 
     def __getattr__(self, name):
         # delegate access to nonexistent attributes to config
@@ -546,17 +950,28 @@ class WVData(object):
         return izip(self.vocab.iterwords(), iter(self._vectors))
 
     @classmethod
-    def load(cls, name, max_rank=None):
+    def load(cls, name, max_rank=None, mmap=True, dtype=None):
         """Return WVData from pathname name.
 
         If max_rank is not None, only load max_rank most frequent words.
+        If mmap is True, memory-map vectors in the wvlib container
+        format.
+        If dtype is not None, store vectors as dtype (see
+        storage_types), otherwise as float32 or, in the wvlib
+        container format, as saved.
         """
 
         format = cls.guess_format(name)
         if format == cls.TAR:
-            wv = cls.load_tar(name, max_rank=max_rank)
+            wv = cls.load_tar(name, max_rank=max_rank, dtype=dtype)
         elif format == cls.DIR:
-            wv = cls.load_dir(name, max_rank=max_rank)
+            wv = cls.load_dir(name, max_rank=max_rank, dtype=dtype)
+        elif format == WVLIB_CONTAINER:
+            wv = cls.load_container(name, max_rank=max_rank, mmap=mmap,
+                                    dtype=dtype)
+        elif format == WVLIB_SEGMENTED:
+            wv = cls.load_segmented(name, max_rank=max_rank, mmap=mmap,
+                                    dtype=dtype)
         else:
             raise NotImplementedError
         if max_rank is not None:
@@ -564,31 +979,191 @@ class WVData(object):
         return wv
             
     @classmethod
-    def load_tar(cls, name, max_rank=None):
+    def load_tar(cls, name, max_rank=None, dtype=None):
         """Return WVData from tar or tar.gz name.
 
-        If max_rank is not None, only load max_rank most frequent words."""
+        If max_rank is not None, only load max_rank most frequent words.
+        If dtype is not None, store vectors as dtype."""
+
+        with open(name, 'rb') as f:
+            return cls.load_tarf(f, max_rank=max_rank, dtype=dtype)
+
+    @classmethod
+    def load_tarf(cls, f, max_rank=None, dtype=None):
+        """Return WVData from file-like object f in tar or tar.gz format.
 
-        f = tarfile.open(name, 'r')
+        If max_rank is not None, only load max_rank most frequent words.
+        If dtype is not None, store vectors as dtype."""
+
+        t = tarfile.open(fileobj=f, mode='r')
         try:
-            return cls._load_collection(f, max_rank=max_rank)
+            return cls._load_collection(t, max_rank=max_rank, dtype=dtype)
         finally:            
-            f.close()
+            t.close()
 
     @classmethod
-    def load_dir(cls, name, max_rank=None):
+    def load_dir(cls, name, max_rank=None, dtype=None):
         """Return WVData from directory name.
 
-        If max_rank is not None, only load max_rank most frequent words."""
+        If max_rank is not None, only load max_rank most frequent words.
+        If dtype is not None, store vectors as dtype."""
 
         d = _Directory.open(name, 'r')
         try:
-            return cls._load_collection(d, max_rank=max_rank)
+            return cls._load_collection(d, max_rank=max_rank, dtype=dtype)
         finally:
             d.close()
 
     @classmethod
-    def _load_collection(cls, coll, max_rank=None):
+    def load_container(cls, name, max_rank=None, mmap=True, dtype=None):
+        """Return WVData from pathname name in the wvlib container
+        format.
+
+        Only the sections of the file holding data for the loaded
+        words are read, so that load time is proportional to max_rank.
+        If max_rank is not None, only load max_rank most frequent words.
+        If mmap is True, vectors and the vocabulary index are read-only
+        memory maps of the file, otherwise they are read into memory.
+        With the saved index, rank() needs no build step.
+        If dtype is not None, convert vectors to dtype, otherwise keep
+        them as saved.
+        """
+
+        with open(name, 'rb') as f:
+            return cls.load_containerf(f, max_rank=max_rank, mmap=mmap,
+                                       dtype=dtype)
+
+    @classmethod
+    def load_containerf(cls, f, max_rank=None, mmap=True, dtype=None):
+        """Return WVData from file object f in the wvlib container
+        format.
+
+        See load_container().
+        """
+
+        header = cls._read_container_header(f)
+        sections = header['sections']
+        count = header['word_count']
+        if max_rank is not None and max_rank < count:
+            count = max_rank
+        offsets = cls._read_container_array(f, sections['word_offsets'],
+                                            '<i8', count+1)
+        f.seek(sections['vocab']['offset'])
+        arena = f.read(int(offsets[-1]))
+        freqs = cls._read_container_array(f, sections['frequencies'],
+                                          '<i8', count)
+        info = sections['vectors']
+        shape = (count, info['shape'][1])
+        if mmap and count > 0:
+            vectors = numpy.memmap(f, info['dtype'], 'r',
+                                   info['data_offset'], shape)
+        else:
+            f.seek(info['data_offset'])
+            vectors = numpy.fromfile(f, info['dtype'], shape[0]*shape[1])
+            vectors = vectors.reshape(shape)
+
+        if 'scales' in sections:
+            scales = cls._read_container_array(f, sections['scales'],
+                                               '<f4', count)
+            vectors = Int8Vectors(vectors, scales)
+        elif vectors.dtype == Float16Vectors.dtype:
+            vectors = Float16Vectors(vectors)
+        else:
+            vectors = Vectors(vectors)
+        storage = _storage_type(dtype, type(vectors))
+        if type(vectors) is not storage:
+            vectors = storage.from_vectors(vectors)
+
+        vectors._normalized = header.get('normalized', False)
+
+        index = sections.get('index')
+        if index is not None and index.get('hash') == \
+                CompactVocabulary.INDEX_HASH:
+            size = index['size'] // 4
+            if mmap and size > 0:
+                index = numpy.memmap(f, '<i4', 'r', index['offset'], (size,))
+            else:
+                index = cls._read_container_array(f, index, '<i4', size)
+        else:
+            index = None
+
+        config = Config.from_dict(header['config'])
+        config.word_count = count
+        vocab = CompactVocabulary(arena, offsets, freqs, index=index)
+        wv = cls(config, vocab, vectors)
+        wv._normalized = vectors._normalized
+        return wv
+
+    @staticmethod
+    def _read_container_header(f):
+        # helper for load_container
+        magic = f.read(len(CONTAINER_MAGIC))
+        if magic != CONTAINER_MAGIC:
+            raise FormatError('not a wvlib container (magic string mismatch)')
+        version, size = struct.unpack('<II', f.read(8))
+        if version != CONTAINER_VERSION:
+            raise FormatError('unsupported container version %d' % version)
+        try:
+            return json.loads(f.read(size))
+        except ValueError, e:
+            raise FormatError('invalid container header: %s' % str(e))
+
+    @staticmethod
+    def _read_container_array(f, section, dtype, count):
+        # helper for load_container
+        f.seek(section['offset'])
+        a = numpy.fromfile(f, dtype, count)
+        if len(a) != count:
+            raise FormatError('expected %d values, got %d' % (count, len(a)))
+        return a
+
+    @classmethod
+    def load_segmented(cls, name, max_rank=None, mmap=True, dtype=None):
+        """Return WVData from directory name in the segmented format.
+
+        The segments listed in the manifest are loaded as wvlib
+        containers (see load_container()) and presented as one model
+        with the words of each segment ranked after those of the
+        previous ones. Only the segments holding the loaded words are
+        read. A single segment is returned as loaded, so that with mmap
+        True its vectors stay memory-mapped; multiple segments are
+        concatenated in memory (see compact_segments()).
+        If max_rank is not None, only load max_rank most frequent words.
+        If dtype is not None, convert vectors to dtype, otherwise keep
+        them as saved in the first segment.
+        """
+
+        parts, count = [], 0
+        for segment in _read_manifest(name)['segments']:
+            if max_rank is not None and count >= max_rank:
+                break
+            rank = max_rank - count if max_rank is not None else None
+            wv = cls.load_container(os.path.join(name, segment['name']),
+                                    max_rank=rank, mmap=mmap, dtype=dtype)
+            parts.append(wv)
+            count += len(wv._vectors)
+        if not parts:
+            raise FormatError('no segments in %s' % name)
+        if len(parts) == 1:
+            return parts[0]
+
+        vocab = CompactVocabulary.concatenate([p.vocab for p in parts])
+        vectors = type(parts[0]._vectors).allocate((count,
+                                                    parts[0].vector_dim))
+        start = 0
+        for p in parts:
+            for block in p._vectors.blocks():
+                vectors.set_block(start, block)
+                start += len(block)
+        vectors._normalized = all(p._normalized for p in parts)
+        config = parts[0].config
+        config.word_count = count
+        wv = cls(config, vocab, vectors)
+        wv._normalized = vectors._normalized
+        return wv
+
+    @classmethod
+    def _load_collection(cls, coll, max_rank=None, dtype=None):
         # abstracts over tar and directory
         confname, vocabname, vecname = None, None, None
         for i in coll:
@@ -611,23 +1186,22 @@ class WVData(object):
                      (vecname, VECTOR_BASE)):
             if i is None:
                 raise FormatError('missing %s' % n)
-        config = Config.loadf(coll.extractfile(confname))
-        vocab = Vocabulary.loadf(coll.extractfile(vocabname), 
-                                 max_rank=max_rank)
-        vectors = Vectors.loadf(coll.extractfile(vecname), config.format,
-                                max_rank=max_rank)
-        return cls(config, vocab, vectors)
-
-    @staticmethod
-    def _save_in_tar(tar, name, savef):
-        # helper for save_tar
-        i = tar.tarinfo(name)
-        s = StringIO()
-        savef(s)
-        s.seek(0)
-        i.size = s.len
-        i.mtime = time()
-        tar.addfile(i, s)
+        # read in stored order, avoiding seeking back in compressed tars
+        # (the vector format is also given by the extension)
+        vecformat = os.path.splitext(vecname)[1].replace('.', '')
+        for i in coll:
+            if i.name == confname:
+                config = Config.loadf(coll.extractfile(confname))
+            elif i.name == vocabname:
+                vocab = Vocabulary.loadf(coll.extractfile(vocabname),
+                                         max_rank=max_rank)
+            elif i.name == vecname:
+                vectors = _storage_type(dtype).loadf(
+                    coll.extractfile(vecname), vecformat, max_rank=max_rank)
+        wv = cls(config, vocab, vectors)
+        if max_rank is not None:
+            wv.filter_by_rank(max_rank)
+        return wv
 
     @staticmethod
     def _item_similarity(i, v):
@@ -643,7 +1217,10 @@ class WVData(object):
 
     @staticmethod
     def guess_format(name):
-        if os.path.isdir(name):
+        if (name.endswith('.wvs') or
+            os.path.isfile(os.path.join(name, SEGMENT_MANIFEST))):
+            return WVLIB_SEGMENTED
+        elif os.path.isdir(name):
             return WVData.DIR
         elif (name.endswith('.tar') or name.endswith('.gz') or name.endswith('.tgz') or name.endswith('.bz2')):
             return WVData.TAR
@@ -651,6 +1228,8 @@ class WVData(object):
             return WORD2VEC_BIN
         elif name.endswith('.sdv'):
             return SDV_FORMAT
+        elif name.endswith('.wvc'):
+            return WVLIB_CONTAINER
         else:
             return None
 
@@ -680,6 +1259,8 @@ class _Directory(object):
         return (_FileInfo(os.path.join(self.name, i)) for i in self.listing)
 
     def extractfile(self, name):
+        if isinstance(name, _FileInfo):
+            name = name.name
         f = open(name)
         self.open_files.append(f)
         return f
@@ -692,34 +1273,376 @@ class _Directory(object):
     def open(cls, name, mode=None):
         return cls(name)
 
+class _BackgroundReader(object):
+    """Implements read-only, non-seekable file interface over another
+    file-like object read in large blocks by a background thread.
+
+    Used to overlap decompression with parsing.
+    """
+
+    def __init__(self, f, block_size=TEXT_BLOCK_SIZE, queue_size=4):
+        self._queue = Queue.Queue(queue_size)
+        self._buf, self._pos, self._eof = '', 0, False
+        self._closed = False
+        self._thread = threading.Thread(target=self._produce, 
+                                        args=(f, block_size))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _produce(self, f, block_size):
+        try:
+            while not self._closed:
+                data = f.read(block_size)
+                self._queue.put(data)
+                if not data:
+                    break
+        except Exception, e:
+            self._queue.put(e)
+
+    def _fill(self, size):
+        """Buffer at least size bytes past the current position unless
+        at end of file."""
+
+        chunks, available = [self._buf[self._pos:]], len(self._buf)-self._pos
+        while available < size and not self._eof:
+            data = self._queue.get()
+            if isinstance(data, Exception):
+                raise data
+            if not data:
+                self._eof = True
+            chunks.append(data)
+            available += len(data)
+        if len(chunks) > 1:
+            self._buf, self._pos = ''.join(chunks), 0
+
+    def read(self, size=-1):
+        if size < 0:
+            self._fill(sys.maxint)
+            size = len(self._buf) - self._pos
+        elif self._pos + size > len(self._buf):
+            self._fill(size)
+        data = self._buf[self._pos:self._pos+size]
+        self._pos += len(data)
+        return data
+
+    def peek(self, size=1):
+        """Return up to size bytes without advancing the position."""
+
+        self._fill(size)
+        return self._buf[self._pos:self._pos+size]
+
+    def readline(self):
+        end = self._buf.find('\n', self._pos)
+        while end < 0 and not self._eof:
+            searched = len(self._buf) - self._pos
+            self._fill(searched + 1)
+            end = self._buf.find('\n', self._pos + searched)
+        return self.read(end + 1 - self._pos if end >= 0 else -1)
+
+    def close(self):
+        self._closed = True
+        while self._thread.is_alive():
+            # unblock the producer if waiting on a full queue
+            try:
+                while True:
+                    self._queue.get_nowait()
+            except Queue.Empty:
+                pass
+            self._thread.join(0.1)
+
+    def __iter__(self):
+        return iter(self.readline, '')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class _ChunkReader(object):
+    """Implements read() over an iterable of strings."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf, self._pos = '', 0
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buf) - self._pos < size:
+            try:
+                data = next(self._chunks)
+            except StopIteration:
+                break
+            self._buf, self._pos = self._buf[self._pos:] + data, 0
+        if size < 0:
+            size = len(self._buf) - self._pos
+        data = self._buf[self._pos:self._pos+size]
+        self._pos += len(data)
+        return data
+
+class _BackgroundWriter(object):
+    """Implements write-only file interface over another file-like
+    object written in large blocks by a background thread.
+
+    Used to overlap compression with formatting.
+    """
+
+    def __init__(self, f, block_size=TEXT_BLOCK_SIZE, queue_size=4):
+        self._queue = Queue.Queue(queue_size)
+        self._parts, self._size = [], 0
+        self._block_size = block_size
+        self._error = None
+        self._thread = threading.Thread(target=self._consume, args=(f,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _consume(self, f):
+        data = ''
+        try:
+            while data is not None:
+                data = self._queue.get()
+                if data is not None:
+                    f.write(data)
+        except Exception, e:
+            self._error = e
+            # drain the queue to unblock write()
+            while data is not None:
+                data = self._queue.get()
+        finally:
+            try:
+                f.close()
+            except Exception, e:
+                if self._error is None:
+                    self._error = e
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    def write(self, data):
+        self._check()
+        self._parts.append(data)
+        self._size += len(data)
+        if self._size >= self._block_size:
+            self._queue.put(''.join(self._parts))
+            self._parts, self._size = [], 0
+
+    def close(self):
+        if self._thread is None:
+            return
+        if self._parts:
+            self._queue.put(''.join(self._parts))
+            self._parts, self._size = [], 0
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._check()
+
+class _CompressingWriter(object):
+    """Implements minimal part of file interface for writing data
+    compressed with compressor (e.g. zlib.compressobj()) to file-like
+    object fileobj."""
+
+    def __init__(self, fileobj, compressor):
+        self.fileobj = fileobj
+        self._compressor = compressor
+
+    def write(self, data):
+        self.fileobj.write(self._compressor.compress(data))
+
+    def close(self):
+        try:
+            self.fileobj.write(self._compressor.flush())
+        finally:
+            self.fileobj.close()
+
+class _DecompressingReader(object):
+    """Implements minimal part of file interface for reading data
+    compressed with one or more concatenated streams (e.g. gzip members)
+    from file-like object fileobj.
+
+    Function new_decompressor should return a zlib or bz2 style
+    decompressor object.
+    """
+
+    def __init__(self, fileobj, new_decompressor, block_size=TEXT_BLOCK_SIZE):
+        self.fileobj = fileobj
+        self.new_decompressor = new_decompressor
+        self.block_size = block_size
+        self.decompressor = new_decompressor()
+        self._pending = ''
+
+    def read(self, size=-1):
+        """Return next decompressed block (size is ignored) or empty
+        string at end of data."""
+
+        while True:
+            data = self._pending or self.fileobj.read(self.block_size)
+            self._pending = ''
+            if not data:
+                return ''
+            try:
+                out = self.decompressor.decompress(data)
+            except EOFError:
+                # bz2 stream ended exactly at the end of the last block
+                self.decompressor = self.new_decompressor()
+                out = self.decompressor.decompress(data)
+            if self.decompressor.unused_data:
+                # data following the end of a stream
+                self._pending = self.decompressor.unused_data
+                self.decompressor = self.new_decompressor()
+            if out:
+                return out
+
 class Vectors(object):
+    """Word vectors stored as the rows of a single (N, D) float32 matrix."""
 
     default_format = NUMPY_FORMAT
+    dtype = numpy.float32
+    # True if rows are created on access (e.g. converted from a compact
+    # representation) instead of being views into a float32 matrix
+    lazy_rows = False
     
     def __init__(self, vectors):
-        self.vectors = vectors
+        """Initialize with vectors given as a matrix or sequence of rows.
+
+        Sequences are copied into a new C-contiguous matrix. Matrices
+        in the right dtype are used as is, so that views (e.g. into a
+        memory map) remain views.
+        """
+
+        if isinstance(vectors, numpy.ndarray) and vectors.dtype == self.dtype:
+            self.vectors = vectors
+        else:
+            self.vectors = numpy.array(vectors, dtype=self.dtype)
+        if self.vectors.ndim != 2:
+            raise ValueError('expected 2D matrix, got %d dimensions' %
+                             self.vectors.ndim)
         self._normalized = False
 
     def normalize(self):
         if self._normalized:
             return self
-        for i, v in enumerate(self.vectors):
-            self.vectors[i] = v/numpy.linalg.norm(v)
+        if not self.vectors.flags.writeable:
+            # e.g. read-only memory map; normalize a private copy
+            self.vectors = numpy.array(self.vectors)
+        v = self.vectors
+        v /= numpy.sqrt(numpy.einsum('ij,ij->i', v, v))[:,numpy.newaxis]
         self._normalized = True
         return self
 
     def shrink(self, s):
-        """Discard vectors other than the first s."""
+        """Discard vectors other than the first s.
+
+        The remaining vectors are a view into the original matrix."""
 
         self.vectors = self.vectors[:s]
 
+    @property
+    def shape(self):
+        return self.vectors.shape
+
+    @property
+    def nbytes(self):
+        """Number of bytes used to store the vectors."""
+
+        return self.vectors.nbytes
+
+    def row(self, i):
+        """Return vector with rank (0-based row index) i."""
+
+        return self.vectors[i]
+
+    def block(self, start, end):
+        """Return vectors with ranks from start to end as a float32
+        matrix."""
+
+        return self.vectors[start:end]
+
+    def take(self, ranks):
+        """Return new Vectors holding the vectors with given ranks."""
+
+        taken = type(self)(self.vectors[ranks])
+        taken._normalized = self._normalized
+        return taken
+
+    def blocks(self, block_size=10000):
+        """Iterate over float32 matrices of up to block_size
+        consecutive vectors."""
+
+        for i in xrange(0, len(self), block_size):
+            yield self.block(i, i+block_size)
+
+    def dot(self, v, block_size=10000):
+        """Return array of the dot products of each vector with v,
+        computed with one matrix-vector product unless rows are lazy,
+        otherwise block_size vectors at a time."""
+
+        if not self.lazy_rows:
+            return self.vectors.dot(numpy.asarray(v, dtype=self.dtype))
+        out = numpy.empty(len(self), dtype=numpy.float32)
+        for i, b in izip(xrange(0, len(self), block_size),
+                         self.blocks(block_size)):
+            out[i:i+len(b)] = b.dot(v)
+        return out
+
+    def norms(self, block_size=10000):
+        """Return array of the lengths of the vectors, computed
+        block_size vectors at a time."""
+
+        out = numpy.empty(len(self), dtype=numpy.float32)
+        for i, b in izip(xrange(0, len(self), block_size),
+                         self.blocks(block_size)):
+            out[i:i+len(b)] = numpy.sqrt(numpy.einsum('ij,ij->i', b, b))
+        return out
+
     def to_rows(self):
         return self.vectors
 
-    def save_tsv(self, f):
-        """Save as TSV to file-like object f."""
+    def save_raw(self, f, block_size=10000):
+        """Write vectors to file-like object f as C-order data in the
+        storage type without header, block_size rows at a time."""
 
-        f.write(self.__str__())
+        for s in self.npy_data(block_size):
+            f.write(s)
+
+    def _npy_header(self, dtype=None):
+        # .npy format header for the data written by save_raw(), or
+        # for the vectors in dtype if not None
+        return _npy_header(self.shape, self.dtype if dtype is None else dtype)
+
+    @property
+    def npy_dtype(self):
+        """Type of the values in NumPy format data (see npy_data())."""
+
+        return self.dtype
+
+    def npy_data(self, block_size=WRITE_BLOCK_ROWS):
+        """Yield the vectors as C-order data of type npy_dtype without
+        header, as strings of block_size vectors."""
+
+        for i in xrange(0, len(self), block_size):
+            block = self.vectors[i:i+block_size]
+            yield numpy.ascontiguousarray(block, dtype=self.dtype).tostring()
+
+    def npy_chunks(self, block_size=WRITE_BLOCK_ROWS):
+        """Yield the vectors in NumPy format as strings: the header,
+        then block_size vectors at a time."""
+
+        yield self._npy_header(self.npy_dtype)
+        for s in self.npy_data(block_size):
+            yield s
+
+    def npy_size(self):
+        """Return the number of bytes in the NumPy format data yielded
+        by npy_chunks()."""
+
+        return _npy_size(self.shape, self.npy_dtype)
+
+    def save_tsv(self, f, block_size=WRITE_BLOCK_ROWS):
+        """Save as TSV to file-like object f, block_size vectors at a
+        time."""
+
+        write_text_blocks(f, self.blocks(block_size), '\t', newline=False)
 
     def savef(self, f, format):
         """Save in format to file-like object f."""
@@ -727,7 +1650,8 @@ class Vectors(object):
         if format == TSV_FORMAT:
             return self.save_tsv(f)
         elif format == NUMPY_FORMAT:
-            return numpy.save(f, self.vectors)
+            for s in self.npy_chunks():
+                f.write(s)
         else:
             raise NotImplementedError(format)
 
@@ -758,70 +1682,124 @@ class Vectors(object):
         return self.__str__()
 
     def __str__(self):
-        return '\n'.join('\t'.join(str(i) for i in r) for r in self.to_rows())
+        s = StringIO()
+        self.save_tsv(s)
+        return s.getvalue()
 
     def __iter__(self):
         return iter(self.vectors)
 
+    def __len__(self):
+        return len(self.vectors)
+
     @classmethod
     def from_rows(cls, rows):
         return cls(rows)
 
     @classmethod
-    def load_tsv(cls, f, max_rank=None):
-        """Return Vectors from file-like object f in TSV.
+    def allocate(cls, shape):
+        """Return uninitialized vectors of given shape, to be filled
+        in with set_block()."""
 
-        If max_rank is not None, only load max_rank first vectors."""
+        return cls(numpy.empty(shape, dtype=cls.dtype))
 
-        rows = []
-        for i, l in enumerate(f):
-            if max_rank is not None and i >= max_rank:
-                break
-            #row = [float(i) for i in l.rstrip('\n').split()]
-            row = numpy.fromstring(l, sep='\t')
-            rows.append(row)
-            if (i+1) % 10000 == 0:
-                logging.debug('read %d TSV rows' % (i+1))
-        return cls.from_rows(rows)
+    def set_block(self, start, block):
+        """Set vectors from rank start on to the rows of matrix block,
+        converting them to the storage type."""
+
+        self.vectors[start:start+len(block)] = block
 
     @classmethod
-    def load_numpy(cls, f, max_rank=None):
-        """Return Vectors from file-like object f in NumPy format.
+    def from_blocks(cls, blocks, dim=0):
+        """Return vectors from an iterable of matrices holding
+        consecutive vectors, converting each to the storage type as it
+        is read.
 
-        If max_rank is not None, only load max_rank first vectors."""
+        If there are no blocks, return dim-dimensional empty vectors.
+        """
 
-        # NOTE: the bit below would be better but doesn't work, as mmap 
-        # cannot use existing file handles.
-        # if max_rank is not None:
-        #     return cls(numpy.array(numpy.load(f, mmap_mode='r')[:max_rank]))
-
-        #We'll need to hack into the npy format to make this happen
-        # https://github.com/numpy/numpy/blob/master/doc/neps/npy-format.txt
-        if max_rank is not None and with_numarray:
-            magic_string=f.read(6)
-            if magic_string!='\x93NUMPY':
-                raise ValueError('The input does not seem to be an NPY file (magic string does not match).')
-            major_ver,minor_ver,header_len=struct.unpack("<BBH",f.read(1+1+2))
-            #TODO: check format versions?
-            format_dict_str=f.read(header_len).strip() #Dictionary string repr. with the array format
-            format_dict=ast.literal_eval(format_dict_str) #this should be reasonably safe
-            rows,cols=format_dict['shape'] #Shape of the array as stored in the file
-            new_shape=(min(rows,max_rank),cols) #Clipped shape of the array
-            array=numpy.numarray.fromfile(f,format_dict['descr'],new_shape[0]*new_shape[1])
-            array=array.reshape(new_shape)
-            v=cls(array)
-        else:
-            if max_rank is not None:
-                # numpy.numarray is gone in numpy 1.9, the hack used
-                # for partial load will no longer work
-                logging.warning('no numpy.numarray, -r disabled for numpy data')
-                # TODO: reshape anyway
-            v = cls(numpy.load(f))
-        return v
+        converted = [numpy.asarray(b, dtype=cls.dtype) for b in blocks]
+        if not converted:
+            return cls(numpy.empty((0, dim), dtype=cls.dtype))
+        return cls(numpy.concatenate(converted))
 
     @classmethod
-    def loadf(cls, f, format, max_rank=None):
-        """Return Vectors from file-like object f in format.
+    def from_vectors(cls, vectors, block_size=10000):
+        """Return vectors converted from other Vectors, block_size
+        vectors at a time."""
+
+        converted = cls.allocate(vectors.shape)
+        for i, b in izip(xrange(0, len(vectors), block_size),
+                         vectors.blocks(block_size)):
+            converted.set_block(i, b)
+        converted._normalized = vectors._normalized
+        return converted
+
+    @classmethod
+    def load_tsv(cls, f, max_rank=None):
+        """Return Vectors from file-like object f in TSV.
+
+        If max_rank is not None, only load max_rank first vectors."""
+
+        return cls.from_blocks(v for _, v in read_text_blocks(
+                f, max_rank, word_sep=None, label='TSV'))
+
+    @classmethod
+    def load_numpy(cls, f, max_rank=None, block_size=10000):
+        """Return Vectors from file-like object f in NumPy format.
+
+        If max_rank is not None, only load max_rank first vectors.
+        Vectors are read and converted to the storage type block_size
+        at a time."""
+
+        shape, blocks = cls.read_numpy_blocks(f, max_rank, block_size)
+        if len(shape) != 2:
+            return cls.from_blocks(blocks)
+        vectors = cls.allocate(shape)
+        i = 0
+        for b in blocks:
+            vectors.set_block(i, b)
+            i += len(b)
+        return vectors
+
+    @staticmethod
+    def read_numpy_blocks(f, max_rank=None, block_size=10000):
+        """Read NumPy format header from file-like object f, return
+        (shape, blocks), where shape is that of the vectors to read and
+        blocks iterates over matrices of up to block_size consecutive
+        vectors read from f.
+
+        If max_rank is not None, only read max_rank first vectors.
+        """
+
+        # NOTE: mmap cannot use existing file handles (e.g. tar
+        # members), so read the header and then only the first max_rank
+        # rows, see https://github.com/numpy/numpy/blob/master/doc/neps/npy-format.txt
+        version = numpy.lib.format.read_magic(f)
+        if version == (1, 0):
+            read_header = numpy.lib.format.read_array_header_1_0
+        else:
+            read_header = numpy.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_header(f)
+        if fortran_order or len(shape) != 2:
+            array = numpy.frombuffer(f.read(), dtype)
+            array = array.reshape(shape, order='F' if fortran_order else 'C')
+            array = array[:max_rank]
+            return array.shape, iter([array])
+        rows = shape[0] if max_rank is None else min(shape[0], max_rank)
+        rowsize = shape[1] * dtype.itemsize
+        def blocks():
+            for i in xrange(0, rows, block_size):
+                count = min(block_size, rows - i)
+                data = f.read(count * rowsize)
+                if len(data) != count * rowsize:
+                    raise FormatError('preliminary end of file')
+                yield numpy.frombuffer(data, dtype).reshape((count, shape[1]))
+        return (rows, shape[1]), blocks()
+
+    @classmethod
+    def loadf(cls, f, format, max_rank=None):
+        """Return Vectors from file-like object f in format.
 
         If max_rank is not None, only load max_rank first vectors."""
 
@@ -858,6 +1836,333 @@ class Vectors(object):
         else:
             raise ValueError('Unknown format %s' % format)
 
+class OneHotVectors(Vectors):
+    """One-hot vectors stored as the index of the single 1 in each row.
+
+    The vectors attribute is a scipy.sparse CSR matrix built on
+    access; dense rows are only created for individual vectors.
+    """
+
+    def __init__(self, ids, dim=None):
+        """Initialize with the indices ids of the nonzero values and
+        vector dimension dim (max(ids)+1 if None)."""
+
+        self.ids = numpy.asarray(ids, dtype=numpy.int64)
+        if dim is None:
+            dim = int(self.ids.max()) + 1 if len(self.ids) else 0
+        self.dim = dim
+        self._normalized = True    # one-hot vectors have unit length
+
+    lazy_rows = True
+
+    @property
+    def shape(self):
+        return (len(self.ids), self.dim)
+
+    @property
+    def nbytes(self):
+        return self.ids.nbytes
+
+    @property
+    def vectors(self):
+        import scipy.sparse
+        count = len(self.ids)
+        return scipy.sparse.csr_matrix((numpy.ones(count, dtype=self.dtype),
+                                        self.ids, numpy.arange(count+1)),
+                                       shape=(count, self.dim))
+
+    def normalize(self):
+        return self
+
+    def shrink(self, s):
+        """Discard vectors other than the first s."""
+
+        self.ids = self.ids[:s]
+
+    def take(self, ranks):
+        return OneHotVectors(self.ids[ranks], self.dim)
+
+    def row(self, i):
+        v = numpy.zeros(self.dim, dtype=self.dtype)
+        v[self.ids[i]] = 1
+        return v
+
+    def block(self, start, end):
+        ids = self.ids[start:end]
+        block = numpy.zeros((len(ids), self.dim), dtype=self.dtype)
+        block[numpy.arange(len(ids)), ids] = 1
+        return block
+
+    def to_rows(self):
+        return iter(self)
+
+    def npy_data(self, block_size=WRITE_BLOCK_ROWS):
+        # dense rows, without ever holding the dense matrix
+        for b in self.blocks(block_size):
+            yield b.tostring()
+
+    def __iter__(self):
+        return (self.row(i) for i in xrange(len(self.ids)))
+
+    def __len__(self):
+        return len(self.ids)
+
+class Float16Vectors(Vectors):
+    """Word vectors stored as the rows of an (N, D) float16 matrix.
+
+    Halves memory use compared to Vectors. Rows are converted to
+    float32 on access, and computations over all vectors proceed a
+    block of rows at a time.
+    """
+
+    dtype = numpy.float16
+    lazy_rows = True
+
+    def normalize(self, block_size=10000):
+        if self._normalized:
+            return self
+        if not self.vectors.flags.writeable:
+            self.vectors = numpy.array(self.vectors)
+        for i in xrange(0, len(self), block_size):
+            b = self.block(i, i+block_size)
+            b /= numpy.sqrt(numpy.einsum('ij,ij->i', b, b))[:,numpy.newaxis]
+            self.vectors[i:i+block_size] = b
+        self._normalized = True
+        return self
+
+    def row(self, i):
+        return self.vectors[i].astype(numpy.float32)
+
+    def block(self, start, end):
+        return self.vectors[start:end].astype(numpy.float32)
+
+    def __iter__(self):
+        return (r for b in self.blocks() for r in b)
+
+class Int8Vectors(Vectors):
+    """Word vectors stored as an (N, D) int8 matrix of codes with a
+    float32 scale per row, so that vector i is codes[i] * scales[i].
+
+    Reduces memory use to about a quarter of that of Vectors. Rows are
+    dequantized on access, and computations over all vectors proceed a
+    block of rows at a time. The vectors attribute is a dequantized
+    copy of all vectors.
+    """
+
+    dtype = numpy.int8
+    lazy_rows = True
+
+    def __init__(self, codes, scales):
+        self.codes = numpy.asarray(codes, dtype=self.dtype)
+        self.scales = numpy.asarray(scales, dtype=numpy.float32)
+        if self.codes.ndim != 2 or len(self.codes) != len(self.scales):
+            raise ValueError('expected (N, D) codes and N scales, got %s '
+                             'and %s' % (self.codes.shape, self.scales.shape))
+        self._normalized = False
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scales.nbytes
+
+    @property
+    def vectors(self):
+        return self.block(0, len(self))
+
+    def normalize(self, block_size=10000):
+        if self._normalized:
+            return self
+        # the length of vector i is scales[i] * |codes[i]|
+        scales = numpy.empty(len(self), dtype=numpy.float32)
+        for i in xrange(0, len(self), block_size):
+            c = self.codes[i:i+block_size].astype(numpy.float32)
+            scales[i:i+block_size] = 1 / numpy.sqrt(numpy.einsum('ij,ij->i',
+                                                                 c, c))
+        self.scales = scales
+        self._normalized = True
+        return self
+
+    def shrink(self, s):
+        """Discard vectors other than the first s."""
+
+        self.codes = self.codes[:s]
+        self.scales = self.scales[:s]
+
+    def take(self, ranks):
+        taken = Int8Vectors(self.codes[ranks], self.scales[ranks])
+        taken._normalized = self._normalized
+        return taken
+
+    @classmethod
+    def allocate(cls, shape):
+        return cls(numpy.empty(shape, dtype=cls.dtype),
+                   numpy.empty(shape[0], dtype=numpy.float32))
+
+    def set_block(self, start, block):
+        codes, scales = self._quantize(block)
+        self.codes[start:start+len(block)] = codes
+        self.scales[start:start+len(block)] = scales
+
+    @classmethod
+    def from_blocks(cls, blocks, dim=0):
+        quantized = [cls._quantize(b) for b in blocks]
+        if not quantized:
+            return cls(numpy.empty((0, dim), dtype=cls.dtype),
+                       numpy.empty(0, dtype=numpy.float32))
+        return cls(numpy.concatenate([c for c, _ in quantized]),
+                   numpy.concatenate([s for _, s in quantized]))
+
+    @staticmethod
+    def _quantize(block):
+        # return (codes, scales) for matrix block, scaling each row so
+        # that its largest absolute value maps to 127
+        block = numpy.asarray(block, dtype=numpy.float32)
+        if block.size:
+            scales = numpy.abs(block).max(axis=1) / 127
+        else:
+            scales = numpy.zeros(len(block), dtype=numpy.float32)
+        scales[scales == 0] = 1
+        codes = numpy.rint(block / scales[:,numpy.newaxis]).astype(Int8Vectors.dtype)
+        return codes, scales
+
+    def row(self, i):
+        return self.codes[i].astype(numpy.float32) * self.scales[i]
+
+    def block(self, start, end):
+        return self.codes[start:end] * self.scales[start:end,numpy.newaxis]
+
+    def to_rows(self):
+        return iter(self)
+
+    def save_raw(self, f, block_size=10000):
+        """Write codes to file-like object f as C-order int8 data
+        without header. Scales are not written."""
+
+        for i in xrange(0, len(self), block_size):
+            f.write(numpy.ascontiguousarray(self.codes[i:i+block_size]).tostring())
+
+    # the NumPy format holds the dequantized float32 vectors
+    npy_dtype = numpy.float32
+
+    def npy_data(self, block_size=WRITE_BLOCK_ROWS):
+        for b in self.blocks(block_size):
+            yield b.tostring()
+
+    def __iter__(self):
+        return (r for b in self.blocks() for r in b)
+
+    def __len__(self):
+        return len(self.codes)
+
+class UnitVectors(Vectors):
+    """Unit length view of Vectors that divides them by their norms
+    when they are accessed instead of storing normalized copies (see
+    WVData.unit())."""
+
+    lazy_rows = True
+
+    def __init__(self, vectors, norms):
+        """Initialize with Vectors vectors and float32 array of their
+        lengths norms."""
+
+        self.raw = vectors
+        self.unit_norms = norms
+        self._normalized = True
+
+    @property
+    def shape(self):
+        return self.raw.shape
+
+    @property
+    def nbytes(self):
+        return self.raw.nbytes + self.unit_norms.nbytes
+
+    @property
+    def vectors(self):
+        # full normalized copy, avoided by the other methods
+        return self.block(0, len(self))
+
+    def normalize(self):
+        return self
+
+    def shrink(self, s):
+        self.raw.shrink(s)
+        self.unit_norms = self.unit_norms[:s]
+
+    def take(self, ranks):
+        return UnitVectors(self.raw.take(ranks), self.unit_norms[ranks])
+
+    def row(self, i):
+        return self.raw.row(i) / self.unit_norms[i]
+
+    def block(self, start, end):
+        return (self.raw.block(start, end) /
+                self.unit_norms[start:end,numpy.newaxis])
+
+    def dot(self, v, block_size=10000):
+        return self.raw.dot(v, block_size) / self.unit_norms
+
+    def norms(self, block_size=10000):
+        return numpy.ones(len(self), numpy.float32)
+
+    def to_rows(self):
+        return self.vectors
+
+    def npy_data(self, block_size=WRITE_BLOCK_ROWS):
+        for b in self.blocks(block_size):
+            yield numpy.ascontiguousarray(b, dtype=self.dtype).tostring()
+
+    def __iter__(self):
+        return (r for b in self.blocks() for r in b)
+
+    def __len__(self):
+        return len(self.raw)
+
+# vector storage types by name, see WVData.astype()
+storage_types = {
+    'float32': Vectors,
+    'float16': Float16Vectors,
+    'int8': Int8Vectors,
+}
+
+def _storage_type(dtype, default=Vectors):
+    """Return the Vectors class storing vectors as dtype (see
+    storage_types), or default if dtype is None."""
+
+    if dtype is None:
+        return default
+    try:
+        return storage_types[numpy.dtype(dtype).name]
+    except (KeyError, TypeError):
+        raise ValueError('unsupported dtype %s, expected one of %s' %
+                         (dtype, ', '.join(sorted(storage_types))))
+
+class _VectorMapping(Mapping):
+    """Read-only mapping from words to vectors that looks up vectors
+    by rank on access instead of storing them."""
+
+    def __init__(self, vocab, vectors):
+        self.vocab = vocab
+        self.vectors = vectors
+
+    def __getitem__(self, w):
+        return self.vectors.row(self.vocab.rank(w))
+
+    def __contains__(self, w):
+        return w in self.vocab
+
+    def __iter__(self):
+        return self.vocab.iterwords()
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def iteritems(self):
+        return izip(self.vocab.iterwords(), iter(self.vectors))
+
 class Vocabulary(object):
     def __init__(self, word_freq):
         assert not any((j for i, j in pairwise(word_freq) if i[1] < j[1])), \
@@ -866,6 +2171,7 @@ class Vocabulary(object):
         assert len(self.word_freq) == len(word_freq), \
             'vocab has duplicates: %s' % (' '.join(duplicates(w for w, f in word_freq)))
         self._rank = None
+        self._words = None
 
     def words(self):
         return self.word_freq.keys()
@@ -875,6 +2181,38 @@ class Vocabulary(object):
             self._rank = dict(((j, i) for i, j in enumerate(self.words())))
         return self._rank[w]
 
+    def word(self, i):
+        """Return word with rank i."""
+
+        if self._words is None:
+            self._words = self.words()
+        return self._words[i]
+
+    def ranks(self, words, missing=None):
+        """Return int64 array of the ranks of given words.
+
+        If missing is None, raise KeyError for words not in the
+        vocabulary, otherwise give them rank missing.
+        """
+
+        rank = self.rank
+        if missing is None:
+            ranks = [rank(w) for w in words]
+        else:
+            ranks = []
+            for w in words:
+                try:
+                    ranks.append(rank(w))
+                except KeyError:
+                    ranks.append(missing)
+        return numpy.array(ranks, dtype=numpy.int64)
+
+    def take(self, ranks):
+        """Return new vocabulary holding the words with given ranks."""
+
+        words = self.words()
+        return Vocabulary([(words[i], self.word_freq[words[i]]) for i in ranks])
+
     def shrink(self, s):
         """Discard words other than the first s."""
 
@@ -902,6 +2240,7 @@ class Vocabulary(object):
         """Invalidate cached values."""
 
         self._rank = None
+        self._words = None
 
     def __str__(self):
         return '\n'.join('\t'.join(str(i) for i in r) for r in self.to_rows())
@@ -910,9 +2249,12 @@ class Vocabulary(object):
         return self.word_freq[key]
 
     def __setitem__(self, key, value):
+        if key not in self.word_freq:
+            self._invalidate()
         self.word_freq[key] = value
 
     def __delitem__(self, key):
+        self._invalidate()
         del self.word_freq[key]
 
     def __iter__(self):
@@ -931,11 +2273,16 @@ class Vocabulary(object):
 
         If max_rank is not None, only load max_rank most frequent words."""
 
-        rows = []
-        for i, l in enumerate(f):
+        return cls.from_rows(list(islice(cls.read_rows(f, encoding),
+                                         max_rank)))
+
+    @staticmethod
+    def read_rows(f, encoding=DEFAULT_ENCODING):
+        """Iterate over [word, frequency] rows read from file-like
+        object f in TSV format."""
+
+        for l in f:
             l=unicode(l,encoding)
-            if max_rank is not None and i >= max_rank:
-                break
             l = l.rstrip()
             row = l.split('\t')
             if len(row) != 2:
@@ -945,8 +2292,7 @@ class Vocabulary(object):
                 row[1] = int(row[1])
             except ValueError, e:
                 raise TypeError('expected int, got %s' % row[1])
-            rows.append(row)
-        return cls.from_rows(rows)
+            yield row
 
     @classmethod
     def load(cls, name, encoding=DEFAULT_ENCODING, max_rank=None):
@@ -957,6 +2303,362 @@ class Vocabulary(object):
         with codecs.open(name, 'rU', encoding=encoding) as f:
             return cls.loadf(f, max_rank=max_rank)
 
+class CompactVocabulary(Vocabulary):
+    """Vocabulary stored in flat arrays for large numbers of words.
+
+    Words are stored encoded back to back in a single string (the
+    arena) with an array of offsets into it, frequencies in an int32
+    array and ranks in an open-addressing hash table built with NumPy
+    on the first call to rank(), unless given (e.g. memory-mapped from
+    a wvlib container, see write_container_blocks()). Read-only.
+    """
+
+    # multiplier for polynomial string hash and finalizer constant
+    _HASH_BASE = 0x100000001b3
+    _HASH_MIX = 0xff51afd7ed558ccd
+    _MASK = (1 << 64) - 1
+    # identifies _hash() and the index layout in saved indices
+    INDEX_HASH = 'poly64-mix33-linear'
+
+    def __init__(self, arena, offsets, freqs, encoding=DEFAULT_ENCODING,
+                 index=None):
+        """Initialize with words given by arena[offsets[i]:offsets[i+1]]
+        and frequencies freqs.
+
+        If encoding is not None, words are returned decoded using
+        encoding, otherwise as stored.
+        If index is not None, use it as the hash table mapping words to
+        ranks (see _index_table()). The index may hold ranks beyond
+        those of the words, which are ignored, so that the index of a
+        larger vocabulary can be used for its most frequent words.
+        """
+
+        self.arena = arena
+        self.offsets = numpy.asarray(offsets, dtype=numpy.int64)
+        freqs = numpy.asarray(freqs)
+        if len(freqs) and freqs.max() > numpy.iinfo(numpy.int32).max:
+            self.freqs = freqs.astype(numpy.int64)
+        else:
+            self.freqs = freqs.astype(numpy.int32)
+        self.encoding = encoding
+        assert len(self.offsets) == len(self.freqs) + 1, \
+            'expected %d offsets, got %d' % (len(self.freqs)+1, len(offsets))
+        assert not (numpy.diff(self.freqs) > 0).any(), \
+            'words not ordered by descending frequency'
+        self._index = index
+
+    def words(self):
+        return list(self.iterwords())
+
+    def rank(self, w):
+        if self._index is None:
+            self._index = self._build_index()
+        w = self._encode(w)
+        arena, offsets, index = self.arena, self.offsets, self._index
+        count, mask = len(self.freqs), len(index) - 1
+        slot = self._hash(w) & mask
+        while True:
+            i = index[slot]
+            if i < 0:
+                raise KeyError(w)
+            if i < count and arena[offsets[i]:offsets[i+1]] == w:
+                return int(i)
+            slot = (slot + 1) & mask
+
+    def ranks(self, words, missing=None):
+        """Return int64 array of the ranks of given words, hashed and
+        probed for all words at once (see Vocabulary.ranks())."""
+
+        query = [self._encode(w) for w in words]
+        vocab = CompactVocabulary.from_words(query)
+        ranks = self._probe(vocab, numpy.arange(len(query)),
+                            vocab._hash_all())
+        if missing is not None:
+            ranks[ranks < 0] = missing
+        elif (ranks < 0).any():
+            raise KeyError(query[int(numpy.flatnonzero(ranks < 0)[0])])
+        return ranks
+
+    def word(self, i):
+        """Return word with rank i."""
+
+        w = self.arena[self.offsets[i]:self.offsets[i+1]]
+        return w if self.encoding is None else w.decode(self.encoding)
+
+    def take(self, ranks):
+        """Return new vocabulary holding the words with given ranks."""
+
+        ranks = numpy.asarray(ranks, dtype=numpy.int64)
+        starts, ends = self.offsets[ranks], self.offsets[ranks+1]
+        arena = ''.join(self.arena[i:j] for i, j in izip(starts.tolist(),
+                                                          ends.tolist()))
+        offsets = numpy.zeros(len(ranks)+1, dtype=numpy.int64)
+        numpy.cumsum(ends - starts, out=offsets[1:])
+        return CompactVocabulary(arena, offsets, self.freqs[ranks],
+                                 self.encoding)
+
+    def shrink(self, s):
+        """Discard words other than the first s.
+
+        The index is kept, ignoring the ranks of the discarded words.
+        """
+
+        self.offsets = self.offsets[:s+1]
+        self.arena = self.arena[:self.offsets[-1]]
+        self.freqs = self.freqs[:s]
+
+    def iterwords(self):
+        arena, offsets = self.arena, self.offsets.tolist()
+        words = (arena[i:j] for i, j in izip(offsets, offsets[1:]))
+        if self.encoding is None:
+            return words
+        else:
+            return (w.decode(self.encoding) for w in words)
+
+    def to_rows(self):
+        return izip(self.iterwords(), self.freqs.tolist())
+
+    def _invalidate(self):
+        """Invalidate cached values."""
+
+        self._index = None
+
+    def _encode(self, w):
+        if isinstance(w, unicode):
+            return w.encode(self.encoding or DEFAULT_ENCODING)
+        return w
+
+    def _probe(self, vocab, ranks, hashes, own_hashes=None):
+        """Return int64 array of the ranks in this vocabulary of the
+        words with given ranks and hashes in CompactVocabulary vocab, -1
+        for words not in this vocabulary.
+
+        If the hashes of the words of this vocabulary are given, words
+        are compared only where the hashes match.
+        """
+
+        if self._index is None:
+            self._index = self._build_index()
+        index = self._index
+        mask = len(index) - 1
+        slots = (hashes & numpy.uint64(mask)).astype(numpy.int64)
+        found = numpy.empty(len(ranks), dtype=numpy.int64)
+        found.fill(-1)
+        pending = numpy.arange(len(ranks))
+        count = len(self.freqs)
+        while len(pending):
+            i = index[slots[pending]].astype(numpy.int64)
+            pending, i = pending[i >= 0], i[i >= 0]
+            match = i < count
+            if own_hashes is None:
+                match[match] = self._same_words(i[match], vocab,
+                                                ranks[pending[match]])
+            else:
+                match[match] = (own_hashes[i[match]] ==
+                                hashes[pending[match]])
+            found[pending[match]] = i[match]
+            pending = pending[~match]
+            slots[pending] = (slots[pending] + 1) & mask
+        if own_hashes is not None:
+            # equal hashes, check for collisions
+            hit = numpy.flatnonzero(found >= 0)
+            same = self._same_words(found[hit], vocab, ranks[hit])
+            found[hit[~same]] = -1
+        return found
+
+    def _same_words(self, ranks, vocab, vocab_ranks):
+        """Return boolean array indicating whether the words with given
+        ranks are those with vocab_ranks in CompactVocabulary vocab."""
+
+        lengths = self.offsets[ranks+1] - self.offsets[ranks]
+        same = lengths == (vocab.offsets[vocab_ranks+1] -
+                           vocab.offsets[vocab_ranks])
+        candidates = numpy.flatnonzero(same)
+        differ = (self._word_bytes(ranks[candidates]) !=
+                  vocab._word_bytes(vocab_ranks[candidates]))
+        word = numpy.repeat(numpy.arange(len(candidates)),
+                            lengths[candidates])
+        same[candidates[word[differ]]] = False
+        return same
+
+    def _word_bytes(self, ranks):
+        """Return uint8 array of the bytes of the words with given
+        ranks, back to back."""
+
+        starts = self.offsets[ranks]
+        lengths = self.offsets[ranks+1] - starts
+        ends = numpy.cumsum(lengths)
+        positions = (numpy.arange(ends[-1] if len(ends) else 0) +
+                     numpy.repeat(starts - (ends - lengths), lengths))
+        return numpy.frombuffer(self.arena, dtype=numpy.uint8)[positions]
+
+    def _build_index(self):
+        """Return linear probing hash table mapping words to ranks."""
+
+        hashes = self._hash_all()
+        self._check_duplicates(hashes)
+        return self._index_table(hashes)
+
+    @staticmethod
+    def _index_size(count):
+        """Return number of slots in the index of count words."""
+
+        size = 8
+        while size < 2 * count:
+            size <<= 1
+        return size
+
+    @classmethod
+    def _index_table(cls, hashes):
+        """Return linear probing hash table of _index_size() int32
+        slots mapping hashes (see _hash()) to their positions, -1 in
+        empty slots."""
+
+        count = len(hashes)
+        size = cls._index_size(count)
+        index = numpy.empty(size, dtype=numpy.int32)
+        index.fill(-1)
+        slots = (hashes & numpy.uint64(size - 1)).astype(numpy.int64)
+        # taking words in order of their home slot, each goes to the
+        # first slot after both its home slot and the previous word
+        order = numpy.argsort(slots)
+        k = numpy.arange(count)
+        slots = k + numpy.maximum.accumulate(slots[order] - k)
+        # words running past the last slot wrap to the first free ones
+        wrapped = slots >= size
+        index[slots[~wrapped]] = order[~wrapped]
+        free = numpy.flatnonzero(index < 0)[:wrapped.sum()]
+        index[free] = order[wrapped]
+        return index
+
+    def _check_duplicates(self, hashes):
+        """Raise AssertionError if any word occurs more than once,
+        given the hashes of all words."""
+
+        sorted_hashes = numpy.sort(hashes)
+        if not (sorted_hashes[1:] == sorted_hashes[:-1]).any():
+            return
+        order = numpy.argsort(hashes)
+        sorted_hashes = hashes[order]
+        same = numpy.flatnonzero(sorted_hashes[1:] == sorted_hashes[:-1])
+        offsets = self.offsets
+        word = lambda i: self.arena[offsets[i]:offsets[i+1]]
+        dups = set(word(order[i]) for i in same 
+                   if word(order[i]) == word(order[i+1]))
+        assert not dups, 'vocab has duplicates: %s' % ' '.join(dups)
+
+    def _hash_all(self, block_size=1<<20):
+        """Return array of hashes of all words, see _hash()."""
+
+        data = numpy.frombuffer(self.arena, dtype=numpy.uint8)
+        offsets = self.offsets
+        lengths = numpy.diff(offsets)
+        powers = numpy.empty(max(1, lengths.max() if len(lengths) else 0), 
+                             dtype=numpy.uint64)
+        powers.fill(self._HASH_BASE)
+        powers[0] = 1
+        powers = numpy.cumprod(powers, dtype=numpy.uint64)
+        hashes = numpy.zeros(len(lengths), dtype=numpy.uint64)
+        # process blocks of words to bound the size of temporaries
+        start = 0
+        while start < len(lengths):
+            end = numpy.searchsorted(offsets, offsets[start] + block_size,
+                                     side='right') - 1
+            end = min(max(end, start + 1), len(lengths))
+            nonempty = start + numpy.flatnonzero(lengths[start:end])
+            if len(nonempty):
+                b, e = offsets[start], offsets[end]
+                starts = offsets[nonempty]
+                pos = numpy.arange(b, e) - numpy.repeat(starts, 
+                                                        lengths[nonempty])
+                terms = (data[b:e].astype(numpy.uint64) + numpy.uint64(1)) \
+                    * powers[pos]
+                hashes[nonempty] = numpy.add.reduceat(terms, starts - b)
+            start = end
+        return self._mix(hashes)
+
+    @classmethod
+    def _hash(cls, w):
+        """Return hash of encoded word w.
+
+        Polynomial hash of the bytes modulo 2**64 followed by a
+        finalizer to spread entropy to the low bits.
+        """
+
+        h, p = 0, 1
+        for c in bytearray(w):
+            h = (h + (c+1) * p) & cls._MASK
+            p = (p * cls._HASH_BASE) & cls._MASK
+        h ^= h >> 33
+        h = (h * cls._HASH_MIX) & cls._MASK
+        h ^= h >> 33
+        return h
+
+    @classmethod
+    def _mix(cls, h):
+        # vectorized finalizer of _hash()
+        shift = numpy.uint64(33)
+        h = h ^ (h >> shift)
+        h *= numpy.uint64(cls._HASH_MIX)
+        return h ^ (h >> shift)
+
+    def __getitem__(self, key):
+        return int(self.freqs[self.rank(key)])
+
+    def __setitem__(self, key, value):
+        raise TypeError('CompactVocabulary is read-only')
+
+    def __delitem__(self, key):
+        raise TypeError('CompactVocabulary is read-only')
+
+    def __iter__(self):
+        return self.iterwords()
+
+    def __len__(self):
+        return len(self.freqs)
+
+    def __contains__(self, item):
+        try:
+            self.rank(item)
+            return True
+        except KeyError:
+            return False
+
+    @classmethod
+    def from_words(cls, words, freqs=None):
+        """Return CompactVocabulary for given words and frequencies.
+
+        If freqs is None, fill in 0s."""
+
+        encoding = None
+        if any(isinstance(w, unicode) for w in words):
+            encoding = DEFAULT_ENCODING
+            words = [w.encode(encoding) if isinstance(w, unicode) else w 
+                     for w in words]
+        offsets = numpy.zeros(len(words)+1, dtype=numpy.int64)
+        numpy.cumsum([len(w) for w in words], out=offsets[1:])
+        if freqs is None:
+            freqs = numpy.zeros(len(words), dtype=numpy.int32)
+        return cls(''.join(words), offsets, freqs, encoding)
+
+    @classmethod
+    def from_rows(cls, rows):
+        rows = list(rows)
+        return cls.from_words([r[0] for r in rows], [r[1] for r in rows])
+
+    @classmethod
+    def concatenate(cls, vocabs):
+        """Return CompactVocabulary holding the words of each of
+        vocabs in turn, ranked after those of the previous ones."""
+
+        arena = ''.join(v.arena[:v.offsets[-1]] for v in vocabs)
+        offsets = [numpy.zeros(1, dtype=numpy.int64)]
+        for v in vocabs:
+            offsets.append(v.offsets[1:] + offsets[-1][-1])
+        freqs = numpy.concatenate([v.freqs for v in vocabs])
+        return cls(arena, numpy.concatenate(offsets), freqs,
+                   vocabs[0].encoding)
+
 class ConfigError(Exception):
     pass
 
@@ -1025,37 +2727,90 @@ class Config(object):
 
 class OneHotWVData(WVData):
 
+    """Word clusters (e.g. Brown or k-means) as one-hot vectors.
+
+    Only the cluster ids are stored (see OneHotVectors); similarity()
+    and nearest() are computed from the ids, and vectors() returns a
+    sparse matrix.
+    """
+
     def __init__(self, word_idx):
-        maxi = max([i for _, i in word_idx])
-        config = Config.default(len(word_idx), maxi+1)
+        vectors = OneHotVectors([i for _, i in word_idx])
+        config = Config.default(len(word_idx), vectors.dim)
         logging.warning('word2vec load: filling in 0s for word counts')
-        vocab = Vocabulary([(w, 0) for w, _ in word_idx])
-        # segfaults on todense() for very large matrices:
-        # https://github.com/scipy/scipy/issues/2179
-#         row = numpy.array(range(len(word_idx)))
-#         col = numpy.array([i for _, i in word_idx])
-#         val = numpy.ones(len(word_idx))
-#         m = scipy.sparse.coo_matrix((val,(row,col)))
-#         nv = numpy.array(m.todense())
-        nv = []
-        for _, i in word_idx:
-            nv.append(numpy.zeros(maxi+1))
-            nv[-1][i] = 1
-        vectors = Vectors(nv)
+        vocab = CompactVocabulary.from_words([w for w, _ in word_idx])
         super(OneHotWVData, self).__init__(config, vocab, vectors)
-    
+        self._normalized = True
+
+    def cluster(self, w):
+        """Return cluster id of word w."""
+
+        return int(self._vectors.ids[self.vocab.rank(w)])
+
+    def similarity(self, v1, v2):
+        """Return cosine similarity of given words or vectors.
+
+        See WVData.similarity().
+        """
+
+        if isinstance(v1, StringTypes) and isinstance(v2, StringTypes):
+            return self.word_similarity(v1, v2)
+        elif isinstance(v1, StringTypes):
+            v1, v2 = v2, v1
+        if isinstance(v2, StringTypes):
+            v1 = numpy.asarray(v1)
+            return v1[self.cluster(v2)] / numpy.linalg.norm(v1)
+        return super(OneHotWVData, self).similarity(v1, v2)
+
+    def word_similarity(self, w1, w2):
+        """Return cosine similarity of vectors for given words, i.e.
+        1 if they are in the same cluster and 0 otherwise."""
+
+        return float(self.cluster(w1) == self.cluster(w2))
+
+    def nearest(self, v, n=10, exclude=None, candidates=None):
+        """Return nearest n words and similarities for given word or vector,
+        excluding given words.
+
+        Similarities are computed for all words at once from cluster
+        ids; ties are broken by rank. See WVData.nearest().
+        """
+
+        if candidates is not None:
+            return super(OneHotWVData, self).nearest(v, n, exclude, candidates)
+        ids = self._vectors.ids
+        if isinstance(v, StringTypes):
+            sim, w = (ids == self.cluster(v)).astype(Vectors.dtype), v
+        else:
+            v = numpy.asarray(v, dtype=Vectors.dtype)
+            sim, w = (v / numpy.linalg.norm(v))[ids], None
+        if exclude is None:
+            exclude = [] if w is None else set([w])
+        order = numpy.argsort(-sim, kind='mergesort')[:n+len(exclude)]
+        words = self.vocab.take(order).words()
+        wordsim = [(w, float(sim[i])) for w, i in izip(words, order)]
+        return [(w, s) for w, s in wordsim if w not in exclude][:n]
+
     @classmethod
-    def loadf(cls, f, max_rank=None):
+    def loadf(cls, f, max_rank=None, encoding=None, dtype=None):
         """Return OneHotWVData from file-like object f in 
         word<TAB>cluster-id format.
 
         If max_rank is not None, only load max_rank most frequent words.
+        If encoding is not None, decode lines using encoding.
+        dtype is ignored, as only cluster ids are stored (see
+        OneHotVectors); it is accepted for compatibility with the
+        other loaders.
         """
         
+        if dtype is not None:
+            logging.warning('dtype not supported for cluster ids, ignoring')
         data = []
         sep = '\t'
         toint = int
         for i, l in islice(enumerate(f), max_rank):
+            if encoding is not None:
+                l = l.decode(encoding)
             l = l.rstrip('\n')
             try:
                 word, cid = l.split(sep)
@@ -1073,129 +2828,302 @@ class OneHotWVData(WVData):
         return cls(data)
 
     @classmethod
-    def load(cls, name, encoding=DEFAULT_ENCODING, max_rank=None):
+    def load(cls, name, encoding=DEFAULT_ENCODING, max_rank=None,
+             dtype=None):
         """Return OneHotWVData from pathname name in 
         word<TAB>cluster-id format.
 
         If max_rank is not None, only load max_rank most frequent words.
+        dtype is ignored (see loadf()).
         """
         
         with codecs.open(name, 'rt', encoding=encoding) as f:
-            return cls.loadf(f, max_rank=max_rank)
+            return cls.loadf(f, max_rank=max_rank, dtype=dtype)
 
 class SdvData(WVData):
-    def __init__(self, data):
-        config = Config.default(len(data), len(data[0][1]))
+    def __init__(self, words, vectors):
+        if not isinstance(vectors, Vectors):
+            vectors = Vectors(vectors)
+        config = Config.default(*vectors.shape)
         logging.warning('sdv load: filling in 0s for word counts')
-        vocab = Vocabulary([(row[0], 0) for row in data])
-        vectors = Vectors([row[1] for row in data])
+        vocab = CompactVocabulary.from_words(words)
         super(SdvData, self).__init__(config, vocab, vectors)
-        self.sdvdata = data
 
     @classmethod
-    def load(cls, name, encoding=DEFAULT_ENCODING, max_rank=None):
+    def load(cls, name, encoding=DEFAULT_ENCODING, max_rank=None,
+             vocabulary=None, dtype=None):
         """Return SdvData from pathname name in the space-delimited
         values format.
 
         If max_rank is not None, only load max_rank first words.
+        If vocabulary is not None, only load words in vocabulary.
+        If dtype is not None, store vectors as dtype.
         """
-        with codecs.open(name, 'rU', encoding=encoding) as f:
-            return cls.loadf(f, max_rank)
+        with open(name, 'rb') as f:
+            return cls.loadf(f, max_rank, encoding=encoding,
+                             vocabulary=vocabulary, dtype=dtype)
 
     @classmethod
-    def loadf(cls, f, max_rank=None):
-        rows, dim = [], None
-        for i, l in enumerate(f):
-            if max_rank is not None and i >= max_rank:
-                break
-            fields = l.rstrip(' \n').split()
-            try:
-                v = numpy.array([float(f) for f in fields[1:]])
-            except ValueError:
-                raise FormatError('expected word and floats, got "%s"' % l)
-            if dim is None:
-                dim = len(v)
-            elif len(v) != dim:
-                raise FormatError('expected %d values, got %s' % (dim, len(v)))
-            rows.append((fields[0], v))
-            if (i+1) % 10000 == 0:
-                logging.debug('read %d SDV rows' % (i+1))
-        return cls(rows)
+    def loadf(cls, f, max_rank=None, encoding=None, vocabulary=None,
+              dtype=None):
+        """Return SdvData from file-like object f in the space-delimited
+        values format.
+
+        If max_rank is not None, only load max_rank first words.
+        If encoding is not None, decode words using encoding.
+        If vocabulary is not None, only load words in vocabulary,
+        keeping their ranks (see WVData.select()).
+        If dtype is not None, store vectors as dtype (see
+        storage_types), converting each block of vectors as it is read.
+        """
+
+        if vocabulary is not None:
+            vocabulary = _encoded_set(vocabulary, encoding or DEFAULT_ENCODING)
+        words, vectors, ranks = _collect_blocks(read_text_blocks(
+                f, max_rank, word_sep='', encoding=encoding, label='SDV',
+                vocabulary=vocabulary), _storage_type(dtype))
+        if vocabulary is not None:
+            return cls(words, vectors)._with_ranks(ranks)
+        elif not words:
+            raise FormatError('no vectors')
+        return cls(words, vectors)
 
 class Word2VecData(WVData):
 
-    def __init__(self, data):
-        config = Config.default(len(data), len(data[0][1]))
+    def __init__(self, words, vectors):
+        if not isinstance(vectors, Vectors):
+            vectors = Vectors(vectors)
+        config = Config.default(*vectors.shape)
         logging.warning('word2vec load: filling in 0s for word counts')
-        vocab = Vocabulary([(row[0], 0) for row in data])
-        vectors = Vectors([row[1] for row in data])
+        vocab = CompactVocabulary.from_words(words)
         super(Word2VecData, self).__init__(config, vocab, vectors)
-        self.w2vdata = data
 
     @classmethod
-    def load_textf(cls, f, max_rank=None):
+    def load_textf(cls, f, max_rank=None, encoding=None, vocabulary=None,
+                   dtype=None):
         """Return Word2VecData from file-like object f in the word2vec
         text format.
 
         If max_rank is not None, only load max_rank most frequent words.
+        If encoding is not None, decode words using encoding.
+        If vocabulary is not None, only load words in vocabulary,
+        keeping their ranks (see WVData.select()).
+        If dtype is not None, store vectors as dtype (see
+        storage_types), converting each block of vectors as it is read.
         """
 
-        return cls(cls.read(f, cls.read_text_line, max_rank=max_rank))
+        wcount, vsize = cls.read_size_line(f)
+        if max_rank is not None and wcount > max_rank:
+            wcount = max_rank
+        storage = _storage_type(dtype)
+        if vocabulary is not None:
+            vocabulary = _encoded_set(vocabulary, encoding or DEFAULT_ENCODING)
+            words, vectors, ranks = _collect_blocks(read_text_blocks(
+                    f, wcount, dim=vsize, encoding=encoding,
+                    label='word2vec text', vocabulary=vocabulary),
+                                                    storage, vsize)
+            return cls(words, vectors)._with_ranks(ranks)
+        words = []
+        vectors = storage.allocate((wcount, vsize))
+        for w, v in read_text_blocks(f, wcount, dim=vsize, encoding=encoding,
+                                     label='word2vec text'):
+            vectors.set_block(len(words), v)
+            words.extend(w)
+        if len(words) != wcount:
+            raise FormatError('expected %d words, got %d' % (wcount, len(words)))
+        return cls(words, vectors)
 
     @classmethod
-    def load_binaryf(cls, f, max_rank=None):
+    def load_binaryf(cls, f, max_rank=None, mmap=False, threads=None,
+                     vocabulary=None, dtype=None):
         """Return Word2VecData from file-like object f in the word2vec
         binary format.
 
         If max_rank is not None, only load max_rank most frequent words.
+        If vocabulary is not None, only load words in vocabulary,
+        keeping their ranks (see WVData.select()).
+        Otherwise, if mmap is True, memory-map the file (see
+        load_binary_mmapf()), and if threads is not None, copy the
+        vectors using threads parallel threads (see
+        load_binary_parallelf()).
+        If dtype is not None, store vectors as dtype (see storage_types).
         """
 
-        return cls(cls.read(f, cls.read_binary_line, max_rank=max_rank))
+        if vocabulary is not None:
+            words, vectors, ranks = cls.read_binary_blocks(
+                f, max_rank=max_rank, vocabulary=_encoded_set(vocabulary),
+                dtype=dtype)
+            return cls(words, vectors)._with_ranks(ranks)
+        elif mmap:
+            return cls.load_binary_mmapf(f, max_rank, dtype=dtype)
+        elif threads is not None:
+            return cls.load_binary_parallelf(f, max_rank, threads, dtype=dtype)
+        return cls(*cls.read_binary_blocks(f, max_rank=max_rank, dtype=dtype))
 
     @classmethod
-    def load_binary(cls, name, max_rank=None):
+    def load_binary(cls, name, max_rank=None, mmap=False, threads=None,
+                    vocabulary=None, dtype=None):
         """Return Word2VecData from pathname name in the word2vec
         binary format.
 
         If max_rank is not None, only load max_rank most frequent words.
+        If mmap is True, memory-map the file instead of reading it
+        (see load_binary_mmap(); vectors are still copied unless all
+        words have the same length).
+        If threads is not None, load in parallel using threads threads
+        (0 for one per CPU, see load_binary_parallelf()).
+        If vocabulary is not None, only load words in vocabulary.
+        If dtype is not None, store vectors as dtype.
         """
 
         with open(name, 'rb') as f:
-            return cls.load_binaryf(f, max_rank)
+            return cls.load_binaryf(f, max_rank, mmap=mmap, threads=threads,
+                                    vocabulary=vocabulary, dtype=dtype)
+
+    @classmethod
+    def load_binary_mmap(cls, name, max_rank=None, dtype=None):
+        """Return Word2VecData from pathname name in the word2vec
+        binary format, parsing only the words from a memory map of the
+        file.
+
+        Vectors are a view of the map only if they are evenly spaced
+        in the file, i.e. all words have the same length. Otherwise,
+        as in most word2vec files, they are copied from the map into
+        memory without per-row reads (see mmap_vectors()); convert to
+        the wvlib container format (.wvc) for vectors that stay
+        memory-mapped.
+        If max_rank is not None, only load max_rank most frequent words.
+        If dtype is not None, convert vectors to dtype, copying them
+        block by block from the map.
+        """
+
+        with open(name, 'rb') as f:
+            return cls.load_binary_mmapf(f, max_rank, dtype=dtype)
+
+    @classmethod
+    def load_binary_mmapf(cls, f, max_rank=None, dtype=None):
+        """Return Word2VecData from file object f in the word2vec
+        binary format, parsing only the words from a memory map of the
+        file.
+
+        See load_binary_mmap().
+        """
+
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        words, offsets, vsize = Word2VecData.index_binary(buf, max_rank)
+        vectors = Vectors(Word2VecData.mmap_vectors(buf, offsets, vsize))
+        storage = _storage_type(dtype)
+        if storage is not Vectors:
+            vectors = storage.from_vectors(vectors)
+        return cls(words, vectors)
+
+    @classmethod
+    def load_binary_parallelf(cls, f, max_rank=None, threads=0, dtype=None):
+        """Return Word2VecData from file object f in the word2vec
+        binary format, copying vectors into memory in parallel.
+
+        The file is memory-mapped and indexed for vector offsets (see
+        index_binary()), and the rows are then split into ranges that
+        threads threads (0 for one per CPU) copy into disjoint slices
+        of a single matrix. The result is identical to that of
+        load_binaryf().
+        If max_rank is not None, only load max_rank most frequent words.
+        If dtype is not None, store vectors as dtype, converting each
+        range after copying.
+        """
+
+        if not threads:
+            threads = multiprocessing.cpu_count()
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        words, offsets, vsize = Word2VecData.index_binary(buf, max_rank)
+        storage = _storage_type(dtype)
+        vectors = storage.allocate((len(offsets), vsize))
+        # several ranges per thread to balance load
+        step = max(1, -(-len(offsets) // (4 * threads)))
+        def gather(start):
+            end = start + step
+            if storage is Vectors:
+                Word2VecData.gather_vectors(buf, offsets[start:end], vsize,
+                                            vectors.vectors[start:end])
+            else:
+                vectors.set_block(start, Word2VecData.gather_vectors(
+                        buf, offsets[start:end], vsize))
+        pool = ThreadPool(threads)
+        try:
+            pool.map(gather, xrange(0, len(offsets), step))
+        finally:
+            pool.close()
+            pool.join()
+        logging.debug('copied %d word2vec rows using %d threads' %
+                      (len(offsets), threads))
+        return cls(words, vectors)
 
     @classmethod
-    def load_text(cls, name, encoding=DEFAULT_ENCODING, max_rank=None):
+    def load_text(cls, name, encoding=DEFAULT_ENCODING, max_rank=None,
+                  vocabulary=None, dtype=None):
         """Return Word2VecData from pathname name in the word2vec text
         format.
 
         If max_rank is not None, only load max_rank most frequent words.
+        If vocabulary is not None, only load words in vocabulary.
+        If dtype is not None, store vectors as dtype.
         """
 
-        with codecs.open(name, 'rU', encoding=encoding) as f:
-            return cls.load_textf(f, max_rank)
+        with open(name, 'rb') as f:
+            return cls.load_textf(f, max_rank, encoding=encoding,
+                                  vocabulary=vocabulary, dtype=dtype)
     
     @classmethod
-    def load(cls, name, binary=None, encoding=DEFAULT_ENCODING, max_rank=None):
+    def load(cls, name, binary=None, encoding=DEFAULT_ENCODING, max_rank=None,
+             mmap=False, threads=None, vocabulary=None, dtype=None):
         """Return Word2VecData from pathname name in the word2vec
         binary or text format.
 
         If binary is None, determine format heuristically.
         If max_rank is not None, only load max_rank most frequent words.
+        If mmap is True, memory-map binary format data.
+        If threads is not None, load binary format data in parallel.
+        If vocabulary is not None, only load words in vocabulary.
+        If dtype is not None, store vectors as dtype.
+        """
+
+        with open(name, 'rb') as f:
+            return cls.loadf(f, binary, encoding, max_rank=max_rank, mmap=mmap,
+                             threads=threads, vocabulary=vocabulary,
+                             dtype=dtype)
+
+    @classmethod
+    def loadf(cls, f, binary=None, encoding=DEFAULT_ENCODING, max_rank=None,
+              mmap=False, threads=None, vocabulary=None, dtype=None):
+        """Return Word2VecData from file object f in the word2vec
+        binary or text format.
+
+        See load().
         """
 
         if binary is None:
-            binary = not cls.is_w2v_text(name, encoding)
+            binary = sniff_format(f) != WORD2VEC_TEXT
         if binary:
-            return cls.load_binary(name, max_rank=max_rank)
+            return cls.load_binaryf(f, max_rank=max_rank, mmap=mmap,
+                                    threads=threads, vocabulary=vocabulary,
+                                    dtype=dtype)
         else:
-            return cls.load_text(name, encoding, max_rank=max_rank)
+            return cls.load_textf(f, max_rank=max_rank, encoding=encoding,
+                                  vocabulary=vocabulary, dtype=dtype)
 
     @staticmethod
     def read_size_line(f):
         """Read line from file-like object f as word2vec format
         header, return (word count, vector size)."""
         
-        l = f.readline().rstrip('\n')
+        return Word2VecData.parse_size_line(f.readline())
+
+    @staticmethod
+    def parse_size_line(l):
+        """Parse line l as word2vec format header, return (word count,
+        vector size)."""
+
+        l = l.rstrip('\n')
         try:
             wcount, vsize = l.split()
             return int(wcount), int(vsize)
@@ -1203,89 +3131,206 @@ class Word2VecData(WVData):
             raise FormatError('expected two ints, got "%s"' % l)
 
     @staticmethod
-    def read_text_line(f, vsize):
-        """Read line from file-like object f as word2vec text format
-        and word vector, return (word, vector)."""
+    def read_binary_blocks(f, max_rank=None, block_size=TEXT_BLOCK_SIZE,
+                           vocabulary=None, dtype=None):
+        """Read word2vec binary format data from file-like object f
+        in blocks of block_size bytes.
 
-        l = f.readline().rstrip(' \n')
-        fields = l.split(' ')
-        try:
-            return fields[0], numpy.array([float(f) for f in fields[1:]])
-        except ValueError:
-            raise FormatError('expected word and floats, got "%s"' % l)
+        Return (words, vectors), where vectors is an instance of the
+        storage type for dtype (see storage_types).
+        If max_rank is not None, only load max_rank most frequent words.
+        If vocabulary is not None, only load words in the set
+        vocabulary and return (words, vectors, ranks), where ranks
+        gives the ranks of the words in the file.
+        """
+
+        wcount, vsize = Word2VecData.read_size_line(f)
+        if max_rank is not None and wcount > max_rank:
+            wcount = max_rank
+        rowsize = vsize * numpy.dtype(numpy.float32).itemsize
+        storage = _storage_type(dtype)
+        words, ranks = [], []
+        if vocabulary is None:
+            out = storage.allocate((wcount, vsize))
+        if vocabulary is None and storage is Vectors:
+            vectors = out.vectors
+        else:
+            # raw rows, converted in blocks of rows_per_block
+            vectors = []
+        rows_per_block = 10000
+        def rows_to_array(rows):
+            return numpy.frombuffer(''.join(rows),
+                                    numpy.float32).reshape((-1, vsize))
+        rows = Word2VecData.iter_binary_rows(f, wcount, vsize, block_size)
+        for i, (word, buf, start) in enumerate(rows):
+            if vocabulary is None and storage is Vectors:
+                words.append(word)
+                vectors[i] = numpy.frombuffer(buf, numpy.float32, vsize, start)
+            elif vocabulary is None:
+                words.append(word)
+                vectors.append(buf[start:start+rowsize])
+                if len(vectors) == rows_per_block:
+                    out.set_block(i+1-len(vectors), rows_to_array(vectors))
+                    vectors = []
+            elif word in vocabulary:
+                words.append(word)
+                vectors.append(buf[start:start+rowsize])
+                ranks.append(i)
+        if vocabulary is None:
+            if storage is not Vectors and vectors:
+                out.set_block(wcount-len(vectors), rows_to_array(vectors))
+            return words, out
+        blocks = [rows_to_array(vectors)] if vectors else []
+        return words, storage.from_blocks(blocks, vsize), ranks
 
     @staticmethod
-    def read_word(f):
-        """Read and return word from file-like object f."""
+    def iter_binary_rows(f, wcount, vsize, block_size=TEXT_BLOCK_SIZE):
+        """Iterate over the wcount rows of word2vec binary format data
+        following the size line in file-like object f, reading blocks of
+        block_size bytes.
 
-        # too terse (http://docs.python.org/2/library/functions.html#iter)
-#         return = ''.join(iter(lambda: f.read(1), ' '))
+        Yields (word, buf, start) for each row, where the vsize float32
+        values of the vector start at offset start of string buf.
+        """
 
-        wchars = []
-        while True:
-            c = f.read(1)
-            if c == ' ':
-                break
-            if not c:
-                raise FormatError("preliminary end of file")
-            wchars.append(c)
-        return ''.join(wchars)
+        rowsize = vsize * numpy.dtype(numpy.float32).itemsize
+        buf, pos = '', 0
+        for i in xrange(wcount):
+            end = buf.find(' ', pos)
+            while end < 0 or end + 1 + rowsize > len(buf):
+                data = f.read(block_size)
+                if not data:
+                    raise FormatError('preliminary end of file')
+                buf, pos = buf[pos:] + data, 0
+                end = buf.find(' ')
+            # terminal newlines are present in word2vec.c output but all
+            # versions of released word2vec binary format data, e.g. the
+            # GoogleNews-vectors-negative300.bin.gz file available from
+            # https://code.google.com/p/word2vec/ . To address the issue,
+            # allow newline as the initial character of words and remove
+            # it if present.
+            if buf[pos] == '\n':
+                pos += 1
+            yield buf[pos:end], buf, end+1
+            pos = end + 1 + rowsize
+            if (i+1) % 100000 == 0:
+                logging.debug('read %d word2vec rows' % (i+1))
 
     @staticmethod
-    def read_binary_line(f, vsize):
-        """Read line from file-like object f as word2vec binary format
-        word and vector, return (word, vector)."""
-
-        # terminal newlines are present in word2vec.c output but all
-        # versions of released word2vec binary format data, e.g. the
-        # GoogleNews-vectors-negative300.bin.gz file available from
-        # https://code.google.com/p/word2vec/ . To address the issue,
-        # allow newline as the initial character of words and remove
-        # it if present.
-        word = Word2VecData.read_word(f)
-        if word.startswith('\n'):
-            word = word[1:]
-        vector = numpy.fromfile(f, numpy.float32, vsize)
-        return word, vector
+    def iter_binary_blocks(f, wcount, vsize, rows=WRITE_BLOCK_ROWS):
+        """Iterate over the wcount rows of word2vec binary format data
+        following the size line in file-like object f, yielding
+        (words, vectors) for consecutive blocks of up to rows rows,
+        where vectors is a float32 matrix."""
+
+        rowsize = vsize * numpy.dtype(numpy.float32).itemsize
+        words, data = [], []
+        for word, buf, start in Word2VecData.iter_binary_rows(f, wcount, vsize):
+            words.append(word)
+            data.append(buf[start:start+rowsize])
+            if len(words) == rows:
+                yield words, numpy.frombuffer(''.join(data), numpy.float32).\
+                    reshape((-1, vsize))
+                words, data = [], []
+        if words:
+            yield words, numpy.frombuffer(''.join(data), numpy.float32).\
+                reshape((-1, vsize))
 
     @staticmethod
-    def read(f, read_line=read_binary_line, max_rank=None):
-        """Read word2vec data from file-like object f using function
-        read_line to parse individual lines. 
+    def index_binary(buf, max_rank=None):
+        """Scan word2vec binary format data in buffer buf for word
+        boundaries.
 
-        Return list of (word, vector) pairs.
-        If max_rank is not None, only load max_rank most frequent words.
+        Return (words, offsets, vector size), where offsets is an array
+        giving the position of each vector in buf.
+        If max_rank is not None, only index max_rank most frequent words.
         """
-        
-        wcount, vsize = Word2VecData.read_size_line(f)
-        rows = []
+
+        end = buf.find('\n')
+        if end < 0:
+            raise FormatError('missing header line')
+        wcount, vsize = Word2VecData.parse_size_line(buf[:end])
         if max_rank is not None and wcount > max_rank:
             wcount = max_rank
-        for i in range(wcount):
-            rows.append(read_line(f, vsize))
-        if len(rows) != wcount:
-            raise FormatError('expected %d words, got %d' % (wcount, len(rows)))
-        return rows
+        rowsize = vsize * numpy.dtype(numpy.float32).itemsize
+        words, offsets = [], numpy.empty(wcount, dtype=numpy.int64)
+        pos, size = end + 1, len(buf)
+        for i in xrange(wcount):
+            end = buf.find(' ', pos)
+            if end < 0 or end + 1 + rowsize > size:
+                raise FormatError('preliminary end of file')
+            # see iter_binary_rows() regarding newlines
+            if buf[pos] == '\n':
+                pos += 1
+            words.append(buf[pos:end])
+            offsets[i] = end + 1
+            pos = end + 1 + rowsize
+            if (i+1) % 100000 == 0:
+                logging.debug('indexed %d word2vec rows' % (i+1))
+        return words, offsets, vsize
 
     @staticmethod
-    def is_w2v_textf(f):
-        """Return True if file-like object f is in the word2vec text
-        format, False otherwise."""
+    def mmap_vectors(buf, offsets, vsize, block_size=10000):
+        """Return (len(offsets), vsize) matrix of the float32 vectors
+        at given offsets in buffer buf.
 
-        try:
-            wcount, vsize = Word2VecData.read_size_line(f)
-            w, v = Word2VecData.read_text_line(f, vsize)
-            return True
-        except FormatError:
-            return False            
+        If the offsets are evenly spaced, return a strided view into
+        buf. Otherwise, gather the vectors into a new matrix (see
+        gather_vectors()).
+        """
+
+        view = Word2VecData._strided_vectors(buf, offsets, vsize)
+        if view is not None:
+            return view
+        logging.info('copying %d vectors from memory map, words vary in '
+                     'length (convert to .wvc to keep vectors mapped)' %
+                     len(offsets))
+        return Word2VecData.gather_vectors(buf, offsets, vsize,
+                                           block_size=block_size)
 
     @staticmethod
-    def is_w2v_text(name, encoding=DEFAULT_ENCODING):
-        """Return True if pathname name is in the word2vec text
-        format, False otherwise."""
+    def _strided_vectors(buf, offsets, vsize):
+        # return strided view of vectors at offsets in buf if evenly
+        # spaced, None otherwise
+        dtype = numpy.dtype(numpy.float32)
+        if len(offsets) == 0:
+            return numpy.empty((0, vsize), dtype=dtype)
+        stride = offsets[1] - offsets[0] if len(offsets) > 1 else 0
+        if len(offsets) == 1 or (numpy.diff(offsets) == stride).all():
+            return numpy.ndarray((len(offsets), vsize), dtype, buf,
+                                 int(offsets[0]), (int(stride), dtype.itemsize))
+        return None
 
-        with codecs.open(name, 'rU', encoding=encoding) as f:
-            return Word2VecData.is_w2v_textf(f)
+    @staticmethod
+    def gather_vectors(buf, offsets, vsize, out=None, block_size=10000):
+        """Copy the float32 vectors at given offsets in buffer buf into
+        (len(offsets), vsize) matrix out, copying up to block_size rows
+        at a time. If out is None, allocate a new matrix.
+
+        Return out.
+        """
+
+        dtype = numpy.dtype(numpy.float32)
+        if out is None:
+            out = numpy.empty((len(offsets), vsize), dtype=dtype)
+        view = Word2VecData._strided_vectors(buf, offsets, vsize)
+        if view is not None:
+            out[...] = view
+            return out
+        # rows are not aligned to the item size, so index into one
+        # float view of buf per possible alignment
+        columns = numpy.arange(vsize)
+        for align in range(dtype.itemsize):
+            rows = numpy.flatnonzero(offsets % dtype.itemsize == align)
+            if not len(rows):
+                continue
+            view = numpy.frombuffer(buf, dtype, (len(buf)-align)//dtype.itemsize,
+                                    align)
+            starts = (offsets[rows] - align) // dtype.itemsize
+            for i in xrange(0, len(rows), block_size):
+                block = starts[i:i+block_size]
+                out[rows[i:i+block_size]] = view[block[:,None] + columns]
+        return out
 
 class RandomHyperplaneLSH(object):
     """Random hyperplane-based locality sensitive hash following
@@ -1381,27 +3426,89 @@ class RandomHyperplaneLSH(object):
     def item_similarity(i, h, bits):
         return hash_similarity(i[0], h, bits)
 
-def _detect_txt_format(name, encoding=DEFAULT_ENCODING):
-    """Return format based on contents of file contents."""
-    if Word2VecData.is_w2v_text(name, encoding):
-        return WORD2VEC_TEXT
+def sniff_format(f):
+    """Return format of data in file object f based on its initial
+    bytes, or None if not recognized.
+
+    If f has a peek() method, use it, otherwise restore the position
+    of f to the start of the file.
+    """
+
+    if hasattr(f, 'peek'):
+        head = f.peek(SNIFF_SIZE)
     else:
-        return SDV_FORMAT    # TODO: check, don't just assume
+        head = f.read(SNIFF_SIZE)
+        f.seek(0)
+    if head.startswith(CONTAINER_MAGIC):
+        return WVLIB_CONTAINER
+    if head[257:262] == 'ustar':
+        return WVLIB_FORMAT
+    lines = head.split('\n', 2)
+    try:
+        wcount, vsize = Word2VecData.parse_size_line(lines[0])
+    except FormatError:
+        wcount, vsize = None, None
+    if wcount is not None:
+        if len(lines) > 1 and _is_text_row(lines[1], vsize):
+            return WORD2VEC_TEXT
+        else:
+            return WORD2VEC_BIN
+    if _is_text_row(lines[0]):
+        return SDV_FORMAT
+    return None
+
+def _is_text_row(l, dim=None):
+    """Return True if l is a word followed by dim numbers (any number
+    if dim is None), False otherwise."""
+
+    fields = l.split(None, 1)
+    if len(fields) != 2:
+        return False
+    values = len(fields[1].split())
+    return (values == len(_parse_numbers(fields[1])) and
+            (dim is None or values == dim))
+
+# formats detected by sniff_format(), keyed by (path, mtime)
+_format_cache = {}
+
+def _guess_format(name, f=None):
+    """Return format of pathname name based on its extension or, if
+    the extension is ambiguous or unknown, its contents.
+
+    If f is not None, read the contents from file object f instead of
+    opening name. Formats detected from the contents are cached per
+    path and modification time. Compression is ignored: a compressed
+    file is considered to be in the format of its contents.
+    """
 
-def _guess_format(name):
+    if os.path.isfile(os.path.join(name, SEGMENT_MANIFEST)):
+        return WVLIB_SEGMENTED
+    elif os.path.isdir(name):
+        return WVLIB_FORMAT
+    base = _strip_compression_extension(name)
     # .txt could be word2vec text or space-delimited values, decide
     # based on contents
-    if name.endswith('.txt'):
-        return _detect_txt_format(name)
-    for ext, format in extension_format_map.items():
-        if name.endswith(ext):
-            return format
-    if os.path.isdir(name):
-        return WVLIB_FORMAT
-    return None
+    if not base.endswith('.txt'):
+        for ext, format in extension_format_map.items():
+            if base.endswith(ext):
+                return format
+    key = (os.path.abspath(name), os.path.getmtime(name))
+    if key not in _format_cache:
+        if f is not None:
+            format = sniff_format(f)
+        else:
+            with open(name, 'rb') as f:
+                with _open_decompressed(name, f) as d:
+                    format = sniff_format(d)
+        if format is None and base.endswith('.txt'):
+            format = SDV_FORMAT    # TODO: check, don't just assume
+        _format_cache[key] = format
+    return _format_cache[key]
 
 _load_func = {
     WVLIB_FORMAT: WVData.load,
+    WVLIB_CONTAINER: WVData.load,
+    WVLIB_SEGMENTED: WVData.load,
     SDV_FORMAT: SdvData.load,
     WORD2VEC_FORMAT: Word2VecData.load,
     WORD2VEC_TEXT: Word2VecData.load_text,
@@ -1409,28 +3516,1217 @@ _load_func = {
     CID_FORMAT: OneHotWVData.load,
 }
 
-def load(name, format_=None, max_rank=None):
+# functions loading from an open file, used for all but directories
+_loadf_func = {
+    WVLIB_FORMAT: WVData.load_tarf,
+    WVLIB_CONTAINER: WVData.load_containerf,
+    SDV_FORMAT: partial(SdvData.loadf, encoding=DEFAULT_ENCODING),
+    WORD2VEC_FORMAT: Word2VecData.loadf,
+    WORD2VEC_TEXT: partial(Word2VecData.load_textf, encoding=DEFAULT_ENCODING),
+    WORD2VEC_BIN: Word2VecData.load_binaryf,
+    CID_FORMAT: partial(OneHotWVData.loadf, encoding=DEFAULT_ENCODING),
+}
+
+# formats whose load function supports memory-mapping
+_mmap_formats = set([WORD2VEC_FORMAT, WORD2VEC_BIN, WVLIB_CONTAINER,
+                     WVLIB_SEGMENTED])
+
+# formats whose load function supports parallel loading
+_parallel_formats = set([WORD2VEC_FORMAT, WORD2VEC_BIN])
+
+# formats whose load function supports loading selected words
+_select_formats = set([WORD2VEC_FORMAT, WORD2VEC_TEXT, WORD2VEC_BIN,
+                       SDV_FORMAT])
+
+# formats whose load function supports choosing the vector storage type
+_dtype_formats = set([WVLIB_FORMAT, WVLIB_CONTAINER, WVLIB_SEGMENTED,
+                      SDV_FORMAT, WORD2VEC_FORMAT, WORD2VEC_TEXT,
+                      WORD2VEC_BIN])
+
+# formats whose load function can read from a non-seekable stream
+_stream_formats = set([WORD2VEC_FORMAT, WORD2VEC_TEXT, WORD2VEC_BIN,
+                       SDV_FORMAT, CID_FORMAT])
+
+def _compression(name, f):
+    """Return compression of the data in file object f, opened from
+    pathname name, if compressed and not a tar file, else None."""
+
+    if any(name.endswith(ext) for ext in TAR_EXTENSIONS):
+        return None    # handled by tarfile
+    head = f.read(max(len(m) for m in compression_magic_map))
+    f.seek(0)
+    for magic, compression in compression_magic_map.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+def _strip_compression_extension(name):
+    """Return name without compression extension (e.g. ".gz")."""
+
+    if any(name.endswith(ext) for ext in TAR_EXTENSIONS):
+        return name
+    for ext in compression_extension_map:
+        if name.endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+class _Uncompressed(object):
+    # context manager returning f as is, see _open_decompressed()
+    def __init__(self, f):
+        self.f = f
+    def __enter__(self):
+        return self.f
+    def __exit__(self, *args):
+        pass
+
+def _open_decompressed(name, f):
+    """Return context manager giving a file-like object for reading
+    the decompressed data in file object f, or f if not compressed."""
+
+    compression = _compression(name, f)
+    if compression is None:
+        return _Uncompressed(f)
+    elif compression == 'gzip':
+        new = partial(zlib.decompressobj, 16 + zlib.MAX_WBITS)
+    else:
+        new = bz2.BZ2Decompressor
+    return _BackgroundReader(_DecompressingReader(f, new))
+
+def load(name, format_=None, max_rank=None, mmap=None, threads=None,
+         vocabulary=None, dtype=None):
     """Load word vectors from pathname name in format.
 
     If format is None, determine format heuristically.
     If max_rank is not None, only load max_rank most frequent words.
+    If mmap is True, memory-map the vectors instead of reading them
+    where supported by format, if False, always read them. If mmap is
+    None, use the default for the format (only the wvlib container
+    format is memory-mapped by default). Word2vec binary files are
+    memory-mapped for parsing, but their vectors are copied into
+    memory unless all words have the same length; use the wvlib
+    container format to keep vectors memory-mapped.
+    If threads is not None, load using threads parallel threads (0 for
+    one per CPU) where supported by format.
+    If vocabulary is not None, only load vectors for words in
+    vocabulary, keeping their ranks (see WVData.select()). Text and
+    word2vec binary format data is filtered while reading.
+    If dtype is not None, store vectors as dtype (see storage_types),
+    converting them block by block while loading. If dtype is None,
+    vectors are stored as float32, except for wvlib container format
+    data, which keeps the type it was saved with.
+    If name is not an existing path but starts with "@", load the model
+    given by the hash or query following it from the model registry
+    (see registry.py).
     """
 
+    if not os.path.exists(name) and name.startswith(REGISTRY_PREFIX):
+        import registry
+        return registry.load(name[len(REGISTRY_PREFIX):], format_=format_,
+                             max_rank=max_rank, mmap=mmap, threads=threads,
+                             vocabulary=vocabulary, dtype=dtype)
     if not os.path.exists(name):
         raise IOError('no such file or directory: %s' % name)
+    if os.path.isdir(name):
+        return _load(name, None, format_, max_rank, mmap, threads,
+                     vocabulary, dtype)
+    # open once for both format detection and loading
+    with open(name, 'rb') as f:
+        if _compression(name, f) is None:
+            return _load(name, f, format_, max_rank, mmap, threads,
+                         vocabulary, dtype)
+        with _open_decompressed(name, f) as d:
+            if format_ is None:
+                format_ = _guess_format(name, d)
+            if format_ == WVLIB_FORMAT:
+                # compressed tar with unexpected extension
+                d.close()
+                f.seek(0)
+                return _load(name, f, format_, max_rank, mmap, threads,
+                             vocabulary, dtype)
+            if format_ not in _stream_formats:
+                raise NotImplementedError('compressed %s' % format_)
+            if mmap:
+                logging.warning('cannot mmap compressed data, reading')
+            if threads is not None:
+                logging.warning('cannot load compressed data in parallel')
+            return _load(name, d, format_, max_rank, None, None, vocabulary,
+                         dtype)
+
+def _load(name, f, format_, max_rank, mmap, threads, vocabulary, dtype):
+    # helper for load(), reads from file object f if not None
     if format_ is None:
-        format_ = _guess_format(name)
+        format_ = _guess_format(name, f)
     if format_ is None:
         raise FormatError('failed to guess format: %s' % name)
 
     logging.info('loading %s as %s' % (name, format_))
 
-    load_func = _load_func.get(format_, None)
+    if f is not None:
+        load_func = _loadf_func.get(format_, None)
+        source = f
+    else:
+        load_func = _load_func.get(format_, None)
+        source = name
 
     if load_func is None:
         raise NotImplementedError        
+
+    options = {}
+    if mmap is not None and format_ in _mmap_formats:
+        options['mmap'] = mmap
+    elif mmap:
+        logging.warning('mmap not supported for %s, reading' % format_)
+    if threads is not None and format_ in _parallel_formats:
+        options['threads'] = threads
+    elif threads is not None:
+        logging.warning('parallel load not supported for %s' % format_)
+    if vocabulary is not None and format_ in _select_formats:
+        options['vocabulary'] = vocabulary
+    if dtype is not None and format_ in _dtype_formats:
+        options['dtype'] = dtype
+    elif dtype is not None:
+        logging.warning('dtype not supported for %s, ignoring' % format_)
+    wv = load_func(source, max_rank=max_rank, **options)
+    if vocabulary is not None and 'vocabulary' not in options:
+        wv.select(vocabulary)
+    return wv
+
+def _npy_header(shape, dtype):
+    """Return NumPy format header for a C-order array of given shape
+    and dtype."""
+
+    s = StringIO()
+    numpy.lib.format.write_array_header_1_0(s, {
+        'descr': numpy.lib.format.dtype_to_descr(numpy.dtype(dtype)),
+        'fortran_order': False,
+        'shape': tuple(shape) })
+    return s.getvalue()
+
+def _npy_size(shape, dtype):
+    """Return size in bytes of a C-order array of given shape and dtype
+    in NumPy format."""
+
+    count, dim = shape
+    return (len(_npy_header(shape, dtype)) +
+            count * dim * numpy.dtype(dtype).itemsize)
+
+def _encoded_words(words, encoding=DEFAULT_ENCODING):
+    """Return iterator over words, encoding unicode words."""
+
+    return (w.encode(encoding) if isinstance(w, unicode) else w
+            for w in words)
+
+def format_text_block(block, sep, words=None):
+    """Return the rows of matrix block as lines of values separated by
+    sep, without a final newline.
+
+    If words is not None, start each line with the next word from the
+    iterable words, followed by sep. All lines are formatted in a
+    single operation (see TEXT_FLOAT_FORMAT).
+    """
+
+    count, dim = block.shape
+    line = sep.join([TEXT_FLOAT_FORMAT] * dim)
+    if words is None:
+        values = block.ravel().tolist()
+    else:
+        line = '%s' + (sep if dim else '') + line
+        values = []
+        # rows first: izip() would otherwise drop a word per block
+        for r, w in izip(block.tolist(), words):
+            values.append(w)
+            values.extend(r)
+    return '\n'.join([line] * count) % tuple(values)
+
+def write_text_blocks(f, blocks, sep, words=None, newline=True):
+    """Write matrices from the iterable blocks to file-like object f
+    as text, one line per row (see format_text_block()).
+
+    If newline is True, end each line with a newline, otherwise only
+    separate lines. Only one block is formatted at a time.
+    """
+
+    first = True
+    for block in blocks:
+        if not len(block):
+            continue
+        if not (newline or first):
+            f.write('\n')
+        f.write(format_text_block(block, sep, words))
+        if newline:
+            f.write('\n')
+        first = False
+
+def _save_in_tar(tar, name, savef):
+    # helper for write_tar_blocks(), spools output of savef to find
+    # its size
+    with tempfile.SpooledTemporaryFile(TAR_SPOOL_SIZE) as s:
+        savef(s)
+        _spooled_to_tar(tar, name, s)
+
+def _spooled_to_tar(tar, name, s):
+    # helper for write_tar_blocks(), adds contents of spooled file s
+    size = s.tell()
+    s.seek(0)
+    _stream_to_tar(tar, name, iter(lambda: s.read(1 << 20), ''), size)
+
+def _stream_to_tar(tar, name, chunks, size):
+    # helper for write_tar_blocks(), adds member of given size with data
+    # from the iterable of strings chunks
+    i = tar.tarinfo(name)
+    i.size = size
+    i.mtime = time()
+    tar.addfile(i, _ChunkReader(chunks))
+
+def _counted_blocks(blocks, count):
+    """Yield blocks of (words, frequencies, vectors) from iterable
+    blocks, raising FormatError if they do not hold count vectors."""
+
+    total = 0
+    for b in blocks:
+        total += len(b[2])
+        if total > count:
+            raise FormatError('expected %d vectors, got more' % count)
+        yield b
+    if total != count:
+        raise FormatError('expected %d vectors, got %d' % (count, total))
+
+def _peek_vectors(blocks):
+    """Return (vectors, blocks), where vectors are those of the first
+    of blocks (empty Vectors if none) and blocks an iterator over all
+    blocks."""
+
+    blocks = iter(blocks)
+    try:
+        first = next(blocks)
+    except StopIteration:
+        return Vectors(numpy.empty((0, 0), Vectors.dtype)), blocks
+    return first[2], chain([first], blocks)
+
+def _vocab_tsv(words, freqs):
+    """Return words and frequencies as lines in vocabulary TSV format."""
+
+    return ''.join('%s\t%d\n' % (w, f)
+                   for w, f in izip(_encoded_words(words), freqs))
+
+def _vector_data(vectors, format):
+    """Return vectors as data in vector format, without header."""
+
+    if format == NUMPY_FORMAT:
+        return ''.join(vectors.npy_data(max(len(vectors), 1)))
+    elif format == TSV_FORMAT:
+        return format_text_block(vectors.block(0, len(vectors)), '\t')
+    else:
+        raise NotImplementedError(format)
+
+def write_blocks(name, config, blocks, format=None):
+    """Write word vectors to pathname name in format a block at a time.
+
+    Blocks is an iterable over (words, frequencies, vectors) for
+    consecutive blocks of words, where vectors are Vectors (see
+    read_blocks() and WVData.iterblocks()). Config gives the number
+    (word_count) and dimensionality (vector_dim) of the vectors and,
+    for the wvlib format, the vector format (format). Only one block
+    is held in memory at a time.
+    If format is None, determine format heuristically.
+    """
+
+    if format is None:
+        format = WVData.guess_format(name)
+    if format == WVLIB_FORMAT:
+        format = WVData.DIR if os.path.isdir(name) else WVData.TAR
+    try:
+        write = _block_writers[format]
+    except KeyError:
+        raise NotImplementedError('writing %s' % format)
+    return write(name, config, blocks)
+
+def write_sdv_blocks(name, config, blocks):
+    """Write word vectors to pathname name in space-delimited values
+    format a block at a time (see write_blocks())."""
+
+    with open(name, 'wb') as f:
+        for words, freqs, vectors in blocks:
+            write_text_blocks(f, [vectors.block(0, len(vectors))], ' ',
+                              _encoded_words(words))
+
+def write_word2vec_binary_blocks(name, config, blocks):
+    """Write word vectors to pathname name in word2vec binary format
+    without newlines a block at a time (see write_blocks()).
+
+    The words and vectors of each block are packed into one buffer and
+    written in a single call.
+    """
+
+    with open(name, 'wb') as f:
+        f.write('%d %d\n' % (config.word_count, config.vector_dim))
+        for words, freqs, vectors in _counted_blocks(blocks,
+                                                     config.word_count):
+            block = vectors.block(0, len(vectors))
+            data = numpy.ascontiguousarray(block, numpy.float32).tostring()
+            rowsize = block.shape[1] * 4
+            parts = []
+            for j, w in izip(xrange(0, len(data), rowsize),
+                             _encoded_words(words)):
+                parts.extend((w, ' ', data[j:j+rowsize]))
+            f.write(''.join(parts))
+
+def write_tar_blocks(name, config, blocks, mode=None):
+    """Write word vectors to pathname name in wvlib tar format using
+    mode a block at a time (see write_blocks()).
+
+    If mode is None, determine mode from filename extension.
+    Vectors in NumPy format are streamed into the tar, the vocabulary
+    and vectors in other formats are added after the vectors from a
+    temporary file spooled to disk if large (see TAR_SPOOL_SIZE).
+    Compression ('w:gz', 'w:bz2') is done by a background thread.
+    """
+
+    if mode is None:
+        if name.endswith('.tgz') or name.endswith('.gz'):
+            mode = 'w:gz'
+        elif name.endswith('.bz2'):
+            mode = 'w:bz2'
+        else:
+            mode = 'w'
+
+    if mode == 'w:gz':
+        compressor = partial(zlib.compressobj, 9, zlib.DEFLATED,
+                             16 + zlib.MAX_WBITS)
+    elif mode == 'w:bz2':
+        compressor = bz2.BZ2Compressor
+    elif mode == 'w':
+        compressor = None
     else:
-        return load_func(name, max_rank=max_rank)
+        raise ValueError('unsupported mode %s' % mode)
+
+    vecformat = config.format
+    vecfile_name = VECTOR_BASE + '.' + vecformat
+    first, blocks = _peek_vectors(_counted_blocks(blocks, config.word_count))
+    vocab = tempfile.SpooledTemporaryFile(TAR_SPOOL_SIZE)
+    def vector_data():
+        # vector format data, spooling the vocabulary as a side effect
+        first = True
+        for words, freqs, vectors in blocks:
+            vocab.write(_vocab_tsv(words, freqs))
+            if vecformat == TSV_FORMAT and not first:
+                yield '\n'
+            yield _vector_data(vectors, vecformat)
+            first = False
+    def save_vectors(f):
+        for data in vector_data():
+            f.write(data)
+
+    out = open(name, 'wb')
+    if compressor is not None:
+        out = _BackgroundWriter(_CompressingWriter(out, compressor()))
+    try:
+        f = tarfile.open(fileobj=out, mode='w|')
+        try:
+            _save_in_tar(f, CONFIG_NAME, config.savef)
+            if vecformat == NUMPY_FORMAT:
+                shape = (config.word_count, config.vector_dim)
+                dtype = first.npy_dtype
+                _stream_to_tar(f, vecfile_name,
+                               chain([_npy_header(shape, dtype)],
+                                     vector_data()),
+                               _npy_size(shape, dtype))
+            else:
+                _save_in_tar(f, vecfile_name, save_vectors)
+            _spooled_to_tar(f, VOCAB_NAME, vocab)
+        finally:
+            f.close()
+    finally:
+        vocab.close()
+        out.close()
+
+def write_dir_blocks(name, config, blocks):
+    """Write word vectors to directory name in wvlib format a block at
+    a time (see write_blocks())."""
+
+    vecformat = config.format
+    vecfile_name = VECTOR_BASE + '.' + vecformat
+    first, blocks = _peek_vectors(_counted_blocks(blocks, config.word_count))
+    config.save(os.path.join(name, CONFIG_NAME))
+    with open(os.path.join(name, VOCAB_NAME), 'wb') as vocab:
+        with open(os.path.join(name, vecfile_name), 'wb') as f:
+            if vecformat == NUMPY_FORMAT:
+                f.write(_npy_header((config.word_count, config.vector_dim),
+                                    first.npy_dtype))
+            for i, (words, freqs, vectors) in enumerate(blocks):
+                if i and vecformat == TSV_FORMAT:
+                    f.write('\n')
+                vocab.write(_vocab_tsv(words, freqs))
+                f.write(_vector_data(vectors, vecformat))
+
+def write_container_blocks(name, config, blocks):
+    """Write word vectors to pathname name in wvlib container format
+    a block at a time (see write_blocks()).
+
+    The file holds a JSON header giving the offsets of the other
+    sections: the vectors as an embedded .npy array, the word offsets
+    and frequencies as int64 arrays, and the UTF-8 encoded words back
+    to back. Float16 and int8 vectors (see WVData.astype()) are stored
+    as such, the latter with their float32 scales in an additional
+    section, and the hash table mapping words to ranks (see
+    CompactVocabulary) in an int32 section, so that it need not be
+    built on load. Sections are stored in rank order and aligned to allow
+    memory-mapping (see WVData.load_container()). The header records
+    whether all vectors were normalized, so that normalizing them
+    again after loading does not copy a memory map. As the size of the
+    words is only known at the end, space for the header is reserved
+    and the header written last.
+    """
+
+    first, blocks = _peek_vectors(_counted_blocks(blocks, config.word_count))
+    storage = type(first)
+    count, dim = config.word_count, config.vector_dim
+    npy_header = _npy_header((count, dim), storage.dtype)
+    arrays = [('word_offsets', 8 * (count + 1)), ('frequencies', 8 * count)]
+    if storage is Int8Vectors:
+        arrays.append(('scales', 4 * count))
+    arrays.append(('index', 4 * CompactVocabulary._index_size(count)))
+
+    normalized = first._normalized and count > 0
+    index = True    # replaced by the index once written
+
+    def layout(vocab_size, header_size=0):
+        # return (header, sections, header_size); header size depends
+        # on the offsets it records and vice versa
+        while True:
+            # place the .npy header so that the vector data is aligned
+            pos = _align(header_size + len(npy_header), CONTAINER_ALIGN)
+            sections = { 'vectors': { 'offset': pos - len(npy_header),
+                                      'data_offset': pos,
+                                      'shape': (count, dim),
+                                      'dtype': numpy.dtype(storage.dtype).str }}
+            pos += count * dim * numpy.dtype(storage.dtype).itemsize
+            for key, size in arrays + [('vocab', vocab_size)]:
+                pos = _align(pos, CONTAINER_ALIGN)
+                sections[key] = { 'offset': pos, 'size': int(size) }
+                pos += size
+            if index is not None:
+                sections['index']['hash'] = CompactVocabulary.INDEX_HASH
+            else:
+                del sections['index']    # keep the space, see below
+            header = json.dumps({ 'config': config.to_dict(),
+                                  'word_count': count,
+                                  'normalized': normalized,
+                                  'sections': sections }, sort_keys=True)
+            prefix = CONTAINER_MAGIC + struct.pack('<II', CONTAINER_VERSION,
+                                                   len(header))
+            if len(prefix) + len(header) <= header_size:
+                return prefix + header, sections, header_size
+            header_size = _align(len(prefix) + len(header), CONTAINER_ALIGN)
+
+    # reserve space for the header with the largest plausible size
+    reserved, sections, header_size = layout(1 << 62)
+    with open(name, 'wb') as f:
+        f.write(' ' * len(reserved))
+        f.seek(sections['vectors']['offset'])
+        f.write(npy_header)
+        pos = dict((k, v['offset']) for k, v in sections.items())
+        pos['vectors'] = sections['vectors']['data_offset']
+        f.seek(pos['word_offsets'])
+        f.write(numpy.zeros(1, '<i8').tostring())
+        pos['word_offsets'] += 8
+        vocab_size, hashes = 0, []
+        for words, freqs, vectors in blocks:
+            normalized = normalized and vectors._normalized
+            if type(vectors) is not storage:
+                vectors = storage.from_vectors(vectors)
+            words = list(_encoded_words(words))
+            hashes.append(CompactVocabulary.from_words(words)._hash_all())
+            ends = numpy.cumsum([len(w) for w in words]) + vocab_size
+            for key, data in (('vectors', None),
+                              ('word_offsets', ends.astype('<i8')),
+                              ('frequencies', numpy.asarray(freqs, '<i8')),
+                              ('scales', getattr(vectors, 'scales', None)),
+                              ('vocab', ''.join(words))):
+                if key not in pos:
+                    continue
+                f.seek(pos[key])
+                if key == 'vectors':
+                    vectors.save_raw(f)
+                elif key == 'scales':
+                    f.write(data.astype('<f4').tostring())
+                elif key == 'vocab':
+                    f.write(data)
+                else:
+                    f.write(data.tostring())
+                pos[key] = f.tell()
+            vocab_size = pos['vocab'] - sections['vocab']['offset']
+        hashes = numpy.concatenate(hashes or [numpy.zeros(0, numpy.uint64)])
+        if len(numpy.unique(hashes)) == len(hashes):
+            index = CompactVocabulary._index_table(hashes)
+            f.seek(sections['index']['offset'])
+            f.write(index.astype('<i4').tostring())
+        else:
+            # duplicate words or (unlikely) hash collisions, leave the
+            # index to be built and the words checked on load
+            index = None
+        header, final, _ = layout(vocab_size, header_size)
+        assert final['vocab']['offset'] == sections['vocab']['offset']
+        f.seek(0)
+        f.write(header)
+
+def _read_manifest(name):
+    """Return manifest of segmented format directory name."""
+
+    try:
+        with open(os.path.join(name, SEGMENT_MANIFEST)) as f:
+            manifest = json.load(f)
+    except ValueError, e:
+        raise FormatError('invalid manifest in %s: %s' % (name, str(e)))
+    if manifest.get('version') != SEGMENT_VERSION:
+        raise FormatError('unsupported segmented format version %s' %
+                          manifest.get('version'))
+    return manifest
+
+def _write_manifest(name, manifest):
+    """Replace the manifest of segmented format directory name
+    atomically, so that readers see either the old or the new set of
+    segments."""
+
+    manifest['word_count'] = sum(s['word_count']
+                                 for s in manifest['segments'])
+    tmpname = os.path.join(name, SEGMENT_MANIFEST + '.tmp')
+    with open(tmpname, 'w') as f:
+        json.dump(manifest, f, sort_keys=True, indent=4,
+                  separators=(',', ': '))
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmpname, os.path.join(name, SEGMENT_MANIFEST))
+
+def _new_manifest(vector_dim):
+    return { 'version': SEGMENT_VERSION, 'vector_dim': vector_dim,
+             'word_count': 0, 'next_segment': 0, 'segments': [] }
+
+def _add_segment(name, manifest, config, blocks, replace=False):
+    """Write blocks as the next segment of segmented format directory
+    name and record it in manifest, replacing the existing segments if
+    replace is True. Return the names of the segments no longer in the
+    manifest."""
+
+    segment = SEGMENT_NAME % manifest['next_segment']
+    path = os.path.join(name, segment)
+    write_container_blocks(path, config, blocks)
+    try:
+        old = [s['name'] for s in manifest['segments']] if replace else []
+        if not replace:
+            # check that the words are new and ranked after the
+            # existing ones (see CompactVocabulary)
+            parts = [WVData.load_container(os.path.join(name, s['name']),
+                                           mmap=True).vocab
+                     for s in manifest['segments']]
+            parts.append(WVData.load_container(path, mmap=True).vocab)
+            try:
+                CompactVocabulary.concatenate(parts)._build_index()
+            except AssertionError, e:
+                raise ValueError('cannot append to %s: %s' % (name, str(e)))
+    except:
+        os.remove(path)
+        raise
+    if replace:
+        manifest['segments'] = []
+    manifest['segments'].append({ 'name': segment,
+                                  'word_count': config.word_count })
+    manifest['next_segment'] += 1
+    _write_manifest(name, manifest)
+    return old
+
+def _remove_segments(name, segments):
+    for segment in segments:
+        try:
+            os.remove(os.path.join(name, segment))
+        except OSError, e:
+            logging.warning('failed to remove %s: %s' % (segment, str(e)))
+
+def write_segmented_blocks(name, config, blocks):
+    """Write word vectors to directory name in segmented format a
+    block at a time (see write_blocks()) as a single segment, replacing
+    any existing segments.
+
+    The directory holds the segments as wvlib container format files
+    (see write_container_blocks()) and a JSON manifest listing them in
+    rank order. New segments can be added with append_segment_blocks()
+    and merged with compact_segments().
+    """
+
+    if not os.path.isdir(name):
+        os.makedirs(name)
+    if os.path.exists(os.path.join(name, SEGMENT_MANIFEST)):
+        manifest = _read_manifest(name)
+        manifest['vector_dim'] = config.vector_dim
+    else:
+        manifest = _new_manifest(config.vector_dim)
+    old = _add_segment(name, manifest, config, blocks, replace=True)
+    _remove_segments(name, old)
+
+def append_segment_blocks(name, config, blocks):
+    """Append word vectors to the model in segmented format in
+    directory name as a new segment, written a block at a time (see
+    write_blocks()). Create the model if it does not exist.
+
+    The words must not be in the model and their frequencies must not
+    exceed those of the existing words, which keep their ranks. The
+    manifest is only updated once the segment has been written and
+    checked, so that a failed append leaves the model unchanged.
+    """
+
+    if not os.path.exists(os.path.join(name, SEGMENT_MANIFEST)):
+        return write_segmented_blocks(name, config, blocks)
+    manifest = _read_manifest(name)
+    if config.vector_dim != manifest['vector_dim']:
+        raise ValueError('cannot append %d-dimensional vectors to %s with '
+                         '%d' % (config.vector_dim, name,
+                                 manifest['vector_dim']))
+    _add_segment(name, manifest, config, blocks)
+
+def compact_segments(name):
+    """Merge the segments of the model in segmented format in
+    directory name into one, a block at a time.
+
+    The merged segment is memory-mapped when loaded (see
+    WVData.load_segmented()). The old segments are removed after the
+    manifest has been replaced.
+    """
+
+    manifest = _read_manifest(name)
+    if len(manifest['segments']) < 2:
+        return
+    config, blocks = read_blocks(name, WVLIB_SEGMENTED)
+    old = _add_segment(name, manifest, config, blocks, replace=True)
+    _remove_segments(name, old)
+
+def attach(name, max_rank=None):
+    """Return read-only WVData for the model shared under name (see
+    WVData.share()), holding a reference to it for this process until
+    release(name) or exit.
+
+    The vectors are memory-mapped, so that attaching takes time
+    proportional to the size of the vocabulary only. Normalizing
+    vectors that were not normalized when shared makes a private copy.
+    If max_rank is not None, only attach max_rank most frequent words.
+    """
+
+    with _SharedLock(name) as lock:
+        path = _shared_path(name, '.wvc')
+        if not os.path.exists(path):
+            if not os.path.exists(_shared_path(name, '.refs')):
+                os.remove(lock.name)    # created by locking
+            raise IOError('no shared model %s' % name)
+        wv = WVData.load_container(path, max_rank=max_rank, mmap=True)
+        _add_shared_reference(name, 1)
+    return wv
+
+def release(name):
+    """Release a reference held by this process to the model shared
+    under name, and return the number of references remaining.
+
+    The model is removed once no references remain. References held
+    by processes that no longer exist are dropped, so that the model
+    is also removed when they exit without releasing it. Processes
+    that attached to the model can keep using it after it is removed.
+    """
+
+    with _SharedLock(name):
+        return _add_shared_reference(name, -1)
+
+# references to shared models held by this process by (pid, name),
+# released at exit (see attach())
+_shared_references = defaultdict(int)
+
+def _shared_path(name, extension):
+    if not name or os.sep in name:
+        raise ValueError('invalid shared model name: %r' % name)
+    return os.path.join(SHARED_DIR, SHARED_PREFIX + name + extension)
+
+class _SharedLock(object):
+    """Exclusive lock on a shared model and its reference counts.
+
+    The lock file is removed with the model (see
+    _add_shared_reference()). Processes that were waiting on a removed
+    lock file find that it is no longer the one at its path and lock
+    that one instead, so that they never proceed at the same time as
+    processes locking a new lock file.
+    """
+
+    def __init__(self, name):
+        if fcntl is None:
+            raise NotImplementedError('shared models require fcntl')
+        self.name = _shared_path(name, '.lock')
+
+    def __enter__(self):
+        while True:
+            self.f = open(self.name, 'a')
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+            locked = os.fstat(self.f.fileno())
+            try:
+                current = os.stat(self.name)
+                if (locked.st_dev, locked.st_ino) == (current.st_dev,
+                                                      current.st_ino):
+                    return self
+            except OSError:
+                pass    # removed while waiting
+            self.f.close()
+
+    def __exit__(self, *args):
+        self.f.close()    # releases the lock
+
+def _add_shared_reference(name, delta):
+    """Add delta to the references of this process to shared model
+    name and return the total, removing the model if none remain.
+    Call with _SharedLock(name) held."""
+
+    pid = os.getpid()
+    path = _shared_path(name, '.refs')
+    try:
+        with open(path) as f:
+            refs = json.load(f)
+    except IOError:
+        refs = {}
+    refs = dict((p, c) for p, c in refs.items() if _process_exists(int(p)))
+    count = refs.get(str(pid), 0) + delta
+    if count > 0:
+        refs[str(pid)] = count
+    else:
+        refs.pop(str(pid), None)
+    _shared_references[(pid, name)] = max(count, 0)
+    if refs:
+        tmpname = '%s.%d.tmp' % (path, pid)
+        with open(tmpname, 'w') as f:
+            json.dump(refs, f)
+        os.rename(tmpname, path)
+    else:
+        # the lock file last, see _SharedLock
+        for n in (_shared_path(name, '.wvc'), path,
+                  _shared_path(name, '.lock')):
+            if os.path.exists(n):
+                os.remove(n)
+        logging.info('removed shared model %s' % name)
+    return sum(refs.values())
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return e.errno == errno.EPERM
+    return True
+
+@atexit.register
+def _release_shared_references():
+    # release references of this process, not those inherited by fork
+    for (pid, name), count in _shared_references.items():
+        if pid != os.getpid() or not count:
+            continue
+        try:
+            with _SharedLock(name):
+                _add_shared_reference(name, -count)
+        except Exception, e:
+            logging.warning('failed to release shared model %s: %s' %
+                            (name, str(e)))
+
+def read_blocks(name, format_=None, max_rank=None):
+    """Read word vectors from pathname name in format a block at a time.
+
+    Return (config, blocks), where config gives the number (word_count)
+    and dimensionality (vector_dim) of the vectors and blocks iterates
+    over (words, frequencies, vectors) for consecutive blocks of words,
+    vectors being float32 Vectors (see write_blocks()). Only one block
+    is held in memory at a time, except for wvlib container format
+    data, which is memory-mapped, and cid format data, which is loaded
+    in full. Compressed input is decompressed while reading.
+    If format is None, determine format heuristically.
+    If max_rank is not None, only read max_rank most frequent words.
+    """
+
+    if not os.path.exists(name):
+        raise IOError('no such file or directory: %s' % name)
+    if format_ is None:
+        format_ = _guess_format(name)
+    if format_ is None:
+        raise FormatError('failed to guess format: %s' % name)
+    read = _block_readers.get(format_, _read_loaded_blocks)
+    # readers yield the config before the blocks
+    blocks = read(name, format_, max_rank)
+    return next(blocks), blocks
+
+def read_config(name, format_=None):
+    """Return Config for word vectors in pathname name in format,
+    reading only headers and metadata.
+
+    The word count (SDV) or both the word count and dimensionality
+    (cid) are None for formats that do not record them, as finding
+    them would require reading all of the data.
+    If format is None, determine format heuristically.
+    """
+
+    if not os.path.exists(name):
+        raise IOError('no such file or directory: %s' % name)
+    if format_ is None:
+        format_ = _guess_format(name)
+    if format_ is None:
+        raise FormatError('failed to guess format: %s' % name)
+    if format_ in _config_readers:
+        return _config_readers[format_](name)
+    config, blocks = read_blocks(name, format_)
+    blocks.close()
+    return config
+
+def _read_sdv_config(name):
+    # config reader for space-delimited values, see read_config()
+    with open(name, 'rb') as f:
+        with _open_decompressed(name, f) as d:
+            for l in d:
+                if l.strip():
+                    return Config.default(None, len(l.split()) - 1)
+    return Config.default(0, 0)
+
+def _read_container_config(name):
+    # config reader for the wvlib container format, see read_config()
+    with open(name, 'rb') as f:
+        header = WVData._read_container_header(f)
+    return Config.default(header['word_count'],
+                          header['sections']['vectors']['shape'][1])
+
+def _read_cid_config(name):
+    # config reader for cluster ids, see read_config()
+    return Config.default(None, None)
+
+def _read_word2vec_blocks(name, format_, max_rank):
+    # block reader for word2vec formats, see read_blocks()
+    with open(name, 'rb') as f:
+        with _open_decompressed(name, f) as d:
+            binary = (format_ == WORD2VEC_BIN or
+                      (format_ == WORD2VEC_FORMAT and
+                       sniff_format(d) != WORD2VEC_TEXT))
+            wcount, vsize = Word2VecData.read_size_line(d)
+            if max_rank is not None and wcount > max_rank:
+                wcount = max_rank
+            yield Config.default(wcount, vsize)
+            if binary:
+                blocks = Word2VecData.iter_binary_blocks(d, wcount, vsize)
+            else:
+                blocks = read_text_blocks(d, wcount, dim=vsize,
+                                          label='word2vec text')
+            for words, vectors in blocks:
+                yield words, [0] * len(words), Vectors(vectors)
+
+def _read_sdv_blocks(name, format_, max_rank):
+    # block reader for space-delimited values, see read_blocks()
+    with open(name, 'rb') as f:
+        with _open_decompressed(name, f) as d:
+            count = count_text_lines(d, max_rank)
+    with open(name, 'rb') as f:
+        with _open_decompressed(name, f) as d:
+            blocks = read_text_blocks(d, max_rank, word_sep='', label='SDV')
+            first = next(blocks, None)
+            dim = first[1].shape[1] if first is not None else 0
+            yield Config.default(count, dim)
+            if first is None:
+                return
+            for words, vectors in chain([first], blocks):
+                yield words, [0] * len(words), Vectors(vectors)
+
+def _read_wvlib_blocks(name, format_, max_rank):
+    # block reader for wvlib tar and directories, see read_blocks(),
+    # streams the vocabulary and vectors from separate handles
+    def open_member(match):
+        if os.path.isdir(name):
+            coll = _Directory.open(name)
+        else:
+            coll = tarfile.open(name, 'r|*')
+        for i in coll:
+            if i.isfile() and match(os.path.basename(i.name)):
+                return coll, i, coll.extractfile(i)
+        coll.close()
+        raise FormatError('missing %s' % match.__doc__)
+    def config_name(n):
+        """config"""
+        return n == CONFIG_NAME
+    def vocab_name(n):
+        """vocabulary"""
+        return n == VOCAB_NAME
+    def vector_name(n):
+        """vectors"""
+        return os.path.splitext(n)[0] == VECTOR_BASE
+
+    colls = []
+    try:
+        coll, _, f = open_member(config_name)
+        colls.append(coll)
+        config = Config.loadf(f)
+        coll, i, f = open_member(vector_name)
+        colls.append(coll)
+        vecformat = os.path.splitext(i.name)[1].replace('.', '')
+        if vecformat == NUMPY_FORMAT:
+            shape, vblocks = Vectors.read_numpy_blocks(f, max_rank)
+        elif vecformat == TSV_FORMAT:
+            vblocks = (v for _, v in read_text_blocks(f, max_rank,
+                                                      word_sep=None,
+                                                      label='TSV'))
+            count = config.word_count
+            if max_rank is not None:
+                count = min(count, max_rank)
+            shape = (count, config.vector_dim)
+        else:
+            raise NotImplementedError(vecformat)
+        config.word_count, config.vector_dim = shape
+        config.format = vecformat
+        yield config
+        coll, _, f = open_member(vocab_name)
+        colls.append(coll)
+        rows = Vocabulary.read_rows(f)
+        for v in vblocks:
+            vocab = list(islice(rows, len(v)))
+            if len(vocab) != len(v):
+                raise FormatError('fewer words than vectors')
+            yield [w for w, _ in vocab], [c for _, c in vocab], Vectors(v)
+    finally:
+        for coll in colls:
+            coll.close()
+
+def _read_segmented_blocks(name, format_, max_rank):
+    # block reader for the segmented format, see read_blocks(), reads
+    # the segments in turn from memory maps
+    manifest = _read_manifest(name)
+    count = manifest['word_count']
+    if max_rank is not None:
+        count = min(count, max_rank)
+    segments = []
+    for segment in manifest['segments']:
+        if sum(len(s._vectors) for s in segments) >= count:
+            break
+        segments.append(WVData.load_container(
+                os.path.join(name, segment['name']), mmap=True))
+    if not segments:
+        raise FormatError('no segments in %s' % name)
+    config = segments[0]._block_config(count)
+    yield config
+    for wv in segments:
+        for b in wv.iterblocks(max_rank=count):
+            yield b
+        count -= len(wv._vectors)
+        if count <= 0:
+            break
+
+def _read_loaded_blocks(name, format_, max_rank):
+    # block reader loading the data with load(), see read_blocks()
+    wv = load(name, format_, max_rank=max_rank)
+    yield wv._block_config()
+    for b in wv.iterblocks():
+        yield b
+
+def count_text_lines(f, max_rank=None, block_size=TEXT_BLOCK_SIZE):
+    """Return the number of lines with non-whitespace characters in
+    file-like object f, counting up to max_rank lines if not None
+    (see read_text_blocks())."""
+
+    count, rest = 0, ''
+    while max_rank is None or count < max_rank:
+        data = f.read(block_size)
+        if not data:
+            break
+        lines = (rest + data).split('\n')
+        rest = lines.pop()
+        count += sum(1 for l in lines if l and not l.isspace())
+    if rest and not rest.isspace():
+        count += 1
+    if max_rank is not None:
+        count = min(count, max_rank)
+    return count
+
+# functions writing blocks of vectors by output format, see write_blocks()
+_block_writers = {
+    WVData.TAR: write_tar_blocks,
+    WVData.DIR: write_dir_blocks,
+    WVLIB_CONTAINER: write_container_blocks,
+    WVLIB_SEGMENTED: write_segmented_blocks,
+    WORD2VEC_BIN: write_word2vec_binary_blocks,
+    SDV_FORMAT: write_sdv_blocks,
+}
+
+# functions reading blocks of vectors by input format, see read_blocks()
+# (other formats are loaded in full)
+_block_readers = {
+    WVLIB_FORMAT: _read_wvlib_blocks,
+    WVLIB_SEGMENTED: _read_segmented_blocks,
+    SDV_FORMAT: _read_sdv_blocks,
+    WORD2VEC_FORMAT: _read_word2vec_blocks,
+    WORD2VEC_TEXT: _read_word2vec_blocks,
+    WORD2VEC_BIN: _read_word2vec_blocks,
+}
+
+# functions reading the config of vectors by input format, see
+# read_config() (others read the config from read_blocks())
+_config_readers = {
+    SDV_FORMAT: _read_sdv_config,
+    WVLIB_CONTAINER: _read_container_config,
+    CID_FORMAT: _read_cid_config,
+}
+
+def read_text_blocks(f, max_rank=None, word_sep=' ', dim=None, encoding=None,
+                     label='text', block_size=TEXT_BLOCK_SIZE, vocabulary=None):
+    """Read lines of words and/or numbers from file-like object f in
+    blocks, yield (words, vectors) for each block.
+
+    Reads block_size characters at a time and converts all numbers in
+    the block in one call into a float32 matrix with one row per line.
+    If word_sep is None, lines only contain numbers and words is None.
+    Otherwise the word is split off each line at the first word_sep,
+    or at the first whitespace if word_sep is the empty string.
+    If max_rank is not None, only read max_rank first lines.
+    If dim is None, take the number of values from the first line.
+    If encoding is not None, decode words using encoding.
+    If vocabulary is not None, only parse lines whose (undecoded) word
+    is in the set vocabulary and yield (words, vectors, ranks), where
+    ranks gives the 0-based line numbers of the words.
+    """
+
+    count, rest = 0, ''
+    while max_rank is None or count < max_rank:
+        data = f.read(block_size)
+        if data:
+            data = rest + data
+            cut = data.rfind('\n')
+            if cut < 0:
+                rest = data
+                continue
+            lines, rest = data[:cut].split('\n'), data[cut+1:]
+        elif rest:
+            lines, rest = [rest], ''
+        else:
+            break
+        lines = [l for l in lines if l and not l.isspace()]
+        if max_rank is not None:
+            lines = lines[:max_rank-count]
+        if not lines:
+            continue
+        if word_sep is None:
+            words, numbers = None, lines
+        else:
+            split = [l.split(word_sep or None, 1) for l in lines]
+            if vocabulary is not None:
+                kept = [i for i, s in enumerate(split) if s[0] in vocabulary]
+                split = [split[i] for i in kept]
+            words = [s[0] for s in split]
+            if encoding is not None:
+                words = [w.decode(encoding) for w in words]
+            numbers = [s[1] if len(s) > 1 else '' for s in split]
+        if numbers:
+            if dim is None:
+                dim = len(_parse_numbers(numbers[0]))
+            vectors = _parse_numbers(' '.join(numbers))
+            if len(vectors) != len(numbers) * dim:
+                for l in numbers:
+                    if len(_parse_numbers(l)) != dim:
+                        raise FormatError('expected %d values, got "%s"' %
+                                          (dim, l))
+                raise FormatError('failed to parse %s block' % label)
+            vectors = vectors.reshape((len(numbers), dim))
+            if vocabulary is None:
+                yield words, vectors
+            else:
+                yield words, vectors, numpy.array(kept, dtype=numpy.int64)+count
+        if (count + len(lines)) // 10000 > count // 10000:
+            logging.debug('read %d %s rows' % (count + len(lines), label))
+        count += len(lines)
+
+def align_vocabularies(vocabs):
+    """Return list of int64 arrays giving the ranks in each of vocabs
+    of the words they all share, in the order of the first.
+
+    The words of the first vocabulary are hashed all at once and looked
+    up in the hash index of each of the others in turn (see
+    CompactVocabulary), keeping those found in all.
+    """
+
+    compact = [v if isinstance(v, CompactVocabulary)
+               else CompactVocabulary.from_words(v.words()) for v in vocabs]
+    first = compact[0]
+    hashes = first._hash_all()
+    ranks = [numpy.arange(len(hashes), dtype=numpy.int64)]
+    for v in compact[1:]:
+        own_hashes = v._hash_all()
+        if v._index is None:
+            v._check_duplicates(own_hashes)
+            v._index = v._index_table(own_hashes)
+        found = v._probe(first, ranks[0], hashes, own_hashes)
+        shared = found >= 0
+        hashes = hashes[shared]
+        ranks = [r[shared] for r in ranks] + [found[shared]]
+    return ranks
+
+def align(*wvs):
+    """Align WVData wvs on the words they all share.
+
+    Return (ranks, matrices), where ranks is a list of int64 arrays
+    giving the ranks (rows) of the shared words in each of wvs, in the
+    order of the first (see align_vocabularies()), and matrices a list
+    of float32 matrices holding their vectors in that order. Where the
+    shared words are the first words of a model in order, its matrix is
+    a view of its vectors, otherwise the vectors are gathered into a
+    new matrix.
+    """
+
+    ranks = align_vocabularies([wv.vocab for wv in wvs])
+    matrices = []
+    for wv, r in izip(wvs, ranks):
+        if (r == numpy.arange(len(r))).all():
+            matrices.append(wv._vectors.block(0, len(r)))
+        else:
+            matrices.append(wv._vectors.take(r).block(0, len(r)))
+    return ranks, matrices
+
+def _top_n(ranks, sims, n):
+    """Return (ranks, sims) for the n highest of similarities sims in
+    each row, ties going to lower ranks, given the corresponding ranks.
+    Rows are not sorted."""
+
+    if sims.shape[1] <= n:
+        return ranks, sims
+    kth = numpy.partition(sims, -n, axis=1)[:,-n]
+    keep = sims >= kth[:,numpy.newaxis]
+    counts = keep.sum(axis=1)
+    for i in numpy.flatnonzero(counts > n):
+        # ties for the n-th highest, drop those with the highest ranks
+        tied = numpy.flatnonzero(sims[i] == kth[i])
+        order = numpy.argsort(ranks[i, tied], kind='mergesort')
+        keep[i, tied[order[len(tied)-(counts[i]-n):]]] = False
+    return (ranks[keep].reshape(len(ranks), n),
+            sims[keep].reshape(len(sims), n))
+
+def _collect_blocks(blocks, storage=Vectors, dim=0):
+    """Return (words, vectors, ranks) combining the blocks yielded by
+    read_text_blocks(), converting vectors block by block to Vectors
+    class storage. Ranks are empty if not given in the blocks."""
+
+    words, ranks = [], []
+    def collect():
+        for block in blocks:
+            words.extend(block[0])
+            ranks.extend(block[2:])
+            yield block[1]
+    vectors = storage.from_blocks(collect(), dim)
+    if ranks:
+        ranks = numpy.concatenate(ranks)
+    else:
+        ranks = numpy.empty(0, dtype=numpy.int64)
+    return words, vectors, ranks
+
+def _encoded_set(words, encoding=DEFAULT_ENCODING):
+    """Return set of words, encoding unicode words using encoding."""
+
+    return set(w.encode(encoding) if isinstance(w, unicode) else w
+               for w in words)
+
+def _parse_numbers(s):
+    """Return float32 array of the whitespace-separated numbers in s."""
+
+    if isinstance(s, unicode):
+        s = s.encode('ascii', 'replace')
+    return numpy.fromstring(s, dtype=Vectors.dtype, sep=' ')
 
 ### misc. helper functions
 
@@ -1441,6 +4737,11 @@ def pairwise(iterable):
     next(b, None)
     return izip(a, b)
 
+def _align(pos, alignment):
+    """Return smallest multiple of alignment >= pos."""
+
+    return -(-pos // alignment) * alignment
+
 def duplicates(iterable):
     seen, dups = set(), set()
     for i in iterable: